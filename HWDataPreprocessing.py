@@ -1,15 +1,31 @@
 import os
-import io
+import re
+import fnmatch
 import logging
-from azure.storage.blob import BlobServiceClient, BlobClient, ContainerClient
-from src.data_processor.data_loader import DataLoader
+from datetime import datetime
+from functools import partial
+from itertools import chain
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from src.data_processor.data_loader import DataLoader, WARRANTY_COLUMNS, WARRANTY_COLUMN_OPTIONS
+from src.data_processor.aggregate_state import AssetAggregateState
+from src.data_processor.asset_index import AssetIndex
+from src.data_processor.sql_backend import SqlScoringBackend
 from src.data_analysis.usage_scorer import UsageScorer
 from src.data_processor.data_processor import DataProcessor
 from src.metrics import MetricsCalculator, RiskCategorizer
-from src.utils.report_generator import CSVProcessor 
+from src.utils.storage import create_storage_backend
+from src.utils.download_cache import DownloadCache
+from src.utils.stage_graph import StageGraph
+from src.utils.artifacts import (
+    ARTIFACT_FORMAT, ARTIFACT_COMPRESSION, artifact_blob_name, upload_dataframe,
+    validate_artifact_format, validate_artifact_compression
+)
 from src.data_analysis.vulnerability_scorer import VulnerabilityScorer
 from src.data_analysis.incident_scorer import IncidentScoring      
 from src.data_analysis.maintenance_scorer import MaintenanceAnalyzer
+from src.data_analysis.sharded_scoring import ShardedScorer
+from src.data_analysis.summary_cube import SUMMARY_CUBE_BLOB, SummaryCube
 from dotenv import load_dotenv
 
 # Load environment variables from the .env file
@@ -19,172 +35,508 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-# Initialize Azure Blob storage clients
+# Storage the inputs are read from and the scores written to: 'azure' (default) or 'local'
+STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'azure').lower()
 AZURE_STORAGE_CONNECTION_STRING = os.getenv('AZURE_STORAGE_CONNECTION_STRING')
 BLOB_CONTAINER_NAME = os.getenv('BLOB_CONTAINER_NAME')
+LOCAL_STORAGE_DIR = os.getenv('LOCAL_STORAGE_DIR', 'blob_storage')
+
+# Transfer tuning: blobs fetched at once, ranged connections per blob and background uploads
+MAX_CONCURRENT_DOWNLOADS = int(os.getenv('MAX_CONCURRENT_DOWNLOADS', '6'))
+MAX_CONNECTIONS_PER_DOWNLOAD = int(os.getenv('MAX_CONNECTIONS_PER_DOWNLOAD', '4'))
+MAX_CONCURRENT_UPLOADS = int(os.getenv('MAX_CONCURRENT_UPLOADS', '5'))
+
+# Local cache of unchanged input blobs; a size of 0 disables it
+DOWNLOAD_CACHE_DIR = os.getenv('DOWNLOAD_CACHE_DIR', '.download_cache')
+DOWNLOAD_CACHE_MAX_BYTES = int(os.getenv('DOWNLOAD_CACHE_MAX_BYTES', str(20 * 1024 ** 3)))
+
+# Rows per chunk when streaming usage telemetry that does not fit in memory; 0 loads it whole
+USAGE_CHUNK_SIZE = int(os.getenv('USAGE_CHUNK_SIZE', '0'))
+
+# Blob holding the per-asset aggregate state of incremental runs. When set, partitioned inputs are
+# folded in only once, past each dataset's watermark; when empty every run scores the full inputs.
+AGGREGATE_STATE_BLOB = os.getenv('AGGREGATE_STATE_BLOB', '')
+
+# Compute stages (loads, scorers and the merge steps) run at once by the stage graph
+MAX_CONCURRENT_STAGES = int(os.getenv('MAX_CONCURRENT_STAGES', '4'))
+
+# Worker processes the scorers shard their inputs across by asset; 1 scores in this process
+SCORING_WORKERS = int(os.getenv('SCORING_WORKERS', '1'))
+
+# Engine of the per-asset aggregations and the merge: 'pandas' (default) works on loaded frames,
+# 'sql' queries the downloaded files in an embedded DuckDB database, which spills to
+# SQL_TEMP_DIRECTORY past SQL_MEMORY_LIMIT (e.g. '2GB'; empty keeps DuckDB's default)
+SCORING_BACKEND = os.getenv('SCORING_BACKEND', 'pandas').lower()
+SCORING_BACKENDS = ['pandas', 'sql']
+SQL_MEMORY_LIMIT = os.getenv('SQL_MEMORY_LIMIT', '')
+SQL_TEMP_DIRECTORY = os.getenv('SQL_TEMP_DIRECTORY', '.sql_spill')
+
+# How assets are put into risk categories: 'zscore' (default) by the z-score of their composite
+# stability score, 'quantile' by where that score falls among the fleet's (RiskCategorizer.RISK_QUANTILES)
+RISK_CATEGORIZATION_MODE = os.getenv('RISK_CATEGORIZATION_MODE', 'zscore').lower()
+
+# Weights of the composite stability score and the incident label mappings used by the scorers
+WEIGHTS_COMPOSITE_STABILITY_SCORE = {
+    'overall_usage_score': 0.2,
+    'overall_incident_score': 0.5,
+    'maintenance_score': 0.3,
+    'vulnerability_score':0.5
+}
+
+SEVERITY_MAPPING = {
+        '1 - high': 10, 'high': 10,
+        '2 - medium': 4, 'medium': 4,
+        '3 - low': 0.5, 'low': 0.5
+}
+IMPACT_MAPPING = {
+        '1 - high': 10, 'high': 10,
+        '2 - medium': 4, 'medium': 4,
+        '3 - low': 0.5, 'low': 0.5
+}
+
+U_EVENT_SEVERITY_MAPPING = {'CRITICAL': 3, 'MAJOR': 2, 'MINOR': 1}
+
+def upload_dataframe_to_blob(storage, df, blob_path):
+    
+    # Name the blob with the extension matching the artifact format (CSV or Parquet)
+    blob_name = artifact_blob_name(blob_path, ARTIFACT_FORMAT)
+
+    # Stream the DataFrame up in row chunks, compressed when configured
+    upload_dataframe(df, storage, blob_name, ARTIFACT_FORMAT, ARTIFACT_COMPRESSION)
+
+def download_blob_to_file(storage, blob_name, download_file_path, download_cache):
+    """Streams a blob from storage to a local file, reusing the cached copy when unchanged."""
+    # A single metadata request decides whether the cached copy is still current
+    properties = storage.get_properties(blob_name)
+    etag = properties.etag
+    last_modified = properties.last_modified
+    if download_cache.restore(blob_name, etag, last_modified, download_file_path):
+        logger.info(f"Served {blob_name} from the local cache to {download_file_path}")
+        return
+
+    # Write to a temporary file so a failed transfer never leaves a truncated input behind.
+    # The download is pinned to the ETag just checked so the cache never records a mismatched body.
+    partial_file_path = f"{download_file_path}.part"
+    storage.download_to_file(blob_name, partial_file_path, etag, MAX_CONNECTIONS_PER_DOWNLOAD)
+    download_cache.store(blob_name, etag, last_modified, partial_file_path, download_file_path)
+    logger.info(f"Downloaded {blob_name} to {download_file_path}")
 
-# Initialize Azure Blob service client
-blob_service_client = BlobServiceClient.from_connection_string(AZURE_STORAGE_CONNECTION_STRING)
-container_client = blob_service_client.get_container_client(BLOB_CONTAINER_NAME)
-
-def upload_blob(data, blob_path):
-
-    # Create a BlobServiceClient using the connection string
-    blob_service_client = BlobServiceClient.from_connection_string(AZURE_STORAGE_CONNECTION_STRING)
-
-    # Get a client to interact with the specific blob
-    blob_client = blob_service_client.get_blob_client(container=BLOB_CONTAINER_NAME, blob=blob_path)
-
-    # Upload the data to the blob
-    blob_client.upload_blob(data, blob_type="BlockBlob", overwrite=True)
+def discover_input_blobs(storage, files_to_download, folder_name, download_dir):
+    """Expand each input blob name or pattern into the (blob path, local file path) pairs of its partitions."""
+    dataset_blobs = {}
+    for blob_pattern, local_name in files_to_download.items():
+        blob_path_pattern = f"{folder_name}/{blob_pattern}"
+        if not DataLoader.is_pattern(blob_path_pattern):
+            dataset_blobs[local_name] = [(blob_path_pattern, os.path.join(download_dir, local_name))]
+            continue
+
+        # List only the blobs under the fixed prefix of the pattern, then match the wildcards
+        prefix = re.split(r'[*?\[]', blob_path_pattern, maxsplit=1)[0]
+        blob_names = sorted(
+            blob_name for blob_name in storage.list_blobs(prefix)
+            if fnmatch.fnmatchcase(blob_name, blob_path_pattern)
+        )
+        if not blob_names:
+            raise FileNotFoundError(f"No blobs match {blob_path_pattern}")
+        logger.info(f"Found {len(blob_names)} partitions for {blob_path_pattern}")
+
+        # Partitions of one dataset are downloaded together into a folder named after it
+        partition_dir = os.path.join(download_dir, os.path.splitext(local_name)[0])
+        os.makedirs(partition_dir, exist_ok=True)
+        dataset_blobs[local_name] = [
+            (blob_name, os.path.join(partition_dir, os.path.basename(blob_name))) for blob_name in blob_names
+        ]
+    return dataset_blobs
+
+def download_dataset_partitions(download_executor, storage, blobs, download_cache):
+    """Download every (blob path, local file path) partition of a dataset on the executor and return the local paths."""
+    download_futures = [
+        download_executor.submit(download_blob_to_file, storage, blob_path, local_path, download_cache)
+        for blob_path, local_path in blobs
+    ]
+    try:
+        for future in as_completed(download_futures):
+            future.result()
+    except Exception:
+        # Drop the downloads that have not started yet before propagating the error
+        for pending_future in download_futures:
+            pending_future.cancel()
+        raise
+    return [local_path for _, local_path in blobs]
+
+def score_maintenance(patch_upgrades):
+    """Calculate the maintenance scores."""
+    patch_upgrades_analyzer = MaintenanceAnalyzer(patch_upgrades)
+    maintenance_scores_calculated = patch_upgrades_analyzer.aggregate_by_hardware_asset()
+    # csv_processor.save_to_csv(maintenance_scores_calculated , 'AssetFiles_With_Scores/hw_maintenance_scores.csv')
+    return maintenance_scores_calculated
 
-def upload_dataframe_to_blob(df, blob_path):
-    
-    # Create an in-memory buffer
-    csv_buffer = io.BytesIO()
+def score_incidents(hw_incidents, hw_server, severity_mapping, impact_mapping):
+    """Calculate the incident scores."""
+    incident_scorer = IncidentScoring(hw_incidents, hw_server,severity_mapping,impact_mapping)
+    incident_scores_calculated = incident_scorer.incident_stability()
+    # csv_processor.save_to_csv(incident_scores_calculated , 'AssetFiles_With_Scores/hw_incidents_score.csv')
+    # # incident_scores_calculated = incident_scorer.incident_df_with_all_scores()
+    return incident_scores_calculated
 
-    # Write the DataFrame to the buffer as CSV
-    df.to_csv(csv_buffer, index=False)
+def score_vulnerabilities(hw_vulnerability):
+    """Calculate the vulnerability scores."""
+    hw_vulnerability.columns = hw_vulnerability.columns.str.replace('ï»¿', '')
+    vulnerability_scorer = VulnerabilityScorer(hw_vulnerability)
+    vulnerability_summary = vulnerability_scorer.calculate_vulnerability_stability()
+    # csv_processor.save_to_csv(vulnerability_summary, 'AssetFiles_With_Scores/hw_vulnerability_score.csv')
+    return vulnerability_summary
 
-    # Move the buffer's position to the beginning
-    csv_buffer.seek(0)
+def score_usage(hw_server_usage):
+    """Calculate the weighted usage scores."""
+    usage_scorer = UsageScorer()
+    weighted_usage_scores = usage_scorer.add_weighted_usage_scores(hw_server_usage)
+    # csv_processor.save_to_csv(weighted_usage_scores, 'AssetFiles_With_Scores/hw_usage_score.csv')
+    return weighted_usage_scores
 
-    # Upload the CSV buffer to the blob
-    upload_blob(csv_buffer, blob_path)
+def iter_usage_chunks(usage_file_paths):
+    """Stream the usage partition files in chunks of USAGE_CHUNK_SIZE rows."""
+    return chain.from_iterable(
+        DataLoader.iter_csv_chunks(usage_file_path, 'usage', USAGE_CHUNK_SIZE) for usage_file_path in usage_file_paths
+    )
 
-def download_blob_to_file(blob_name, download_file_path):
-    """Downloads a blob from Azure Blob Storage to a local file."""
-    blob_client = container_client.get_blob_client(blob_name)
-    with open(download_file_path, "wb") as download_file:
-        download_file.write(blob_client.download_blob().readall())
-    logger.info(f"Downloaded {blob_name} to {download_file_path}")
+def score_usage_in_chunks(usage_file_paths):
+    """Calculate the weighted usage scores by streaming the usage partition files in chunks."""
+    usage_scorer = UsageScorer()
+    return usage_scorer.calculate_weighted_usage_scores_chunked(iter_usage_chunks(usage_file_paths))
+
+# Incremental scorers: each folds the new records of its dataset (None when no partition is new)
+# into the aggregate state and scores every asset from the state
+
+def score_maintenance_incrementally(aggregate_state, new_patch_upgrades):
+    """Calculate the maintenance scores from the aggregate state."""
+    if new_patch_upgrades is not None:
+        aggregate_state.update_patch_upgrades(new_patch_upgrades)
+    return aggregate_state.maintenance_scores()
+
+def score_incidents_incrementally(aggregate_state, new_incidents, severity_mapping, impact_mapping):
+    """Calculate the incident scores from the aggregate state."""
+    if new_incidents is not None:
+        aggregate_state.update_incidents(new_incidents, severity_mapping, impact_mapping)
+    return aggregate_state.incident_scores()
+
+def score_vulnerabilities_incrementally(aggregate_state, new_vulnerabilities, reference_time):
+    """Calculate the vulnerability scores from the aggregate state, with patch ages taken at reference_time."""
+    if new_vulnerabilities is not None:
+        new_vulnerabilities.columns = new_vulnerabilities.columns.str.replace('ï»¿', '')
+        aggregate_state.update_vulnerabilities(new_vulnerabilities, reference_time)
+    return aggregate_state.vulnerability_scores(reference_time)
+
+def score_usage_incrementally(aggregate_state, new_usage):
+    """Calculate the weighted usage scores from the aggregate state; new_usage may be streamed partition files."""
+    if new_usage is not None:
+        aggregate_state.update_usage(new_usage if isinstance(new_usage, pd.DataFrame) else iter_usage_chunks(new_usage))
+    return aggregate_state.usage_scores()
+
+def score_keyed_by_code(scorer, asset_column, asset_index, *scorer_inputs):
+    """Run a scorer and key its per-asset scores by asset code, so the merge aligns them by position."""
+    return asset_index.key_by_code(scorer(*scorer_inputs), asset_column)
+
+def select_new_partitions(aggregate_state, dataset_blobs, dataset_schemas, partitioned_files):
+    """Keep only the partitions of each aggregated dataset that are not yet folded into the state."""
+    for local_name, blobs in dataset_blobs.items():
+        dataset = dataset_schemas[local_name]
+        if dataset not in AssetAggregateState.DATASET_ASSET_IDS:
+            continue
+        new_blob_names = set(aggregate_state.new_partitions(
+            dataset, [blob_path for blob_path, _ in blobs], local_name in partitioned_files
+        ))
+        dataset_blobs[local_name] = [(blob_path, local_path) for blob_path, local_path in blobs if blob_path in new_blob_names]
+        logger.info(f"{len(dataset_blobs[local_name])} of {len(blobs)} {dataset} partitions are new")
+    return dataset_blobs
 
 
 def process_data():
     logger.info("Starting data processing")
 
-    # Download files from Azure Blob Storage
-    download_dir = 'AssetFiles'
-    score_output_dir = 'AssetFiles_With_Scores'
+    # Fail before any transfer if the artifact format cannot be written
+    validate_artifact_format(ARTIFACT_FORMAT)
+    validate_artifact_compression(ARTIFACT_COMPRESSION)
+    if SCORING_BACKEND not in SCORING_BACKENDS:
+        raise ValueError(f"Unsupported scoring backend '{SCORING_BACKEND}'. Use one of {SCORING_BACKENDS}.")
+    # Incremental scoring, the SQL backend and sharded scoring are alternative ways to score, so at most one can be set
+    scoring_modes = [
+        setting for setting, enabled in [
+            ('AGGREGATE_STATE_BLOB', bool(AGGREGATE_STATE_BLOB)),
+            ('SCORING_BACKEND=sql', SCORING_BACKEND == 'sql'),
+            ('SCORING_WORKERS>1', SCORING_WORKERS > 1),
+        ] if enabled
+    ]
+    if len(scoring_modes) > 1:
+        raise ValueError(f"Conflicting scoring settings {scoring_modes}; set at most one of them.")
+    if RISK_CATEGORIZATION_MODE not in RiskCategorizer.MODES:
+        raise ValueError(f"Unsupported risk categorization mode '{RISK_CATEGORIZATION_MODE}'. Use one of {RiskCategorizer.MODES}.")
+    if WARRANTY_COLUMNS not in WARRANTY_COLUMN_OPTIONS:
+        raise ValueError(f"Unsupported warranty columns setting '{WARRANTY_COLUMNS}'. Use one of {WARRANTY_COLUMN_OPTIONS}.")
+
+    # Connect to storage only when processing starts, so importing this module needs no credentials
+    storage = create_storage_backend(
+        STORAGE_BACKEND,
+        connection_string=AZURE_STORAGE_CONNECTION_STRING,
+        container_name=BLOB_CONTAINER_NAME,
+        local_dir=LOCAL_STORAGE_DIR
+    )
 
+    # Download files from storage
+    download_dir = 'AssetFiles'
     os.makedirs(download_dir, exist_ok=True)
-    os.makedirs(score_output_dir, exist_ok=True)
 
+    # Input blob names; each may be a glob pattern such as 'hw_incidents_*.csv' matching many partition files
     files_to_download = {
-        'hw_servers_usage_5.csv': 'hw_usage_data.csv',
-        'hw_warranty_5.csv': 'hw_warranty_data.csv',
-        'hw_servers_5.csv': 'hw_servers_data.csv',
-        'hw_vulnerabilities_data.csv': 'hw_vulnerabilities_data.csv',
-        'patchupgrades.csv': 'patch_upgrades_data.csv',
-        'hw_incidents_5.csv': 'hw_incidents_data.csv',
+        os.getenv('USAGE_BLOB_PATTERN', 'hw_servers_usage_5.csv'): 'hw_usage_data.csv',
+        os.getenv('WARRANTY_BLOB_PATTERN', 'hw_warranty_5.csv'): 'hw_warranty_data.csv',
+        os.getenv('SERVERS_BLOB_PATTERN', 'hw_servers_5.csv'): 'hw_servers_data.csv',
+        os.getenv('VULNERABILITIES_BLOB_PATTERN', 'hw_vulnerabilities_data.csv'): 'hw_vulnerabilities_data.csv',
+        os.getenv('PATCH_UPGRADES_BLOB_PATTERN', 'patchupgrades.csv'): 'patch_upgrades_data.csv',
+        os.getenv('INCIDENTS_BLOB_PATTERN', 'hw_incidents_5.csv'): 'hw_incidents_data.csv',
     }
 
-    weights_composite_stability_score = {
-        'overall_usage_score': 0.2,
-        'overall_incident_score': 0.5,
-        'maintenance_score': 0.3,
-        'vulnerability_score':0.5
-    }
-   
-    severity_mapping = {
-            '1 - high': 10, 'high': 10,
-            '2 - medium': 4, 'medium': 4,
-            '3 - low': 0.5, 'low': 0.5
-    }
-    impact_mapping = {
-            '1 - high': 10, 'high': 10,
-            '2 - medium': 4, 'medium': 4,
-            '3 - low': 0.5, 'low': 0.5
+    # Schema each downloaded file is loaded with
+    dataset_schemas = {
+        'hw_usage_data.csv': 'usage',
+        'hw_warranty_data.csv': 'warranty',
+        'hw_servers_data.csv': 'servers',
+        'hw_vulnerabilities_data.csv': 'vulnerabilities',
+        'patch_upgrades_data.csv': 'patch_upgrades',
+        'hw_incidents_data.csv': 'incidents',
     }
 
-    u_event_severity_mapping = {'CRITICAL': 3, 'MAJOR': 2, 'MINOR': 1}
-    
     # Folder name inside the container
     folder_name = 'AssetFiles'
 
-    for blob_name, local_name in files_to_download.items():
-        blob_path = f"{folder_name}/{blob_name}"
-        download_blob_to_file(blob_path, os.path.join(download_dir, local_name))
-
     # Process datasets
     logger.info("Processing datasets")
     data_loader = DataLoader()
     data_processor = DataProcessor()
     metrics_calculator = MetricsCalculator()
-    risk_categorizer = RiskCategorizer()
-    csv_processor = CSVProcessor()
-
-    # Load datasets
-    hw_server_usage, hw_incidents, patch_upgrades, hw_warrant, hw_server, hw_vulnerability = data_loader.load_datasets([
-        os.path.join(download_dir, 'hw_usage_data.csv'),
-        os.path.join(download_dir, 'hw_incidents_data.csv'),
-        os.path.join(download_dir, 'patch_upgrades_data.csv'),
-        os.path.join(download_dir, 'hw_warranty_data.csv'),
-        os.path.join(download_dir, 'hw_servers_data.csv'),
-        os.path.join(download_dir, 'hw_vulnerabilities_data.csv')
-    ])
 
-    # Calculate and save individual scores for incidents, usage, vulnerabilities, etc.
-    patch_upgrades_analyzer = MaintenanceAnalyzer(patch_upgrades)
-    patch_upgrades_analyzer.calculate_overall_maintenance_score()
-    maintenance_scores_calculated = patch_upgrades_analyzer.aggregate_by_hardware_asset()
-    # csv_processor.save_to_csv(maintenance_scores_calculated , 'AssetFiles_With_Scores/hw_maintenance_scores.csv')
-    upload_dataframe_to_blob(maintenance_scores_calculated,'AssetFiles_With_Scores/hw_maintenance_score.csv')
+    # Each scorer, the downloaded files it needs and where its scores are uploaded;
+    # a scorer starts as soon as its own inputs land
+    scoring_stages = {
+        'maintenance': (
+            score_maintenance,
+            ['patch_upgrades_data.csv'],
+            'AssetFiles_With_Scores/hw_maintenance_score.csv'
+        ),
+        'incident': (
+            lambda hw_incidents, hw_server: score_incidents(hw_incidents, hw_server, SEVERITY_MAPPING, IMPACT_MAPPING),
+            ['hw_incidents_data.csv', 'hw_servers_data.csv'],
+            'AssetFiles_With_Scores/hw_incidents_score.csv'
+        ),
+        'vulnerability': (
+            score_vulnerabilities,
+            ['hw_vulnerabilities_data.csv'],
+            'AssetFiles_With_Scores/hw_vulnerability_score.csv'
+        ),
+        'usage': (
+            score_usage_in_chunks if USAGE_CHUNK_SIZE > 0 else score_usage,
+            ['hw_usage_data.csv'],
+            'AssetFiles_With_Scores/hw_usage_score.csv'
+        ),
+    }
 
+    # Files their scorer streams from disk instead of having them loaded up front
+    streamed_files = {'hw_usage_data.csv'} if USAGE_CHUNK_SIZE > 0 else set()
+
+    aggregate_state = None
+    if AGGREGATE_STATE_BLOB:
+        aggregate_state = AssetAggregateState.load(storage, AGGREGATE_STATE_BLOB)
+        # Patch ages of every pending vulnerability are measured against the same instant
+        reference_time = pd.Timestamp(datetime.now())
+        incremental_scorers = {
+            'maintenance': partial(score_maintenance_incrementally, aggregate_state),
+            'incident': lambda hw_incidents, hw_server: score_incidents_incrementally(aggregate_state, hw_incidents, SEVERITY_MAPPING, IMPACT_MAPPING),
+            'vulnerability': lambda hw_vulnerability: score_vulnerabilities_incrementally(aggregate_state, hw_vulnerability, reference_time),
+            'usage': partial(score_usage_incrementally, aggregate_state),
+        }
+        scoring_stages = {
+            stage_name: (incremental_scorers[stage_name], input_names, score_blob_path)
+            for stage_name, (_, input_names, score_blob_path) in scoring_stages.items()
+        }
 
-    incident_scorer = IncidentScoring(hw_incidents, hw_server,severity_mapping,impact_mapping)
-    incident_scores_calculated = incident_scorer.incident_stability()
-    # csv_processor.save_to_csv(incident_scores_calculated , 'AssetFiles_With_Scores/hw_incidents_score.csv')
-    # # incident_scores_calculated = incident_scorer.incident_df_with_all_scores()
-    upload_dataframe_to_blob(incident_scores_calculated,'AssetFiles_With_Scores/hw_incidents_score.csv')
+    sql_backend = None
+    if SCORING_BACKEND == 'sql':
+        # The scorers query their partition files directly; only the inventory and warranty are loaded
+        sql_backend = SqlScoringBackend(SQL_MEMORY_LIMIT, SQL_TEMP_DIRECTORY)
+        reference_time = pd.Timestamp(datetime.now())
+        sql_scorers = {
+            'maintenance': sql_backend.score_maintenance,
+            'incident': lambda incident_files, hw_server: sql_backend.score_incidents(incident_files, SEVERITY_MAPPING, IMPACT_MAPPING),
+            'vulnerability': lambda vulnerability_files: sql_backend.score_vulnerabilities(vulnerability_files, reference_time),
+            'usage': sql_backend.score_usage,
+        }
+        scoring_stages = {
+            stage_name: (sql_scorers[stage_name], input_names, score_blob_path)
+            for stage_name, (_, input_names, score_blob_path) in scoring_stages.items()
+        }
+        streamed_files = {input_names[0] for _, input_names, _ in scoring_stages.values()}
+
+    sharded_scorer = None
+    if SCORING_WORKERS > 1:
+        # Each scorer aggregates asset shards in worker processes and normalizes the combined result here
+        sharded_scorer = ShardedScorer(SCORING_WORKERS)
+        scoring_stages['maintenance'] = (sharded_scorer.score_maintenance, *scoring_stages['maintenance'][1:])
+        scoring_stages['incident'] = (
+            lambda hw_incidents, hw_server: sharded_scorer.score_incidents(hw_incidents, SEVERITY_MAPPING, IMPACT_MAPPING),
+            *scoring_stages['incident'][1:]
+        )
+        scoring_stages['vulnerability'] = (
+            lambda hw_vulnerability: sharded_scorer.score_vulnerabilities(
+                hw_vulnerability.rename(columns=lambda column: column.replace('ï»¿', ''))
+            ),
+            *scoring_stages['vulnerability'][1:]
+        )
+        if 'hw_usage_data.csv' not in streamed_files:
+            scoring_stages['usage'] = (sharded_scorer.score_usage, *scoring_stages['usage'][1:])
+
+    download_cache = DownloadCache(DOWNLOAD_CACHE_DIR, DOWNLOAD_CACHE_MAX_BYTES)
+
+    dataset_blobs = discover_input_blobs(storage, files_to_download, folder_name, download_dir)
+    if aggregate_state is not None:
+        partitioned_files = {local_name for blob_pattern, local_name in files_to_download.items() if DataLoader.is_pattern(blob_pattern)}
+        dataset_blobs = select_new_partitions(aggregate_state, dataset_blobs, dataset_schemas, partitioned_files)
+
+    def load_dataset(local_name, local_paths):
+        """Load the downloaded partitions of a dataset; None when an incremental run found none new."""
+        if not local_paths:
+            return None
+        if local_name in streamed_files:
+            dataset = local_paths
+        else:
+            # Partitions are parsed in parallel and concatenated into one typed frame
+            dataset, = data_loader.load_datasets([local_paths], [dataset_schemas[local_name]])
+        if aggregate_state is not None and dataset_schemas[local_name] in AssetAggregateState.DATASET_ASSET_IDS:
+            aggregate_state.advance_watermark(dataset_schemas[local_name], [blob_path for blob_path, _ in dataset_blobs[local_name]])
+        return dataset
+
+    def merge_scores(asset_index, hw_server, weighted_usage_scores, incident_scores_calculated, maintenance_scores_calculated, hw_warrant, vulnerability_summary):
+        # Merge all individual scores with server data
+        logger.info("Merging datasets")
+        # The SQL backend joins in the database; in memory, frames keyed by asset code align by position
+        merge = sql_backend.merge_data if sql_backend is not None else partial(data_processor.merge_data, asset_index=asset_index)
+        merged_data = merge(
+            hw_server,
+            weighted_usage_scores,
+            incident_scores_calculated,
+            maintenance_scores_calculated,
+            hw_warrant,
+            vulnerability_summary
+        )
+
+        # Handle missing values
+        logger.info("Handling missing values")
+        return data_processor.handle_missing_values(merged_data)
+
+    def save_aggregate_state(*uploads):
+        # The state only moves past the new partitions once every score derived from them is stored
+        aggregate_state.save(storage, AGGREGATE_STATE_BLOB)
+        logger.info(f"Saved the aggregate state to {AGGREGATE_STATE_BLOB}")
+
+    # Every step of the run as a stage of a graph: a stage starts as soon as the stages it takes
+    # its inputs from are done, so downloads, scorers and uploads of different datasets overlap
+    # and a run takes as long as its slowest chain of stages
+    stage_graph = StageGraph({
+        'download': len(dataset_blobs),
+        'compute': MAX_CONCURRENT_STAGES,
+        'upload': MAX_CONCURRENT_UPLOADS,
+    })
+    # Partition transfers of all datasets share one pool, bounded by MAX_CONCURRENT_DOWNLOADS
+    download_executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_DOWNLOADS)
+
+    for local_name, blobs in dataset_blobs.items():
+        dataset = dataset_schemas[local_name]
+        stage_graph.add_stage(
+            f'download_{dataset}',
+            partial(download_dataset_partitions, download_executor, storage, blobs, download_cache),
+            pool='download'
+        )
+        stage_graph.add_stage(f'load_{dataset}', partial(load_dataset, local_name), [f'download_{dataset}'])
+
+    # Asset ids interned once from the inventory; every scorer keys its results by these codes
+    stage_graph.add_stage('asset_index', AssetIndex.from_servers, ['load_servers'])
+    score_asset_columns = {'vulnerability': 'asset_id'}
+
+    for stage_name, (scorer, input_names, score_blob_path) in scoring_stages.items():
+        stage_graph.add_stage(
+            f'score_{stage_name}',
+            partial(score_keyed_by_code, scorer, score_asset_columns.get(stage_name, 'hardware_asset_id')),
+            ['asset_index'] + [f'load_{dataset_schemas[name]}' for name in input_names]
+        )
+        stage_graph.add_stage(
+            f'upload_{stage_name}',
+            partial(upload_dataframe_to_blob, storage, blob_path=score_blob_path),
+            [f'score_{stage_name}'],
+            pool='upload'
+        )
+
+    stage_graph.add_stage('merge', merge_scores, [
+        'asset_index', 'load_servers', 'score_usage', 'score_incident', 'score_maintenance', 'load_warranty', 'score_vulnerability'
+    ])
 
-  
-    hw_vulnerability.columns = hw_vulnerability.columns.str.replace('ï»¿', '')
-    vulnerability_scorer = VulnerabilityScorer(hw_vulnerability)
-    vulnerability_summary = vulnerability_scorer.calculate_vulnerability_stability()
-    # csv_processor.save_to_csv(vulnerability_summary, 'AssetFiles_With_Scores/hw_vulnerability_score.csv')
-    upload_dataframe_to_blob(vulnerability_summary,'AssetFiles_With_Scores/hw_vulnerability_score.csv')
+    # Calculate stability scores and the risk categorization in one pass
+    stage_graph.add_stage(
+        'stability',
+        lambda merged_data: metrics_calculator.calculate_stability_and_risk(
+            merged_data, WEIGHTS_COMPOSITE_STABILITY_SCORE, RISK_CATEGORIZATION_MODE
+        ),
+        ['merge']
+    )
 
+    # Add company names
+    stage_graph.add_stage(
+        'summary',
+        lambda merged_data, hw_server, asset_index: data_processor.add_company_names(merged_data, hw_server, asset_index),
+        ['stability', 'load_servers', 'asset_index']
+    )
 
-    # Usage scoring
-    usage_scorer = UsageScorer()
-    weighted_usage_scores = usage_scorer.add_weighted_usage_scores(hw_server_usage)
-    # csv_processor.save_to_csv(weighted_usage_scores, 'AssetFiles_With_Scores/hw_usage_score.csv')
-    upload_dataframe_to_blob(weighted_usage_scores,'AssetFiles_With_Scores/hw_usage_score.csv')
-    
-    # Merge all individual scores with server data
-    logger.info("Merging datasets")
-    
-    merged_data = data_processor.merge_data(
-        hw_server,
-        weighted_usage_scores,
-        incident_scores_calculated,
-        maintenance_scores_calculated,
-        hw_warrant,
-        vulnerability_summary
+    # Save the final merged data
+    # csv_processor.save_to_csv(merged_data, f'Reports/csv_report/summarized_asset_scores_with_risk_category.csv')
+    stage_graph.add_stage(
+        'upload_summary',
+        partial(upload_dataframe_to_blob, storage, blob_path='AssetFiles_With_Scores/summarized_asset_scores_with_risk_category.csv'),
+        ['summary'],
+        pool='upload'
     )
-    
-    # Handle missing values
-    logger.info("Handling missing values")
-    merged_data = data_processor.handle_missing_values(merged_data)
 
-    # Calculate stability scores
-    logger.info("Calculating stability scores")
-    merged_data =  metrics_calculator.calculate_stability_scores(merged_data,weights_composite_stability_score)
+    # Aggregate the summary into the cube the report is built from, stored next to it
+    stage_graph.add_stage('summary_cube', SummaryCube.from_scores, ['summary'])
+    stage_graph.add_stage(
+        'upload_summary_cube',
+        lambda summary_cube: summary_cube.save(storage, SUMMARY_CUBE_BLOB),
+        ['summary_cube'],
+        pool='upload'
+    )
 
-    # Calculate risk categorization
-    logger.info("Categorizing asset risk")
-    merged_data_zscore =  risk_categorizer.categorize_asset_risk(merged_data)
+    if aggregate_state is not None:
+        stage_graph.add_stage(
+            'save_aggregate_state',
+            save_aggregate_state,
+            [f'upload_{stage_name}' for stage_name in scoring_stages] + ['upload_summary', 'upload_summary_cube'],
+            pool='upload'
+        )
+
+    try:
+        stage_graph.run()
+    finally:
+        download_executor.shutdown(wait=True, cancel_futures=True)
+        if sharded_scorer is not None:
+            sharded_scorer.close()
+        if sql_backend is not None:
+            sql_backend.close()
+
+    for entry in sorted(stage_graph.timeline, key=lambda entry: entry['start_seconds']):
+        logger.info(f"Stage {entry['stage']:<28} {entry['start_seconds']:8.2f}s -> {entry['end_seconds']:8.2f}s ({entry['seconds']:.2f}s)")
+    logger.info(f"Critical path: {' -> '.join(stage_graph.critical_path())}")
 
-    # Add company names
-    merged_data= data_processor.add_company_names(merged_data_zscore, hw_server)
-    
-    # Save the final merged data
-    # csv_processor.save_to_csv(merged_data, f'Reports/csv_report/summarized_asset_scores_with_risk_category.csv')
-    upload_dataframe_to_blob(merged_data,'AssetFiles_With_Scores/summarized_asset_scores_with_risk_category.csv')
     # upload_file_to_blob(f'{download_dir}/merged_data.csv', f'{download_dir}/merged_data.csv')
 
     # logger.info("Data processing completed")
+    return stage_graph.timeline
 
 # Azure Function entry point
 def main():
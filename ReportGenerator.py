@@ -1,14 +1,15 @@
-import io
 import os 
 import logging
 import pandas as pd
-from azure.storage.blob import BlobServiceClient
 from src.metrics import MetricsCalculator,RiskCategorizer
 from src.utils.report_generator import HTMLProcessor,CSVProcessor,PlotProcessor,PDFConverter
 from src.source_code import code_text
 from src.utils.model import OpenAIModel
 from src.data_analysis.visualizations import ReportPlotter
+from src.data_analysis.summary_cube import SUMMARY_CUBE_BLOB, SummaryCube
 from src.utils.email_sender import EmailSender
+from src.utils.storage import create_storage_backend
+from src.utils.artifacts import ARTIFACT_FORMAT, ScoreArtifactReader, artifact_blob_name
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -18,21 +19,6 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-def load_csv_from_blob(blob_service_client, container_name, blob_name):
-    """
-    Load the CSV file directly from Azure Blob Storage into a pandas DataFrame.
-    """
-    try:
-        blob_client = blob_service_client.get_blob_client(container=container_name, blob=blob_name)
-        csv_data = blob_client.download_blob().readall()
-        # Convert byte content into a DataFrame
-        df = pd.read_csv(io.BytesIO(csv_data))
-        logger.info(f"Successfully loaded {blob_name} from container {container_name} into memory")
-        return df
-    except Exception as e:
-        logger.error(f"Failed to load {blob_name} from blob storage: {str(e)}")
-        raise
-
 def main():
     logger.info("Starting AI model and report generation step")
 
@@ -56,27 +42,41 @@ def main():
     plot_processor = PlotProcessor(openai_model)
     pdf_converter = PDFConverter()
 
-    # Azure Blob Storage details
+    # Storage details: an Azure Blob container (default) or a local directory
+    storage_backend = os.getenv('STORAGE_BACKEND', 'azure').lower()
     blob_connection_string = os.getenv('AZURE_STORAGE_CONNECTION_STRING')
     BLOB_CONTAINER_NAME = os.getenv('BLOB_CONTAINER_NAME')
-    blob_name = 'AssetFiles_With_Scores/summarized_asset_scores_with_risk_category.csv'
+    blob_name = artifact_blob_name('AssetFiles_With_Scores/summarized_asset_scores_with_risk_category.csv', ARTIFACT_FORMAT)
     
     # Check if connection string is available
-    if not blob_connection_string:
+    if storage_backend == 'azure' and not blob_connection_string:
         logger.error("Azure Storage connection string is missing")
         return
 
-    # Initialize the BlobServiceClient
-    blob_service_client = BlobServiceClient.from_connection_string(blob_connection_string)
-
-    # Load the CSV directly into memory from Blob Storage
-    logger.info("Loading merged_data.csv from Blob Storage into memory")
-    complete_df = load_csv_from_blob(blob_service_client, BLOB_CONTAINER_NAME, blob_name)
+    storage = create_storage_backend(
+        storage_backend,
+        connection_string=blob_connection_string,
+        container_name=BLOB_CONTAINER_NAME,
+        local_dir=os.getenv('LOCAL_STORAGE_DIR', 'blob_storage')
+    )
+
+    # Every table and chart comes from the summary cube preprocessing stores; without one, each report
+    # section reads only the columns it uses from the per-asset scores (Parquet fetches just those columns)
+    summary_cube = SummaryCube.load(storage, SUMMARY_CUBE_BLOB)
+    score_reader = None
+    if summary_cube is not None:
+        logger.info(f"Read the summary cube {SUMMARY_CUBE_BLOB} from storage")
+    else:
+        logger.info(f"No summary cube at {SUMMARY_CUBE_BLOB}, reading {blob_name} from storage")
+        score_reader = ScoreArtifactReader(storage, blob_name, ARTIFACT_FORMAT)
     
     # Generate reports
     logger.info("Generating reports")
     html_content_list = []
-    report_plotter = ReportPlotter(complete_df,html_content_list,openai_model,plot_processor)
+    if summary_cube is not None:
+        report_plotter = ReportPlotter(None, html_content_list, openai_model, plot_processor, summary_cube)
+    else:
+        report_plotter = ReportPlotter(score_reader.read(ReportPlotter.REQUIRED_COLUMNS),html_content_list,openai_model,plot_processor)
 
     # List all data files
     title = "The Approach to Identify the Risk Assets"
@@ -90,7 +90,10 @@ def main():
     # Count of Assets by Category
     logger.info("Summarizing assets by category")
     count_of_assets_by_category_table_title = "Count of Assets by Category"
-    count_of_assets_by_category =  metrics_calculator.summarize_risk_categories(complete_df)
+    if summary_cube is not None:
+        count_of_assets_by_category = metrics_calculator.summarize_risk_categories_from_cube(summary_cube)
+    else:
+        count_of_assets_by_category =  metrics_calculator.summarize_risk_categories(score_reader.read(MetricsCalculator.RISK_CATEGORY_SUMMARY_COLUMNS))
     count_of_assets_description = openai_model.describe_data_frame_with_model(count_of_assets_by_category)
     count_of_assets_description_html = html_processor.convert_markdown_to_html(count_of_assets_description)
     count_of_assets_by_category_html = html_processor.df_to_html_table(count_of_assets_by_category)
@@ -100,7 +103,15 @@ def main():
 
     # Summary of Usage/Incident/Maintenance Metrics
     logger.info("Generating usage, incident, and maintenance summaries")
-    usage_summary, incident_summary, maintenance_summary =  metrics_calculator.display_metrics_summary(complete_df)
+    if summary_cube is not None:
+        usage_summary, incident_summary, maintenance_summary = metrics_calculator.display_metrics_summary_from_cube(summary_cube)
+    else:
+        metrics_summary_columns = (
+            MetricsCalculator.USAGE_SUMMARY_COLUMNS +
+            MetricsCalculator.INCIDENT_SUMMARY_COLUMNS +
+            MetricsCalculator.MAINTENANCE_SUMMARY_COLUMNS
+        )
+        usage_summary, incident_summary, maintenance_summary =  metrics_calculator.display_metrics_summary(score_reader.read(metrics_summary_columns))
 
     # Generate HTML for usage summary
     usage_title = "Usage Summary"
@@ -134,7 +145,10 @@ def main():
 
     # Identify high-risk servers
     logger.info("Identifying top 10 high-risk servers by asset count")
-    top_10_high_risk_servers_by_asset_count =  metrics_calculator.get_top_10_high_risk_servers_summary(complete_df)
+    if summary_cube is not None:
+        top_10_high_risk_servers_by_asset_count = metrics_calculator.get_top_10_high_risk_servers_summary_from_cube(summary_cube)
+    else:
+        top_10_high_risk_servers_by_asset_count =  metrics_calculator.get_top_10_high_risk_servers_summary(score_reader.read(MetricsCalculator.HIGH_RISK_SERVERS_SUMMARY_COLUMNS))
     top_10_high_risk_servers_by_asset_html_table = plot_processor.high_risk_asset_html_table(top_10_high_risk_servers_by_asset_count)
     html_content_list.append(top_10_high_risk_servers_by_asset_html_table)
      
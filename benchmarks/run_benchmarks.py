@@ -0,0 +1,288 @@
+"""
+Scoring benchmark suite.
+
+Generates a synthetic fleet per size, then times and memory-profiles every scorer, the merge,
+stability and risk steps and the end-to-end process_data run against a local storage directory.
+Results are written as JSON; pass --compare with an earlier result file to fail on regressions.
+
+    python -m benchmarks.run_benchmarks --sizes 10k 100k --output benchmark_results.json
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import statistics
+import subprocess
+import tracemalloc
+import numpy as np
+import pandas as pd
+
+from src.data_processor.synthetic_data import FLEET_SIZES, SyntheticFleetGenerator
+
+
+def measure(stage_fn, make_args, repeats: int, profile_memory: bool) -> dict:
+    """Time a stage over fresh copies of its inputs and record the peak memory it allocates."""
+    timings = []
+    for _ in range(repeats):
+        args = make_args()
+        start = time.perf_counter()
+        stage_fn(*args)
+        timings.append(time.perf_counter() - start)
+
+    # Memory is traced in a separate run so tracing overhead never shows up in the timings
+    peak_memory_bytes = None
+    if profile_memory:
+        args = make_args()
+        tracemalloc.start()
+        try:
+            stage_fn(*args)
+            _, peak_memory_bytes = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+    return {
+        'seconds_min': min(timings),
+        'seconds_median': statistics.median(timings),
+        'repeats': repeats,
+        'peak_memory_bytes': peak_memory_bytes,
+    }
+
+
+def run_size(size: str, data_dir: str, repeats: int, profile_memory: bool, seed: int, skip_pipeline: bool,
+             scoring_workers: int) -> list:
+    """Benchmark every stage for one fleet size and return its result records."""
+    num_assets = FLEET_SIZES[size]
+    size_dir = os.path.join(data_dir, size)
+    storage_dir = os.path.join(size_dir, 'storage')
+
+    start = time.perf_counter()
+    input_paths = SyntheticFleetGenerator(num_assets, seed=seed).write_csv(storage_dir)
+    print(f"[{size}] generated fleet in {time.perf_counter() - start:.1f}s", flush=True)
+
+    # Point the pipeline at the generated fleet, without the download cache skewing repeated runs
+    import HWDataPreprocessing as pipeline
+    pipeline.STORAGE_BACKEND = 'local'
+    pipeline.LOCAL_STORAGE_DIR = os.path.abspath(storage_dir)
+    pipeline.DOWNLOAD_CACHE_MAX_BYTES = 0
+
+    from src.data_processor.data_loader import DataLoader
+    from src.data_processor.data_processor import DataProcessor
+    from src.data_analysis.aggregates import aggregate_per_asset
+    from src.data_analysis.sharded_scoring import ShardedScorer
+    from src.data_analysis.summary_cube import SummaryCube
+    from src.data_processor.sql_backend import SqlScoringBackend
+    from src.metrics import MetricsCalculator, RiskCategorizer
+
+    records = []
+
+    def record(stage, stage_fn, make_args, rows):
+        result = measure(stage_fn, make_args, repeats, profile_memory)
+        records.append({'size': size, 'num_assets': num_assets, 'stage': stage, 'input_rows': rows, **result})
+        peak_memory = result['peak_memory_bytes']
+        peak_memory_text = 'n/a' if peak_memory is None else f"{peak_memory / 2 ** 20:.1f} MiB"
+        print(f"[{size}] {stage:<28} {result['seconds_median']:9.3f}s  peak {peak_memory_text}", flush=True)
+
+    datasets = {}
+    for dataset, file_path in input_paths.items():
+        record(f'load_{dataset}', DataLoader.load_csv, lambda path=file_path, name=dataset: (path, name), None)
+        datasets[dataset] = DataLoader.load_csv(file_path, dataset)
+
+    def copies(*names):
+        return lambda: tuple(datasets[name].copy() for name in names)
+
+    # The grouped-reduction kernel every scorer aggregates with, on its own
+    usage_columns = ['CPU Usage (%)', 'Memory Usage (%)', 'Disk Usage (%)', 'Network Throughput (Mbps)']
+    record(
+        'aggregation_kernel',
+        lambda usage: aggregate_per_asset(usage['hardware_asset_id'], {
+            f'{column} {reduction}': (usage[column], reduction)
+            for column in usage_columns for reduction in ('sum', 'count', 'max')
+        }, 'hardware_asset_id'),
+        lambda: (datasets['usage'],),
+        len(datasets['usage'])
+    )
+    record('score_maintenance', pipeline.score_maintenance, copies('patch_upgrades'), len(datasets['patch_upgrades']))
+    record(
+        'score_incidents',
+        lambda incidents, servers: pipeline.score_incidents(incidents, servers, pipeline.SEVERITY_MAPPING, pipeline.IMPACT_MAPPING),
+        copies('incidents', 'servers'),
+        len(datasets['incidents'])
+    )
+    record('score_vulnerabilities', pipeline.score_vulnerabilities, copies('vulnerabilities'), len(datasets['vulnerabilities']))
+    record('score_usage', pipeline.score_usage, copies('usage'), len(datasets['usage']))
+
+    if scoring_workers > 1:
+        # Worker start-up is paid once, outside the timings
+        with ShardedScorer(scoring_workers) as sharded_scorer:
+            sharded_scorer.score_maintenance(datasets['patch_upgrades'].copy())
+            record('score_maintenance_sharded', sharded_scorer.score_maintenance, copies('patch_upgrades'), len(datasets['patch_upgrades']))
+            record(
+                'score_incidents_sharded',
+                lambda incidents: sharded_scorer.score_incidents(incidents, pipeline.SEVERITY_MAPPING, pipeline.IMPACT_MAPPING),
+                copies('incidents'),
+                len(datasets['incidents'])
+            )
+            record('score_vulnerabilities_sharded', sharded_scorer.score_vulnerabilities, copies('vulnerabilities'), len(datasets['vulnerabilities']))
+            record('score_usage_sharded', sharded_scorer.score_usage, copies('usage'), len(datasets['usage']))
+
+    scores = {
+        'maintenance': pipeline.score_maintenance(datasets['patch_upgrades'].copy()),
+        'incident': pipeline.score_incidents(datasets['incidents'].copy(), datasets['servers'], pipeline.SEVERITY_MAPPING, pipeline.IMPACT_MAPPING),
+        'vulnerability': pipeline.score_vulnerabilities(datasets['vulnerabilities'].copy()),
+        'usage': pipeline.score_usage(datasets['usage'].copy()),
+    }
+
+    def merge_inputs():
+        return (datasets['servers'], scores['usage'], scores['incident'], scores['maintenance'],
+                datasets['warranty'], scores['vulnerability'].copy())
+
+    record('merge_data', DataProcessor.merge_data, merge_inputs, len(datasets['servers']))
+
+    # The SQL backend queries the generated files; it is optional, so its stages are too
+    try:
+        sql_backend = SqlScoringBackend()
+    except ImportError:
+        sql_backend = None
+        print(f"[{size}] duckdb is not installed, skipping the SQL backend stages", flush=True)
+    if sql_backend is not None:
+        with sql_backend:
+            def files(name):
+                return lambda: ([input_paths[name]],)
+
+            record('score_maintenance_sql', sql_backend.score_maintenance, files('patch_upgrades'), len(datasets['patch_upgrades']))
+            record(
+                'score_incidents_sql',
+                lambda incident_files: sql_backend.score_incidents(incident_files, pipeline.SEVERITY_MAPPING, pipeline.IMPACT_MAPPING),
+                files('incidents'),
+                len(datasets['incidents'])
+            )
+            record(
+                'score_vulnerabilities_sql',
+                lambda vulnerability_files: sql_backend.score_vulnerabilities(vulnerability_files, pd.Timestamp.now()),
+                files('vulnerabilities'),
+                len(datasets['vulnerabilities'])
+            )
+            record('score_usage_sql', sql_backend.score_usage, files('usage'), len(datasets['usage']))
+            record('merge_data_sql', sql_backend.merge_data, merge_inputs, len(datasets['servers']))
+
+    merged_data = DataProcessor.handle_missing_values(DataProcessor.merge_data(*merge_inputs()))
+    record(
+        'calculate_stability_scores',
+        lambda merged: MetricsCalculator.calculate_stability_scores(merged, pipeline.WEIGHTS_COMPOSITE_STABILITY_SCORE),
+        lambda: (merged_data.copy(),),
+        len(merged_data)
+    )
+    stability_data = MetricsCalculator.calculate_stability_scores(merged_data.copy(), pipeline.WEIGHTS_COMPOSITE_STABILITY_SCORE)
+    record('categorize_asset_risk', RiskCategorizer.categorize_asset_risk, lambda: (stability_data.copy(),), len(stability_data))
+    record(
+        'calculate_stability_and_risk',
+        lambda merged: MetricsCalculator.calculate_stability_and_risk(merged, pipeline.WEIGHTS_COMPOSITE_STABILITY_SCORE),
+        lambda: (merged_data.copy(),),
+        len(merged_data)
+    )
+    risk_data = DataProcessor.add_company_names(RiskCategorizer.categorize_asset_risk(stability_data.copy()), datasets['servers'])
+    record(
+        'get_top_10_high_risk_servers_summary',
+        MetricsCalculator.get_top_10_high_risk_servers_summary,
+        lambda: (risk_data,),
+        len(risk_data)
+    )
+    record('build_summary_cube', SummaryCube.from_scores, lambda: (risk_data,), len(risk_data))
+
+    if not skip_pipeline:
+        # The end-to-end run works in its own directory, as the Function host would
+        work_dir = os.path.join(size_dir, 'work')
+        os.makedirs(work_dir, exist_ok=True)
+        previous_dir = os.getcwd()
+        os.chdir(work_dir)
+        try:
+            record('process_data', pipeline.process_data, tuple, num_assets)
+        finally:
+            os.chdir(previous_dir)
+
+    return records
+
+
+def environment_metadata() -> dict:
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'timestamp': pd.Timestamp.now(tz='UTC').isoformat(),
+        'git_commit': commit,
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def find_regressions(results: list, baseline_path: str, max_slowdown: float, min_seconds: float) -> list:
+    """
+    List the stages whose median time grew by more than max_slowdown against a baseline result file.
+    Stages faster than min_seconds are timer noise and never count as regressions.
+    """
+    with open(baseline_path) as baseline_file:
+        baseline = {(entry['size'], entry['stage']): entry for entry in json.load(baseline_file)['results']}
+
+    regressions = []
+    for entry in results:
+        previous = baseline.get((entry['size'], entry['stage']))
+        if previous is None or entry['seconds_median'] < min_seconds:
+            continue
+        if entry['seconds_median'] > previous['seconds_median'] * max_slowdown:
+            regressions.append(
+                f"{entry['size']} {entry['stage']}: {previous['seconds_median']:.3f}s -> {entry['seconds_median']:.3f}s"
+            )
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', nargs='+', default=['10k'], choices=list(FLEET_SIZES))
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--data-dir', default='benchmark_data')
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-memory', action='store_true', help='skip the tracemalloc peak-memory runs')
+    parser.add_argument('--skip-pipeline', action='store_true', help='skip the end-to-end process_data run')
+    parser.add_argument('--scoring-workers', type=int, default=os.cpu_count() or 1,
+                        help='worker processes of the sharded scorer stages; 1 skips them')
+    parser.add_argument('--keep-data', action='store_true', help='keep the generated fleets after the run')
+    parser.add_argument('--compare', help='earlier result file to check for regressions')
+    parser.add_argument('--max-slowdown', type=float, default=1.2)
+    parser.add_argument('--min-seconds', type=float, default=0.05, help='ignore stages faster than this when comparing')
+    args = parser.parse_args(argv)
+
+    results = []
+    try:
+        for size in args.sizes:
+            results.extend(run_size(
+                size, args.data_dir, args.repeats, not args.no_memory, args.seed, args.skip_pipeline, args.scoring_workers
+            ))
+    finally:
+        if not args.keep_data:
+            shutil.rmtree(args.data_dir, ignore_errors=True)
+
+    with open(args.output, 'w') as output_file:
+        json.dump({'metadata': environment_metadata(), 'results': results}, output_file, indent=2)
+    print(f"Wrote {len(results)} results to {args.output}")
+
+    if args.compare:
+        regressions = find_regressions(results, args.compare, args.max_slowdown, args.min_seconds)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,85 @@
+import numpy as np
+import pandas as pd
+
+# Reductions of the aggregation kernel
+REDUCTIONS = ('sum', 'count', 'size', 'mean', 'max', 'min')
+
+
+def aggregate_by_code(codes, num_groups: int, aggregations: dict) -> dict:
+    """
+    Grouped reductions over integer group codes 0..num_groups-1, one NumPy pass per output;
+    rows with code -1 are left out. aggregations maps each output name to (values, reduction)
+    with reduction one of REDUCTIONS ('size' ignores its values). Like pandas grouped
+    reductions, missing values are skipped, sums of empty groups are 0 and their mean, max
+    and min are NaN. Returns {output name: array of num_groups values}.
+    """
+    codes = np.asarray(codes, dtype=np.intp)
+    kept = codes >= 0
+    all_kept = bool(kept.all())
+    if not all_kept:
+        codes = codes[kept]
+
+    results = {}
+    for name, (values, reduction) in aggregations.items():
+        if reduction not in REDUCTIONS:
+            raise ValueError(f"Unknown reduction '{reduction}'. Expected one of {list(REDUCTIONS)}.")
+        if reduction == 'size':
+            results[name] = np.bincount(codes, minlength=num_groups)
+            continue
+
+        values = np.asarray(values, dtype=float)
+        if not all_kept:
+            values = values[kept]
+        present = ~np.isnan(values)
+        has_missing = not present.all()
+        present_codes = codes[present] if has_missing else codes
+
+        if reduction == 'count':
+            results[name] = np.bincount(present_codes, minlength=num_groups)
+        elif reduction in ('sum', 'mean'):
+            sums = np.bincount(codes, weights=np.where(present, values, 0.0) if has_missing else values, minlength=num_groups)
+            if reduction == 'sum':
+                results[name] = sums
+            else:
+                counts = np.bincount(present_codes, minlength=num_groups)
+                results[name] = np.divide(sums, counts, out=np.full(num_groups, np.nan), where=counts > 0)
+        else:
+            # fmax/fmin skip NaN, and groups left at the starting infinity have no value at all
+            extremes = np.full(num_groups, -np.inf if reduction == 'max' else np.inf)
+            (np.fmax if reduction == 'max' else np.fmin).at(extremes, codes, values)
+            extremes[np.bincount(present_codes, minlength=num_groups) == 0] = np.nan
+            results[name] = extremes
+    return results
+
+
+def aggregate_per_asset(asset_ids, aggregations: dict, index_name: str) -> pd.DataFrame:
+    """
+    aggregate_by_code over the codes of asset ids, as a frame indexed by the distinct asset ids
+    in sorted order, like groupby(asset_ids).agg(...); rows without an asset id are left out.
+    """
+    codes, unique_asset_ids = pd.factorize(asset_ids)
+    results = aggregate_by_code(codes, len(unique_asset_ids), aggregations)
+    aggregates = pd.DataFrame(results, index=pd.Index(unique_asset_ids, name=index_name), columns=list(aggregations))
+
+    # Sorting the distinct ids afterwards is cheaper than factorizing in sorted order
+    return aggregates.take(np.argsort(aggregates.index.to_numpy(), kind='stable'))
+
+
+def combine_aggregates(frames: list) -> pd.DataFrame:
+    """
+    Combine per-asset aggregate frames (indexed by asset id) from separate batches of rows.
+    Columns ending in '_min' or '_max' combine by min/max, every other column is a sum or count
+    and is added. The result is sorted by asset id.
+    """
+    frames = [frame for frame in frames if frame is not None]
+    if len(frames) == 1:
+        return frames[0].sort_index()
+
+    grouped = pd.concat(frames).groupby(level=0, sort=True)
+    combined = grouped.sum()
+    for column in combined.columns:
+        if column.endswith('_min'):
+            combined[column] = grouped[column].min()
+        elif column.endswith('_max'):
+            combined[column] = grouped[column].max()
+    return combined
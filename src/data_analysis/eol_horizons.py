@@ -0,0 +1,95 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+# End-of-life horizon buckets in order: (bucket label, bound in days from the reference time,
+# whether an end-of-life date exactly on the bound falls in this bucket rather than the next).
+# The last bucket takes every later date and has no bound. These are the buckets of the
+# high risk servers table: expired before now, expiring within 30 days, expiring later.
+DEFAULT_EOL_HORIZONS = [
+    ('expired', 0, False),
+    ('expiring_soon', 30, True),
+    ('expiring_later', None, False),
+]
+
+
+def _horizon_edges(horizons: list, reference_time: datetime) -> np.ndarray:
+    """
+    Bounds of the horizons as int64 nanoseconds, shifted so that a date is past edge i exactly
+    when it is greater than it: bounds a bucket includes stay, the others move back 1ns.
+    """
+    edges = []
+    for label, days, inclusive in horizons[:-1]:
+        if days is None:
+            raise ValueError(f"Only the last EOL horizon can be unbounded, '{label}' is not last.")
+        bound = np.datetime64(reference_time + timedelta(days=days), 'ns').astype(np.int64)
+        edges.append(bound if inclusive else bound - 1)
+    edges = np.array(edges, dtype=np.int64)
+    if np.any(np.diff(edges) <= 0):
+        raise ValueError("EOL horizon bounds must be increasing.")
+    return edges
+
+
+def eol_horizon_codes(end_of_life_dates, horizons: list = DEFAULT_EOL_HORIZONS, reference_time: datetime = None) -> np.ndarray:
+    """
+    Bucket code (position in horizons) of each end-of-life date, in one binary search over the
+    horizon bounds; dates that are missing or not dates get -1. The reference time defaults to now.
+    """
+    if reference_time is None:
+        reference_time = datetime.now()
+    edges = _horizon_edges(horizons, reference_time)
+
+    dates = pd.to_datetime(pd.Series(end_of_life_dates), errors='coerce')
+    values = dates.to_numpy(dtype='datetime64[ns]').astype(np.int64)
+    codes = np.searchsorted(edges, values, side='left').astype(np.int8)
+    codes[dates.isna().to_numpy()] = -1
+    return codes
+
+
+def eol_horizon_buckets(end_of_life_dates, horizons: list = DEFAULT_EOL_HORIZONS, reference_time: datetime = None) -> pd.Categorical:
+    """EOL horizon bucket of each end-of-life date as a categorical of the bucket labels."""
+    codes = eol_horizon_codes(end_of_life_dates, horizons, reference_time)
+    return pd.Categorical.from_codes(codes, categories=[label for label, _, _ in horizons])
+
+
+def eol_horizon_crosstab(groups, end_of_life_dates, horizons: list = DEFAULT_EOL_HORIZONS, reference_time: datetime = None) -> pd.DataFrame:
+    """
+    Count of end-of-life dates per group (e.g. company) and horizon bucket, like
+    pd.crosstab(groups, eol_horizon_buckets(...)) from a single bincount. Rows are the groups
+    with at least one bucketed date, in sorted order; columns are the bucket labels.
+    """
+    bucket_codes = eol_horizon_codes(end_of_life_dates, horizons, reference_time)
+    group_codes, unique_groups = pd.factorize(pd.Series(groups), sort=True)
+
+    # Only rows with both a group and a bucket are counted, and only their groups kept
+    counted = (bucket_codes >= 0) & (group_codes >= 0)
+    kept_groups, group_codes = np.unique(group_codes[counted], return_inverse=True)
+
+    num_buckets = len(horizons)
+    counts = np.bincount(
+        group_codes * num_buckets + bucket_codes[counted],
+        minlength=len(kept_groups) * num_buckets,
+    ).reshape(len(kept_groups), num_buckets)
+    return pd.DataFrame(
+        counts,
+        index=pd.Index(np.asarray(unique_groups)[kept_groups], name=getattr(groups, 'name', None)),
+        columns=[label for label, _, _ in horizons],
+    )
+
+
+def top_k_positions(values, k: int) -> np.ndarray:
+    """
+    Positions of the k largest values in descending order, ties in their original order, by
+    partial selection: only the values tied with or above the k-th largest are ever sorted.
+    """
+    values = np.asarray(values)
+    if k <= 0:
+        return np.array([], dtype=np.intp)
+    if len(values) > k:
+        kth_largest = np.partition(values, len(values) - k)[len(values) - k]
+        candidates = np.flatnonzero(values >= kth_largest)
+    else:
+        candidates = np.arange(len(values))
+    order = np.argsort(-values[candidates], kind='stable')
+    return candidates[order[:k]]
@@ -1,6 +1,9 @@
 import pandas as pd
 import numpy as np
 
+from src.data_analysis.aggregates import aggregate_per_asset
+from src.data_analysis.label_encoding import encode_labels, score_lookup
+
 
 class IncidentScoring:
     # Define severity and impact scoring
@@ -19,33 +22,54 @@ class IncidentScoring:
         return incident_count * (severity_score + impact_score)
 
     
-    def incident_stability(self):
-        
-        # Preprocess 'severity' and 'impact' columns
-
-        self.df['severity'] = self.df['severity'].fillna('').astype(str).str.lower()
-        self.df['impact'] = self.df['impact'].fillna('').astype(str).str.lower()
-        
-        # Map 'severity' and 'impact' to their respective scores
-        self.df['severity_score'] = self.df['severity'].apply(
-            lambda severity: self.severityScoreDef.get(severity, 0)
-        )
-        self.df['impact_score'] = self.df['impact'].apply(
-            lambda impact: self.impactScoreDef.get(impact, 0)
-        )
-           
-        # Aggregate the data by 'hardware_asset_id'
-        aggregated_df = self.df.groupby('hardware_asset_id').agg(
-            severity_score=('severity_score', 'mean'),
-            impact_score=('impact_score', 'mean'),
-            incident_count=('hardware_asset_id', 'size')
-        ).reset_index()
-        
-
-        aggregated_df['incident_score'] = aggregated_df.apply(
-            lambda row: self.incident_score(row['severity_score'], row['impact_score'],row['incident_count']),
-            axis=1
+    @staticmethod
+    def map_labels(labels, score_def):
+        """
+        Lower-case a label column and map it to scores, working on its distinct values only.
+        Missing labels become '' and labels without a score definition score 0.
+        OUT: (lower-cased labels as a Categorical, scores array)
+        """
+        categorical = encode_labels(labels, lowercase=True)
+        scores = score_lookup(categorical, score_def)
+
+        if (categorical.codes == -1).any():
+            if '' not in categorical.categories:
+                categorical = categorical.add_categories([''])
+            categorical = categorical.fillna('')
+        return categorical, scores
+
+    def incident_aggregates(self):
+        """
+        Per-asset severity and impact score sums and incident counts of the incidents in self.df.
+        Aggregates of separate batches of incidents combine by addition.
+        """
+        # Preprocess 'severity' and 'impact' columns and map them to their respective scores
+        self.df['severity'], self.df['severity_score'] = self.map_labels(self.df['severity'], self.severityScoreDef)
+        self.df['impact'], self.df['impact_score'] = self.map_labels(self.df['impact'], self.impactScoreDef)
+
+        return aggregate_per_asset(self.df['hardware_asset_id'], {
+            'severity_score_sum': (self.df['severity_score'], 'sum'),
+            'impact_score_sum': (self.df['impact_score'], 'sum'),
+            'incident_count': (None, 'size'),
+        }, 'hardware_asset_id')
+
+    @staticmethod
+    def incident_stability_from_aggregates(aggregates):
+        """Per-asset incident scores from incident_aggregates, normalized by the largest incident score."""
+        aggregates = aggregates.sort_index()
+        incident_count = aggregates['incident_count']
+
+        aggregated_df = pd.DataFrame({
+            'hardware_asset_id': aggregates.index.to_numpy(),
+            'severity_score': (aggregates['severity_score_sum'] / incident_count).to_numpy(),
+            'impact_score': (aggregates['impact_score_sum'] / incident_count).to_numpy(),
+            'incident_count': incident_count.to_numpy(),
+        })
+        # Score of an asset: its incident count times the mean severity and impact
+        aggregated_df['incident_score'] = aggregated_df['incident_count'] * (
+            aggregated_df['severity_score'] + aggregated_df['impact_score']
         )
+
         # Calculate the maximum incident_score
         max_incident_score = aggregated_df['incident_score'].max()
 
@@ -54,7 +78,8 @@ class IncidentScoring:
 
         return aggregated_df
 
-
+    def incident_stability(self):
+        return self.incident_stability_from_aggregates(self.incident_aggregates())
 
     def normalize_array(self, array, minv, maxv):
         """
@@ -96,31 +121,24 @@ class IncidentScoring:
 
     def incident_df_with_all_scores(self):
         """Generate detailed incident scores and join them with server data."""
-        grouped = self.df.groupby('hardware_asset_id')
-
-        results = []
-
-        for hardware_asset_id, group in grouped:
-            incident_count = np.mean(group['hardware_asset_id'].count())
-            s_impact = np.sum(group['impact_score'].to_numpy())
-            s_severity = np.sum(group['severity_score'].to_numpy())
-            s_incident_score = np.sum(group['incident_score'].to_numpy())
-
-            # Collect results for each asset
-            results.append({
-                'hardware_asset_id': hardware_asset_id,
-                'incident_count': incident_count,
-                's_impact': s_impact,
-                's_severity': s_severity,
-                's_incident_score': s_incident_score
-            })
-
-        # Convert results to DataFrame
-        results_df = pd.DataFrame(results)
+        if 'severity_score' not in self.df.columns or 'impact_score' not in self.df.columns:
+            self.df['severity'], self.df['severity_score'] = self.map_labels(self.df['severity'], self.severityScoreDef)
+            self.df['impact'], self.df['impact_score'] = self.map_labels(self.df['impact'], self.impactScoreDef)
+        if 'incident_score' not in self.df.columns:
+            # The score of a single incident
+            self.df['incident_score'] = self.incident_score(self.df['severity_score'], self.df['impact_score'], 1)
+
+        # Per-asset counts and sums in one grouped pass
+        results_df = aggregate_per_asset(self.df['hardware_asset_id'], {
+            'incident_count': (None, 'size'),
+            's_impact': (self.df['impact_score'], 'sum'),
+            's_severity': (self.df['severity_score'], 'sum'),
+            's_incident_score': (self.df['incident_score'], 'sum'),
+        }, 'hardware_asset_id').reset_index()
+        results_df['incident_count'] = results_df['incident_count'].astype(float)
 
         # Normalize incident score
-        data_max = results_df['s_incident_score'].to_numpy()
-        max_ic = np.max(data_max)
+        max_ic = results_df['s_incident_score'].max()
         results_df['overall_incident_score'] = (results_df['s_incident_score']) / max_ic
 
         # Merge with server data
@@ -128,12 +146,11 @@ class IncidentScoring:
 
         # Specify columns to keep and clean missing data
         columns_to_keep = ['hardware_asset_id', 'incident_count', 's_impact', 's_severity', 's_incident_score', 'overall_incident_score']
-        result_serv = result_serv[columns_to_keep]
-        result_serv.fillna(0, inplace=True)
+        result_serv = result_serv[columns_to_keep].fillna(0)
 
         # Normalize overall incident score
         mins_ois, maxs_ois = self.calculate_minmax(result_serv, ['overall_incident_score'])
         max_oisv = maxs_ois[0]
-        result_serv['n_incident_score'] = result_serv['overall_incident_score'].apply(self.calc_n_incident_score, args=(max_oisv,))
+        result_serv['n_incident_score'] = self.calc_n_incident_score(result_serv['overall_incident_score'], max_oisv)
 
         return result_serv
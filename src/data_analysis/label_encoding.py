@@ -0,0 +1,41 @@
+import numpy as np
+import pandas as pd
+
+
+def encode_labels(labels, lowercase: bool = False) -> pd.Categorical:
+    """
+    A label column as a Categorical, reusing the codes of a categorical column as they are.
+    With lowercase, labels that differ only in case share one lower-cased category; the
+    folding works on the distinct labels, never on every row.
+    """
+    categorical = pd.Categorical(labels)
+    if not lowercase:
+        return categorical
+
+    categories = categorical.categories
+    folded = categories.astype(str).str.lower()
+    if folded.equals(categories):
+        return categorical
+
+    # Recode through the folded categories; code -1 (a missing label) picks the trailing -1
+    folded_categories = folded.unique()
+    recode = np.append(folded_categories.get_indexer(folded), -1)
+    return pd.Categorical.from_codes(recode[categorical.codes], categories=folded_categories)
+
+
+def score_lookup(labels: pd.Categorical, score_def: dict, default=0) -> np.ndarray:
+    """
+    Scores of encoded labels by indexing a lookup array built over their categories;
+    missing labels and labels without a score definition score default.
+    """
+    # Code -1 (a missing label) picks the trailing default
+    scores = np.array([score_def.get(label, default) for label in labels.categories] + [default])
+    return scores[labels.codes]
+
+
+def encode_label_columns(df: pd.DataFrame, lowercase_columns: list) -> pd.DataFrame:
+    """Fold the labels of the named columns of a frame to lower case, once, where they are present."""
+    for column in lowercase_columns:
+        if column in df.columns:
+            df[column] = pd.Series(encode_labels(df[column], lowercase=True), index=df.index)
+    return df
@@ -1,3 +1,8 @@
+import pandas as pd
+
+from src.data_analysis.aggregates import aggregate_per_asset
+
+
 class MaintenanceAnalyzer:
     def __init__(self, df):
         """Initialize with a DataFrame."""
@@ -23,14 +28,36 @@ class MaintenanceAnalyzer:
 
     def aggregate_by_hardware_asset(self):
         """Aggregate the scores by hardware_asset_id."""
-        # Group by hardware_asset_id and aggregate the scores
-        aggregated_df = self.df.groupby('hardware_asset_id').agg(
-            maintenance_score=('maintenance_score', 'mean'),  # Average maintenance score
-            overall_maintenance_score=('overall_maintenance_score', 'mean'),  # Average overall maintenance score
-        ).reset_index()
-        
-        return aggregated_df
+        # Average maintenance score and average overall maintenance score of each asset
+        return self.maintenance_scores_from_aggregates(self.maintenance_aggregates())
 
     def get_results(self):
         """Return the DataFrame with calculated maintenance scores."""
         return self.df
+
+    def maintenance_aggregates(self):
+        """
+        Per-asset maintenance score sums, counts of known scores and the asset's highest score.
+        Aggregates of separate batches of records combine with combine_aggregates.
+        """
+        self.validate_columns()
+
+        maintenance_score = self.df['maintenance_score']
+        return aggregate_per_asset(self.df['hardware_asset_id'], {
+            'maintenance_score_sum': (maintenance_score, 'sum'),
+            'maintenance_score_count': (maintenance_score, 'count'),
+            'maintenance_score_max': (maintenance_score, 'max'),
+        }, 'hardware_asset_id')
+
+    @staticmethod
+    def maintenance_scores_from_aggregates(aggregates):
+        """Per-asset mean maintenance scores from maintenance_aggregates, relative to the highest score of all."""
+        aggregates = aggregates.sort_index()
+        maintenance_score = aggregates['maintenance_score_sum'] / aggregates['maintenance_score_count']
+
+        # The mean of the ratios to the maximum equals the ratio of the mean
+        return pd.DataFrame({
+            'hardware_asset_id': aggregates.index.to_numpy(),
+            'maintenance_score': maintenance_score.to_numpy(),
+            'overall_maintenance_score': (maintenance_score / aggregates['maintenance_score_max'].max()).to_numpy(),
+        })
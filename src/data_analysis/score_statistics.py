@@ -0,0 +1,176 @@
+import numpy as np
+
+
+class ScoreMoments:
+    """
+    Count, mean and sum of squared deviations (M2) of a set of scores, ignoring missing ones.
+    Moments of disjoint sets merge exactly, so shards or daily increments of a fleet can be
+    summarized separately and combined into the distribution of the whole fleet.
+    """
+
+    def __init__(self, count: int = 0, mean: float = np.nan, m2: float = 0.0):
+        self.count = int(count)
+        self.mean = float(mean)
+        self.m2 = float(m2)
+
+    @classmethod
+    def from_scores(cls, scores) -> 'ScoreMoments':
+        """Moments of an array of scores, computed in two passes like pandas' skipna mean and var."""
+        scores = np.asarray(scores, dtype=float)
+        missing = np.isnan(scores)
+        count = len(scores) - np.count_nonzero(missing)
+        if not count:
+            return cls()
+
+        buffer = np.where(missing, 0.0, scores)
+        mean = buffer.sum() / count
+        # Squared deviations, with missing scores contributing nothing
+        np.subtract(mean, buffer, out=buffer)
+        np.square(buffer, out=buffer)
+        buffer[missing] = 0.0
+        return cls(count, mean, buffer.sum())
+
+    @classmethod
+    def combine(cls, parts: list) -> 'ScoreMoments':
+        """Moments of the union of the sets the parts summarize."""
+        combined = cls()
+        for part in parts:
+            combined = combined.merge(part)
+        return combined
+
+    def merge(self, other: 'ScoreMoments') -> 'ScoreMoments':
+        """Moments of both sets together (Chan et al.'s pairwise update)."""
+        if not other.count:
+            return ScoreMoments(self.count, self.mean, self.m2)
+        if not self.count:
+            return ScoreMoments(other.count, other.mean, other.m2)
+
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        mean = self.mean + delta * other.count / count
+        m2 = self.m2 + other.m2 + delta ** 2 * self.count * other.count / count
+        return ScoreMoments(count, mean, m2)
+
+    def std(self, ddof: int = 1) -> float:
+        """Standard deviation, by default the sample standard deviation like pandas'."""
+        return np.sqrt(self.m2 / (self.count - ddof)) if self.count > ddof else np.nan
+
+    def to_dict(self) -> dict:
+        return {'count': self.count, 'mean': self.mean, 'm2': self.m2}
+
+    @classmethod
+    def from_dict(cls, values: dict) -> 'ScoreMoments':
+        return cls(values['count'], values['mean'], values['m2'])
+
+
+class QuantileSketch:
+    """
+    Mergeable quantile sketch of a set of scores, ignoring missing ones. Scores are counted in
+    logarithmic buckets (as in DDSketch), so every quantile it returns lies within
+    relative_accuracy of a score of that rank, in memory that grows with the logarithm of the
+    score range rather than the number of scores. Sketches of the same accuracy merge by adding
+    their bucket counts.
+    """
+
+    # Scores closer to 0 than this are counted as 0
+    MIN_MAGNITUDE = 1e-9
+
+    def __init__(self, relative_accuracy: float = 0.01, positive: dict = None, negative: dict = None, zero_count: int = 0):
+        if not 0 < relative_accuracy < 1:
+            raise ValueError(f"relative_accuracy must be between 0 and 1, got {relative_accuracy}.")
+        self.relative_accuracy = float(relative_accuracy)
+        self.gamma = (1 + self.relative_accuracy) / (1 - self.relative_accuracy)
+        # Bucket index -> count of the scores (of positive and of negated negative scores) in it;
+        # bucket i holds magnitudes in (gamma ** (i - 1), gamma ** i]
+        self.positive = dict(positive or {})
+        self.negative = dict(negative or {})
+        self.zero_count = int(zero_count)
+
+    @property
+    def count(self) -> int:
+        return self.zero_count + sum(self.positive.values()) + sum(self.negative.values())
+
+    def _bucket_counts(self, magnitudes: np.ndarray) -> dict:
+        indices = np.ceil(np.log(magnitudes) / np.log(self.gamma)).astype(np.int64)
+        bucket_indices, counts = np.unique(indices, return_counts=True)
+        return dict(zip(bucket_indices.tolist(), counts.tolist()))
+
+    @classmethod
+    def from_scores(cls, scores, relative_accuracy: float = 0.01) -> 'QuantileSketch':
+        """Sketch of an array of scores."""
+        scores = np.asarray(scores, dtype=float)
+        scores = scores[~np.isnan(scores)]
+
+        sketch = cls(relative_accuracy)
+        sketch.positive = sketch._bucket_counts(scores[scores >= cls.MIN_MAGNITUDE])
+        sketch.negative = sketch._bucket_counts(-scores[scores <= -cls.MIN_MAGNITUDE])
+        sketch.zero_count = int(np.count_nonzero(np.abs(scores) < cls.MIN_MAGNITUDE))
+        return sketch
+
+    @classmethod
+    def combine(cls, parts: list) -> 'QuantileSketch':
+        """Sketch of the union of the sets the parts summarize; the parts share one accuracy."""
+        combined = cls(parts[0].relative_accuracy) if parts else cls()
+        for part in parts:
+            combined = combined.merge(part)
+        return combined
+
+    def merge(self, other: 'QuantileSketch') -> 'QuantileSketch':
+        """Sketch of both sets together."""
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("Only sketches of the same relative accuracy can be merged.")
+
+        def add_counts(counts, other_counts):
+            merged = dict(counts)
+            for bucket_index, count in other_counts.items():
+                merged[bucket_index] = merged.get(bucket_index, 0) + count
+            return merged
+
+        return QuantileSketch(
+            self.relative_accuracy,
+            add_counts(self.positive, other.positive),
+            add_counts(self.negative, other.negative),
+            self.zero_count + other.zero_count,
+        )
+
+    def _bucket_value(self, bucket_index: int) -> float:
+        # The point of the bucket within relative_accuracy of all its magnitudes
+        return 2 * self.gamma ** bucket_index / (self.gamma + 1)
+
+    def quantile(self, q: float) -> float:
+        """The score at quantile q (0 to 1), of rank q * (count - 1) among the sketched scores."""
+        if not 0 <= q <= 1:
+            raise ValueError(f"Quantile must be between 0 and 1, got {q}.")
+        count = self.count
+        if not count:
+            return np.nan
+
+        rank = q * (count - 1)
+        # Buckets in ascending order of score: negatives from the largest magnitude, zero, positives
+        buckets = [(-self._bucket_value(index), self.negative[index]) for index in sorted(self.negative, reverse=True)]
+        buckets.append((0.0, self.zero_count))
+        buckets.extend((self._bucket_value(index), self.positive[index]) for index in sorted(self.positive))
+
+        seen = 0
+        for value, bucket_count in buckets:
+            seen += bucket_count
+            if seen > rank:
+                return value
+
+    def to_dict(self) -> dict:
+        return {
+            'relative_accuracy': self.relative_accuracy,
+            # JSON object keys are text
+            'positive': {str(index): count for index, count in self.positive.items()},
+            'negative': {str(index): count for index, count in self.negative.items()},
+            'zero_count': self.zero_count,
+        }
+
+    @classmethod
+    def from_dict(cls, values: dict) -> 'QuantileSketch':
+        return cls(
+            values['relative_accuracy'],
+            {int(index): count for index, count in values['positive'].items()},
+            {int(index): count for index, count in values['negative'].items()},
+            values['zero_count'],
+        )
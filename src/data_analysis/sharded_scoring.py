@@ -0,0 +1,104 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+import numpy as np
+import pandas as pd
+
+from src.data_analysis.usage_scorer import UsageScorer
+from src.data_analysis.incident_scorer import IncidentScoring
+from src.data_analysis.vulnerability_scorer import VulnerabilityScorer
+from src.data_analysis.maintenance_scorer import MaintenanceAnalyzer
+
+
+def shard_of_assets(asset_ids, num_shards: int) -> np.ndarray:
+    """
+    Shard of every row: a hash of its asset id modulo num_shards. The hash is stable across
+    processes and datasets, so an asset lands in the same shard in every input.
+    """
+    return pd.util.hash_array(np.asarray(asset_ids, dtype=object)) % num_shards
+
+
+def split_by_asset(df: pd.DataFrame, asset_column: str, num_shards: int) -> list:
+    """Split a frame into num_shards frames by asset id hash, keeping the row order within each shard."""
+    shards = shard_of_assets(df[asset_column], num_shards)
+    order = np.argsort(shards, kind='stable')
+    bounds = np.searchsorted(shards[order], np.arange(num_shards + 1))
+    return [df.iloc[order[start:end]] for start, end in zip(bounds[:-1], bounds[1:])]
+
+
+# Per-asset aggregate steps run in the worker processes; module level so they can be pickled
+
+def _maintenance_aggregates(patch_upgrades):
+    return MaintenanceAnalyzer(patch_upgrades).maintenance_aggregates()
+
+
+def _incident_aggregates(incidents, severity_mapping, impact_mapping):
+    return IncidentScoring(incidents, None, severity_mapping, impact_mapping).incident_aggregates()
+
+
+def _vulnerability_aggregates(vulnerabilities, reference_time):
+    return VulnerabilityScorer(vulnerabilities, reference_time).vulnerability_aggregates()
+
+
+def _usage_aggregates(usage):
+    return UsageScorer().usage_aggregates(usage)
+
+
+class ShardedScorer:
+    """
+    Score on all cores: every input is split into shards by asset id hash, each worker process
+    computes the per-asset aggregates of its shard, and the global normalizations (the max and
+    min/max divisions of each scorer) run once on the combined aggregates. Shards hold disjoint
+    assets and keep each asset's rows in order, so the result is identical to scoring in one process.
+    """
+
+    def __init__(self, num_workers: int):
+        self.num_workers = num_workers
+        # Worker processes start on first use, so an idle scorer costs nothing
+        self._executor = None
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # Spawned workers are safe to start while the caller still has download threads running
+            self._executor = ProcessPoolExecutor(max_workers=self.num_workers, mp_context=multiprocessing.get_context('spawn'))
+        return self._executor
+
+    def close(self):
+        """Shut the worker processes down; they are started again on the next use."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _aggregate(self, aggregate_fn, df: pd.DataFrame, asset_column: str, *args) -> pd.DataFrame:
+        """Run aggregate_fn over every non-empty shard of df and concatenate the per-asset results."""
+        shards = [shard for shard in split_by_asset(df, asset_column, self.num_workers) if len(shard)]
+        if len(shards) <= 1:
+            return aggregate_fn(df, *args)
+
+        executor = self._get_executor()
+        futures = [executor.submit(aggregate_fn, shard, *args) for shard in shards]
+        return pd.concat([future.result() for future in futures]).sort_index()
+
+    def score_maintenance(self, patch_upgrades: pd.DataFrame) -> pd.DataFrame:
+        aggregates = self._aggregate(_maintenance_aggregates, patch_upgrades, 'hardware_asset_id')
+        return MaintenanceAnalyzer.maintenance_scores_from_aggregates(aggregates)
+
+    def score_incidents(self, incidents: pd.DataFrame, severity_mapping: dict, impact_mapping: dict) -> pd.DataFrame:
+        aggregates = self._aggregate(_incident_aggregates, incidents, 'hardware_asset_id', severity_mapping, impact_mapping)
+        return IncidentScoring.incident_stability_from_aggregates(aggregates)
+
+    def score_vulnerabilities(self, vulnerabilities: pd.DataFrame, reference_time=None) -> pd.DataFrame:
+        # Every shard measures patch ages against the same instant
+        reference_time = pd.Timestamp(reference_time if reference_time is not None else datetime.now())
+        aggregates = self._aggregate(_vulnerability_aggregates, vulnerabilities, 'asset_id', reference_time)
+        return VulnerabilityScorer.vulnerability_stability_from_aggregates(aggregates)
+
+    def score_usage(self, usage: pd.DataFrame) -> pd.DataFrame:
+        aggregates = self._aggregate(_usage_aggregates, usage, 'hardware_asset_id')
+        return UsageScorer().calculate_weighted_usage_scores_from_aggregates(aggregates)
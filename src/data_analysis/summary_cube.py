@@ -0,0 +1,313 @@
+import io
+import json
+import zipfile
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from src.data_analysis.aggregates import aggregate_by_code
+from src.data_analysis.eol_horizons import DEFAULT_EOL_HORIZONS, eol_horizon_codes, top_k_positions
+from src.metrics import RiskCategorizer
+
+# Where the summary cube is stored, next to the summarized asset scores it is built from
+SUMMARY_CUBE_BLOB = 'AssetFiles_With_Scores/summarized_asset_scores_cube.zip'
+
+
+class SummaryCube:
+    """
+    Aggregates of the summarized asset scores by company x risk category x EOL horizon bucket,
+    small enough for the report to build every table and chart from without the per-asset data.
+
+    Each cell holds its asset count and, per measure, the count of present values, their sum and
+    sum of squares as deviations from the measure's fleet mean (so variances and correlations
+    rolled up from the cells stay accurate), min and max. Alongside the cells the cube keeps:
+    histograms of the composite stability score per risk category (HISTOGRAM_BINS bins between
+    the category's min and max, like plt.hist), pairwise co-moments of the CORRELATION_MEASURES, the fleet
+    quantiles of every measure and the TOP_ASSETS high risk assets with the highest z-scores.
+    EOL buckets are taken at the cube's reference time.
+    """
+
+    CUBE_VERSION = 1
+    MANIFEST_NAME = 'cube.json'
+    CELLS_NAME = 'cells.csv'
+    HISTOGRAMS_NAME = 'histograms.csv'
+    TOP_ASSETS_NAME = 'top_high_risk_assets.csv'
+
+    DIMENSIONS = ['company', 'risk_category', 'eol_bucket']
+
+    # Score columns summarized in every cell
+    MEASURES = [
+        'composite_stability_score', 'zscore_composite_stability',
+        'w_cpu_usage', 'w_memory_usage', 'w_disk_usage', 'w_network_bandwidth', 'overall_usage_score', 'n_usage_score',
+        'incident_count', 'severity_score', 'impact_score', 'incident_score', 'overall_incident_score',
+        'maintenance_score', 'overall_maintenance_score', 'overall_vulnerability_score',
+    ]
+    # Measures whose correlations are kept, over the assets that have all of them
+    CORRELATION_MEASURES = [
+        'overall_usage_score', 'overall_incident_score', 'overall_maintenance_score', 'overall_vulnerability_score',
+        'composite_stability_score', 'zscore_composite_stability',
+    ]
+    HISTOGRAM_MEASURE = 'composite_stability_score'
+    HISTOGRAM_BINS = 20
+    QUANTILES = [0.25, 0.5, 0.75]
+    TOP_ASSETS = 10
+
+    def __init__(self, labels: dict, cells: pd.DataFrame, histograms: pd.DataFrame, top_assets: pd.DataFrame, metadata: dict):
+        # Label of every code of each dimension; the last label (None) is for rows without a value
+        self.labels = labels
+        self.cells = cells
+        # Long table of non-empty histogram bins: cell (row of cells), bin, count
+        self.histograms = histograms
+        self.top_assets = top_assets
+        # measures, shifts (fleet means), histogram_edges, quantiles, horizons, reference_time
+        self.metadata = metadata
+
+    @staticmethod
+    def _codes_with_missing(codes: np.ndarray, num_labels: int) -> np.ndarray:
+        """Codes of a dimension with -1 (no value) moved to the trailing None label."""
+        return np.where(codes < 0, num_labels, codes)
+
+    @classmethod
+    def from_scores(cls, summary: pd.DataFrame, horizons: list = DEFAULT_EOL_HORIZONS, reference_time: datetime = None) -> 'SummaryCube':
+        """Build the cube from the summarized asset scores (one row per asset)."""
+        if reference_time is None:
+            reference_time = datetime.now()
+
+        company_codes, companies = pd.factorize(summary['company'], sort=True)
+        risk_codes = pd.Categorical(summary['risk_category'], categories=RiskCategorizer.RISK_CATEGORIES).codes
+        eol_codes = eol_horizon_codes(summary['end_of_life_date'], horizons, reference_time)
+        labels = {
+            'company': [*companies.tolist(), None],
+            'risk_category': [*RiskCategorizer.RISK_CATEGORIES, None],
+            'eol_bucket': [*(label for label, _, _ in horizons), None],
+        }
+
+        # One code per combination of the dimensions, then only the combinations that occur
+        dimension_codes = [
+            cls._codes_with_missing(np.asarray(codes, dtype=np.int64), len(labels[dimension]) - 1)
+            for dimension, codes in zip(cls.DIMENSIONS, [company_codes, risk_codes, eol_codes])
+        ]
+        combined_codes = np.ravel_multi_index(dimension_codes, [len(labels[dimension]) for dimension in cls.DIMENSIONS])
+        cell_ids, cell_codes = np.unique(combined_codes, return_inverse=True)
+        num_cells = len(cell_ids)
+
+        measures = [measure for measure in cls.MEASURES if measure in summary.columns]
+        values = {measure: summary[measure].to_numpy(dtype=float) for measure in measures}
+        shifts = {measure: float(np.nanmean(values[measure])) if np.isfinite(values[measure]).any() else 0.0 for measure in measures}
+        deviations = {measure: values[measure] - shifts[measure] for measure in measures}
+
+        aggregations = {'asset_count': (None, 'size')}
+        for measure in measures:
+            aggregations[f'{measure}_count'] = (values[measure], 'count')
+            aggregations[f'{measure}_sum'] = (deviations[measure], 'sum')
+            aggregations[f'{measure}_sumsq'] = (np.square(deviations[measure]), 'sum')
+            aggregations[f'{measure}_min'] = (values[measure], 'min')
+            aggregations[f'{measure}_max'] = (values[measure], 'max')
+
+        # Co-moments of every pair of correlation measures over the assets that have both, like DataFrame.corr
+        correlation_measures = [measure for measure in cls.CORRELATION_MEASURES if measure in measures]
+        for position, first in enumerate(correlation_measures):
+            for second in correlation_measures[position + 1:]:
+                both = ~np.isnan(values[first]) & ~np.isnan(values[second])
+                pair = f'{first}__{second}'
+                aggregations[f'{pair}_count'] = (np.where(both, 1.0, np.nan), 'count')
+                for name, pair_values in [('first', deviations[first]), ('second', deviations[second])]:
+                    aggregations[f'{pair}_{name}_sum'] = (np.where(both, pair_values, np.nan), 'sum')
+                    aggregations[f'{pair}_{name}_sumsq'] = (np.where(both, np.square(pair_values), np.nan), 'sum')
+                aggregations[f'{pair}_product_sum'] = (np.where(both, deviations[first] * deviations[second], np.nan), 'sum')
+
+        cells = pd.DataFrame(aggregate_by_code(cell_codes, num_cells, aggregations))
+        for dimension, codes in zip(cls.DIMENSIONS, np.unravel_index(cell_ids, [len(labels[dimension]) for dimension in cls.DIMENSIONS])):
+            cells.insert(cls.DIMENSIONS.index(dimension), dimension, codes)
+
+        # Histograms per risk category, each over the category's own range like plt.hist(bins=...)
+        histogram_edges = {}
+        histogram_parts = []
+        if cls.HISTOGRAM_MEASURE in measures:
+            scores = values[cls.HISTOGRAM_MEASURE]
+            for risk_code, risk_category in enumerate(RiskCategorizer.RISK_CATEGORIES):
+                in_category = (risk_codes == risk_code) & np.isfinite(scores)
+                edges = np.histogram_bin_edges(scores[in_category], bins=cls.HISTOGRAM_BINS)
+                histogram_edges[risk_category] = edges.tolist()
+
+                # The bin of a score x satisfies edges[bin] <= x < edges[bin + 1], the last bin closed
+                bins = np.clip(np.searchsorted(edges, scores[in_category], side='right') - 1, 0, cls.HISTOGRAM_BINS - 1)
+                counts = np.bincount(cell_codes[in_category] * cls.HISTOGRAM_BINS + bins, minlength=num_cells * cls.HISTOGRAM_BINS)
+                filled = np.flatnonzero(counts)
+                histogram_parts.append(pd.DataFrame({
+                    'cell': filled // cls.HISTOGRAM_BINS,
+                    'bin': filled % cls.HISTOGRAM_BINS,
+                    'count': counts[filled],
+                }))
+        histograms = pd.concat(histogram_parts, ignore_index=True) if histogram_parts else pd.DataFrame(columns=['cell', 'bin', 'count'])
+
+        # Quantiles do not roll up from cells, so the fleet's are kept as they are
+        quantiles = {measure: pd.Series(values[measure]).quantile(cls.QUANTILES).tolist() for measure in measures}
+
+        # The assets of the high risk chart, with the highest z-scores first
+        top_assets = pd.DataFrame(columns=['hardware_asset_id', 'zscore_composite_stability'])
+        if 'zscore_composite_stability' in measures:
+            high_risk = np.flatnonzero((risk_codes == RiskCategorizer.RISK_CATEGORIES.index('High Risk')) & ~np.isnan(values['zscore_composite_stability']))
+            top = high_risk[top_k_positions(values['zscore_composite_stability'][high_risk], cls.TOP_ASSETS)]
+            top_assets = pd.DataFrame({
+                'hardware_asset_id': summary['hardware_asset_id'].to_numpy()[top],
+                'zscore_composite_stability': values['zscore_composite_stability'][top],
+            })
+
+        metadata = {
+            'measures': measures,
+            'correlation_measures': correlation_measures,
+            'shifts': shifts,
+            'histogram_edges': histogram_edges,
+            'quantiles': quantiles,
+            'horizons': [list(horizon) for horizon in horizons],
+            'reference_time': pd.Timestamp(reference_time).isoformat(),
+        }
+        return cls(labels, cells, histograms, top_assets, metadata)
+
+    def _rollup(self, dimension: str, columns: list) -> pd.DataFrame:
+        """Sum cell columns by the labels of one dimension, in label order, cells without a label left out."""
+        labels = self.labels[dimension]
+        codes = self.cells[dimension].to_numpy()
+        labelled = codes < len(labels) - 1
+        sums = {
+            column: np.bincount(codes[labelled], weights=self.cells[column].to_numpy(dtype=float)[labelled], minlength=len(labels) - 1)
+            for column in columns
+        }
+        return pd.DataFrame(sums, index=pd.Index(labels[:-1], name=dimension))
+
+    def _cells_of(self, risk_category: str = None) -> np.ndarray:
+        """Mask of the cells of one risk category, or of all cells."""
+        if risk_category is None:
+            return np.ones(len(self.cells), dtype=bool)
+        return (self.cells['risk_category'] == self.labels['risk_category'].index(risk_category)).to_numpy()
+
+    def risk_category_counts(self) -> pd.Series:
+        """Asset count of every risk category."""
+        return self._rollup('risk_category', ['asset_count'])['asset_count'].astype(np.int64)
+
+    def means(self, measures: list, risk_category: str = None) -> pd.Series:
+        """Mean of each measure over the assets of a risk category (all assets by default)."""
+        cells = self.cells[self._cells_of(risk_category)]
+        means = {}
+        for measure in measures:
+            count = cells[f'{measure}_count'].sum()
+            means[measure] = self.metadata['shifts'][measure] + cells[f'{measure}_sum'].sum() / count if count else np.nan
+        return pd.Series(means, dtype=float)
+
+    def describe(self, measures: list) -> pd.DataFrame:
+        """Fleet summary statistics of the measures, laid out like DataFrame.describe().T."""
+        rows = {}
+        for measure in measures:
+            count = self.cells[f'{measure}_count'].sum()
+            deviation_sum = self.cells[f'{measure}_sum'].sum()
+            variance = (self.cells[f'{measure}_sumsq'].sum() - deviation_sum ** 2 / count) / (count - 1) if count > 1 else np.nan
+            rows[measure] = [
+                float(count),
+                self.metadata['shifts'][measure] + deviation_sum / count if count else np.nan,
+                np.sqrt(max(variance, 0.0)) if count > 1 else np.nan,
+                self.cells[f'{measure}_min'].min(),
+                *self.metadata['quantiles'][measure],
+                self.cells[f'{measure}_max'].max(),
+            ]
+        columns = ['count', 'mean', 'std', 'min', *(f'{quantile:.0%}' for quantile in self.QUANTILES), 'max']
+        return pd.DataFrame.from_dict(rows, orient='index', columns=columns)
+
+    def histogram(self, risk_category: str) -> tuple:
+        """(counts, edges) of the composite stability score histogram of a risk category."""
+        cells_of_category = np.flatnonzero(self._cells_of(risk_category))
+        bins = self.histograms[self.histograms['cell'].isin(cells_of_category)]
+        counts = np.bincount(bins['bin'].to_numpy(dtype=np.intp), weights=bins['count'].to_numpy(dtype=float), minlength=self.HISTOGRAM_BINS)
+        return counts, np.asarray(self.metadata['histogram_edges'][risk_category])
+
+    def correlation(self, measures: list) -> pd.DataFrame:
+        """Pearson correlations of the correlation measures, each pair over the assets that have both."""
+        order = self.metadata['correlation_measures']
+        correlation = pd.DataFrame(np.nan, index=measures, columns=measures)
+        for first in measures:
+            for second in measures:
+                if first == second:
+                    # A measure correlates perfectly with itself unless it does not vary
+                    count = self.cells[f'{first}_count'].sum()
+                    deviation_sum = self.cells[f'{first}_sum'].sum()
+                    if count > 1 and self.cells[f'{first}_sumsq'].sum() - deviation_sum ** 2 / count > 0:
+                        correlation.loc[first, second] = 1.0
+                    continue
+
+                pair_names = ('first', 'second') if order.index(first) < order.index(second) else ('second', 'first')
+                pair = '__'.join(sorted([first, second], key=order.index))
+                count = self.cells[f'{pair}_count'].sum()
+                if count < 2:
+                    continue
+                sums = [self.cells[f'{pair}_{name}_sum'].sum() for name in pair_names]
+                variances = [self.cells[f'{pair}_{name}_sumsq'].sum() - total ** 2 / count for name, total in zip(pair_names, sums)]
+                covariance = self.cells[f'{pair}_product_sum'].sum() - sums[0] * sums[1] / count
+                if variances[0] > 0 and variances[1] > 0:
+                    # Clip the rounding of perfectly (anti)correlated measures
+                    correlation.loc[first, second] = np.clip(covariance / np.sqrt(variances[0] * variances[1]), -1.0, 1.0)
+        return correlation
+
+    def eol_horizon_crosstab(self, risk_category: str) -> pd.DataFrame:
+        """
+        Asset count of a risk category per company and EOL bucket, like eol_horizon_crosstab over
+        the per-asset data: companies with at least one bucketed asset, in sorted order.
+        """
+        cells = self.cells[
+            self._cells_of(risk_category)
+            & (self.cells['company'] < len(self.labels['company']) - 1).to_numpy()
+            & (self.cells['eol_bucket'] < len(self.labels['eol_bucket']) - 1).to_numpy()
+        ]
+        num_buckets = len(self.labels['eol_bucket']) - 1
+        kept_companies, company_codes = np.unique(cells['company'].to_numpy(), return_inverse=True)
+        counts = np.bincount(
+            company_codes * num_buckets + cells['eol_bucket'].to_numpy(),
+            weights=cells['asset_count'].to_numpy(dtype=float),
+            minlength=len(kept_companies) * num_buckets,
+        ).reshape(len(kept_companies), num_buckets).astype(np.int64)
+        return pd.DataFrame(
+            counts,
+            index=pd.Index(np.asarray(self.labels['company'], dtype=object)[kept_companies], name='company'),
+            columns=self.labels['eol_bucket'][:-1],
+        )
+
+    def to_bytes(self) -> bytes:
+        """Serialize the cube as a zip of one CSV per table and a JSON manifest."""
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+            manifest = {'version': self.CUBE_VERSION, 'labels': self.labels, **self.metadata}
+            archive.writestr(self.MANIFEST_NAME, json.dumps(manifest, indent=2, default=str))
+            # Floats are written with full precision, so sums survive the round trip exactly
+            archive.writestr(self.CELLS_NAME, self.cells.to_csv(index=False))
+            archive.writestr(self.HISTOGRAMS_NAME, self.histograms.to_csv(index=False))
+            archive.writestr(self.TOP_ASSETS_NAME, self.top_assets.to_csv(index=False))
+        return buffer.getvalue()
+
+    @classmethod
+    def from_bytes(cls, data) -> 'SummaryCube':
+        with zipfile.ZipFile(io.BytesIO(data)) as archive:
+            manifest = json.loads(archive.read(cls.MANIFEST_NAME))
+            if manifest.pop('version') != cls.CUBE_VERSION:
+                raise ValueError("Unsupported summary cube version.")
+            labels = manifest.pop('labels')
+
+            with archive.open(cls.CELLS_NAME) as cells_file:
+                cells = pd.read_csv(cells_file, float_precision='round_trip')
+            with archive.open(cls.HISTOGRAMS_NAME) as histograms_file:
+                histograms = pd.read_csv(histograms_file)
+            with archive.open(cls.TOP_ASSETS_NAME) as top_assets_file:
+                top_assets = pd.read_csv(top_assets_file, float_precision='round_trip')
+
+        return cls(labels, cells, histograms, top_assets, manifest)
+
+    def save(self, storage, blob_name: str = SUMMARY_CUBE_BLOB):
+        writer = storage.open_writer(blob_name)
+        writer.write(self.to_bytes())
+        writer.commit('application/zip')
+
+    @classmethod
+    def load(cls, storage, blob_name: str = SUMMARY_CUBE_BLOB):
+        """Load the cube saved at blob_name, or None when no cube has been stored there."""
+        if blob_name not in storage.list_blobs(blob_name):
+            return None
+        return cls.from_bytes(bytes(storage.read_bytes(blob_name)))
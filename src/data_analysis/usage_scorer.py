@@ -1,10 +1,17 @@
 import pandas as pd
 import numpy as np
 
+from src.data_analysis.aggregates import aggregate_per_asset, combine_aggregates
+
 class UsageScorer:
     # Class attribute for weights
     WEIGHTS = np.array([0.35, 0.35, 0.2, 0.1])  # Ensure the sum of weights is 1
 
+    # Usage metric columns, in the order of WEIGHTS
+    USAGE_COLUMNS = ['CPU Usage (%)', 'Memory Usage (%)', 'Disk Usage (%)', 'Network Throughput (Mbps)']
+    # Short names of the usage columns in the per-asset aggregates
+    AGGREGATE_KEYS = ['cpu', 'memory', 'disk', 'network']
+
     def calculate_min_max(self, hw_server_usage, columns):
         """Calculate min and max for a given list of columns."""
         mins = hw_server_usage[columns].min().values
@@ -18,50 +25,81 @@ class UsageScorer:
             normalized = (array - min_val) / (max_val - min_val) * 100
         return normalized
 
-    def _calculate_weighted_scores(self, group, mins, maxs):
-        """Calculate weighted scores for a given group of hardware assets."""
-        cpu_usage = group['CPU Usage (%)'].to_numpy()
-        memory_usage = group['Memory Usage (%)'].to_numpy()
-        disk_usage = group['Disk Usage (%)'].to_numpy()
-        network_throughput = group['Network Throughput (Mbps)'].to_numpy()
-
-        # Calculate weighted scores
-        weighted_cpu = self.WEIGHTS[0] * np.mean(self.normalize_array(cpu_usage, 0, 100))
-        weighted_memory = self.WEIGHTS[1] * np.mean(self.normalize_array(memory_usage, 0, 100))
-        weighted_disk = self.WEIGHTS[2] * np.mean(self.normalize_array(disk_usage, 0, 100))
-        weighted_network = self.WEIGHTS[3] * np.mean(self.normalize_array(network_throughput, mins[0], maxs[0]))
-
-        # Compute the composite score
-        composite_score = weighted_cpu + weighted_memory + weighted_disk + weighted_network
-
-        return {
-            'hardware_asset_id': group['hardware_asset_id'].iloc[0],
-            'w_cpu_usage': weighted_cpu,
-            'w_memory_usage': weighted_memory,
-            'w_disk_usage': weighted_disk,
-            'w_network_bandwidth': weighted_network,
-            'overall_usage_score': composite_score
-        }
+    def _normalization_bounds(self, network_min, network_max):
+        """Normalization range of each usage column: percentages are fixed, network uses its observed range."""
+        return [(0, 100), (0, 100), (0, 100), (network_min, network_max)]
+
+    def _build_usage_scores(self, asset_ids, normalized_means):
+        """Weight the per-asset means of the normalized metrics and derive the overall and relative scores."""
+        weighted = normalized_means * self.WEIGHTS
+
+        results_df = pd.DataFrame({
+            'hardware_asset_id': asset_ids,
+            'w_cpu_usage': weighted[:, 0],
+            'w_memory_usage': weighted[:, 1],
+            'w_disk_usage': weighted[:, 2],
+            'w_network_bandwidth': weighted[:, 3],
+            # The composite score is the weighted sum of the metric means
+            'overall_usage_score': normalized_means @ self.WEIGHTS,
+        })
 
-    def calculate_weighted_usage_scores(self, hw_server_usage):
-        """Calculate weighted usage scores based on CPU, memory, IO wait, and network bandwidth."""
-        grouped = hw_server_usage.groupby('hardware_asset_id')
-        mins, maxs = self.calculate_min_max(hw_server_usage, ['Network Throughput (Mbps)']) 
-
-        # Initialize a list to store results
-        results = []
-
-        for asset_id, group in grouped:
-            result = self._calculate_weighted_scores(group, mins, maxs)
-            results.append(result)
-        
-        # Convert results to DataFrame
-        results_df = pd.DataFrame(results)
         mins_ous, maxs_ous = self.calculate_min_max(results_df,['overall_usage_score'])
-        # n_usage_score 
+        # n_usage_score
         results_df['n_usage_score'] = (results_df['overall_usage_score']) / (maxs_ous[0])
-        
-        return  results_df
+
+        return results_df
+
+    def calculate_weighted_usage_scores(self, hw_server_usage):
+        """Calculate weighted usage scores based on CPU, memory, IO wait, and network bandwidth."""
+        return self.calculate_weighted_usage_scores_from_aggregates(self.usage_aggregates(hw_server_usage))
+
+    def usage_aggregates(self, hw_server_usage):
+        """
+        Per-asset aggregates of a batch of usage rows: metric sums, non-missing counts and row
+        counts, plus the asset's network min/max. Batches combine with combine_aggregates.
+        """
+        values = {key: hw_server_usage[column].to_numpy(dtype=float) for key, column in zip(self.AGGREGATE_KEYS, self.USAGE_COLUMNS)}
+
+        aggregations = {f'{key}_sum': (values[key], 'sum') for key in self.AGGREGATE_KEYS}
+        aggregations.update({f'{key}_count': (values[key], 'count') for key in self.AGGREGATE_KEYS})
+        aggregations['row_count'] = (None, 'size')
+        aggregations['network_min'] = (values['network'], 'min')
+        aggregations['network_max'] = (values['network'], 'max')
+        return aggregate_per_asset(hw_server_usage['hardware_asset_id'], aggregations, 'hardware_asset_id')
+
+    def calculate_weighted_usage_scores_from_aggregates(self, aggregates):
+        """Calculate the weighted usage scores from per-asset aggregates (see usage_aggregates)."""
+        aggregates = aggregates.sort_index()
+        row_counts = aggregates[['row_count']].to_numpy()
+        sums = aggregates[[f'{key}_sum' for key in self.AGGREGATE_KEYS]].to_numpy(dtype=float)
+        counts = aggregates[[f'{key}_count' for key in self.AGGREGATE_KEYS]].to_numpy()
+
+        # np.mean over an asset's rows is NaN as soon as one value is missing
+        means = np.where(counts < row_counts, np.nan, sums / row_counts)
+
+        # Normalization is linear, so normalizing the per-asset means equals the mean of normalized rows
+        bounds = self._normalization_bounds(aggregates['network_min'].min(), aggregates['network_max'].max())
+        normalized_means = np.column_stack([
+            self.normalize_array(means[:, index], min_val, max_val)
+            for index, (min_val, max_val) in enumerate(bounds)
+        ])
+
+        return self._build_usage_scores(aggregates.index.to_numpy(), normalized_means)
+
+    def calculate_weighted_usage_scores_chunked(self, usage_chunks):
+        """
+        Calculate the same weighted usage scores from an iterable of usage DataFrame chunks.
+        Only per-asset aggregates are kept, so memory is bounded by the number of assets rather
+        than the size of the telemetry.
+        """
+        aggregates = None
+        for chunk in usage_chunks:
+            aggregates = combine_aggregates([aggregates, self.usage_aggregates(chunk)])
+
+        if aggregates is None:
+            raise ValueError("No usage data was provided.")
+
+        return self.calculate_weighted_usage_scores_from_aggregates(aggregates)
 
     def add_weighted_usage_scores(self, hw_server_usage):
         """Add the weighted usage scores into the merged data."""
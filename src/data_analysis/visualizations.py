@@ -7,31 +7,68 @@ from src.utils.report_generator import PlotProcessor
 import seaborn as sns
 
 class ReportPlotter:
-    def __init__(self, df, html_content_list, OpenAIModel,plot_processor):
+    # Columns of the summarized asset scores used across all plots
+    REQUIRED_COLUMNS = [
+        'hardware_asset_id', 'risk_category', 'composite_stability_score', 'zscore_composite_stability',
+        'w_cpu_usage', 'w_memory_usage', 'w_disk_usage', 'w_network_bandwidth',
+        'overall_usage_score', 'overall_incident_score', 'maintenance_score',
+        'overall_maintenance_score', 'overall_vulnerability_score'
+    ]
+
+    # Columns of the score correlation heatmap
+    HEATMAP_COLUMNS = [
+        'overall_usage_score', 'overall_incident_score', 'overall_maintenance_score', 'overall_vulnerability_score',
+        'composite_stability_score', 'zscore_composite_stability'
+    ]
+
+    def __init__(self, df, html_content_list, OpenAIModel,plot_processor, summary_cube=None):
+        # Plots are drawn from the summary cube when one is given, else from the per-asset scores in df
         self.df = df
+        self.summary_cube = summary_cube
         self.html_content_list = html_content_list
         self.OpenAIModel = OpenAIModel
         self.plot_processor = plot_processor 
 
+    def _score_histogram(self, risk_category: str) -> tuple:
+        """(counts, edges, mean) of the composite stability scores of a risk category, in 20 bins."""
+        if self.summary_cube is not None:
+            counts, edges = self.summary_cube.histogram(risk_category)
+            return counts, edges, self.summary_cube.means(['composite_stability_score'], risk_category).iloc[0]
+        scores = self.df.loc[self.df['risk_category'] == risk_category, 'composite_stability_score']
+        counts, edges = np.histogram(scores, bins=20)
+        return counts, edges, scores.mean()
+
+    def _category_means(self, columns: list, risk_category: str) -> pd.Series:
+        """Mean of each column over the assets of a risk category."""
+        if self.summary_cube is not None:
+            return self.summary_cube.means(columns, risk_category)
+        return self.df.loc[self.df['risk_category'] == risk_category, columns].mean()
+
+    def _require_columns(self, columns: list, message: str):
+        """Per-asset scores must have the columns a plot reads; a summary cube always has them."""
+        if self.summary_cube is None and not all(column in self.df.columns for column in columns):
+            raise ValueError(message)
+
     def plot_stability_histograms_with_lines(self):
         """
         Creates histograms showing the distribution of Composite Stability Scores for
         Low Risk, Moderate Risk, and High Risk groups with lines indicating mean values.
         """
-        if 'composite_stability_score' not in self.df.columns or 'risk_category' not in self.df.columns:
-            raise ValueError("DataFrame must contain 'composite_stability_score' and 'risk_category' columns.")
+        self._require_columns(
+            ['composite_stability_score', 'risk_category'],
+            "DataFrame must contain 'composite_stability_score' and 'risk_category' columns."
+        )
 
-        # Separate groups based on risk categories
-        low_risk_df = self.df[self.df['risk_category'] == 'Low Risk']
-        moderate_risk_df = self.df[self.df['risk_category'] == 'Moderate Risk']
-        high_risk_df = self.df[self.df['risk_category'] == 'High Risk']
+        # Binned scores of each risk category
+        low_counts, low_edges, mean_low = self._score_histogram('Low Risk')
+        moderate_counts, moderate_edges, mean_moderate = self._score_histogram('Moderate Risk')
+        high_counts, high_edges, mean_high = self._score_histogram('High Risk')
 
         fig = plt.figure(figsize=(18, 6))
 
         # Low Risk group
         plt.subplot(1, 3, 1)
-        plt.hist(low_risk_df['composite_stability_score'], bins=20, color='blue', alpha=0.7)
-        mean_low = low_risk_df['composite_stability_score'].mean()
+        plt.hist(low_edges[:-1], bins=low_edges, weights=low_counts, color='blue', alpha=0.7)
         plt.axvline(mean_low, color='darkblue', linestyle='dashed', linewidth=2, label='Mean')
         plt.title('Low Risk: Composite Stability Scores')
         plt.xlabel('Composite Stability Score')
@@ -41,8 +78,7 @@ class ReportPlotter:
 
         # Moderate Risk group
         plt.subplot(1, 3, 2)
-        plt.hist(moderate_risk_df['composite_stability_score'], bins=20, color='orange', alpha=0.7)
-        mean_moderate = moderate_risk_df['composite_stability_score'].mean()
+        plt.hist(moderate_edges[:-1], bins=moderate_edges, weights=moderate_counts, color='orange', alpha=0.7)
         plt.axvline(mean_moderate, color='darkorange', linestyle='dashed', linewidth=2, label='Mean')
         plt.title('Moderate Risk: Composite Stability Scores')
         plt.xlabel('Composite Stability Score')
@@ -52,8 +88,7 @@ class ReportPlotter:
 
         # High Risk group
         plt.subplot(1, 3, 3)
-        plt.hist(high_risk_df['composite_stability_score'], bins=20, color='red', alpha=0.7)
-        mean_high = high_risk_df['composite_stability_score'].mean()
+        plt.hist(high_edges[:-1], bins=high_edges, weights=high_counts, color='red', alpha=0.7)
         plt.axvline(mean_high, color='darkred', linestyle='dashed', linewidth=2, label='Mean')
         plt.title('High Risk: Composite Stability Scores')
         plt.xlabel('Composite Stability Score')
@@ -70,14 +105,15 @@ class ReportPlotter:
         scores between Low Risk and High Risk groups.
         """
         required_columns = ['overall_usage_score', 'overall_incident_score', 'maintenance_score', 'risk_category']
-        if not all(col in self.df.columns for col in required_columns):
-            raise ValueError("DataFrame must contain 'overall_usage_score', 'overall_incident_score', 'maintenance_score', and 'risk_category' columns.")
+        self._require_columns(
+            required_columns,
+            "DataFrame must contain 'overall_usage_score', 'overall_incident_score', 'maintenance_score', and 'risk_category' columns."
+        )
 
-        averages = self.df[self.df['risk_category'].isin(['Low Risk', 'High Risk'])].groupby('risk_category').agg({
-            'overall_usage_score': 'mean',
-            'overall_incident_score': 'mean',
-            'maintenance_score': 'mean'
-        }).reset_index()
+        averages = pd.DataFrame([
+            self._category_means(required_columns[:-1], risk_category).rename(risk_category)
+            for risk_category in ['Low Risk', 'High Risk']
+        ]).rename_axis('risk_category').reset_index()
 
         fig = plt.figure(figsize=(10, 6))
         bar_width = 0.25
@@ -106,11 +142,10 @@ class ReportPlotter:
         
         # metrics = ['overall_usage_score', 'overall_incident_score', 'overall_maintenance_score','overall_vulnerability_score']
 
-        if not all(metric in self.df.columns for metric in metrics):
-            raise ValueError("DataFrame must contain all specified metrics.")
+        self._require_columns(metrics, "DataFrame must contain all specified metrics.")
 
-        low_risk_data = self.df[self.df['risk_category'] == 'Low Risk'][metrics].mean().values
-        high_risk_data = self.df[self.df['risk_category'] == 'High Risk'][metrics].mean().values
+        low_risk_data = self._category_means(metrics, 'Low Risk').values
+        high_risk_data = self._category_means(metrics, 'High Risk').values
 
         num_vars = len(metrics)
         angles = np.linspace(0, 2 * np.pi, num_vars, endpoint=False).tolist()
@@ -133,7 +168,12 @@ class ReportPlotter:
 
     def plot_risk_category_distribution(self):
         """Plot a pie chart to visualize the distribution of incident risk categories."""
-        risk_distribution = self.df['risk_category'].value_counts()
+        if self.summary_cube is not None:
+            risk_distribution = self.summary_cube.risk_category_counts().sort_values(ascending=False, kind='stable')
+        else:
+            risk_distribution = self.df['risk_category'].value_counts()
+        # A categorical column also counts the categories no asset falls in
+        risk_distribution = risk_distribution[risk_distribution > 0]
         colors = plt.get_cmap('Set3').colors
 
         fig, ax = plt.subplots(figsize=(7, 7))
@@ -147,11 +187,15 @@ class ReportPlotter:
 
     def plot_top_high_risk_assets(self):
 
-        # Filter for high-risk assets
-        high_risk_assets = self.df[self.df['risk_category'] == 'High Risk']
+        if self.summary_cube is not None:
+            # The cube keeps the high-risk assets with the highest z-scores, highest first
+            top_high_risk = self.summary_cube.top_assets
+        else:
+            # Filter for high-risk assets
+            high_risk_assets = self.df[self.df['risk_category'] == 'High Risk']
 
-        # Sort by composite stability score (descending) and get the top 10
-        top_high_risk = high_risk_assets.sort_values(by='zscore_composite_stability', ascending=False).head(10)
+            # Sort by composite stability score (descending) and get the top 10
+            top_high_risk = high_risk_assets.sort_values(by='zscore_composite_stability', ascending=False).head(10)
 
         # Create a color map
         colors = plt.cm.viridis(np.linspace(0, 1, len(top_high_risk)))
@@ -184,20 +228,12 @@ class ReportPlotter:
     
     def plot_heatmap_using_scores(self):
 
-        # Select relevant columns for the heatmap
-        heatmap_data = self.df[['hardware_asset_id',
-                            'overall_usage_score',
-                            'overall_incident_score',
-                            'overall_maintenance_score',
-                            'overall_vulnerability_score',
-                            'composite_stability_score',
-                            'zscore_composite_stability']]
-
-        # Set 'hardware_asset_id' as the index
-        heatmap_data.set_index('hardware_asset_id', inplace=True)
-
-        # Compute the correlation matrix
-        correlation_matrix = heatmap_data.corr()
+        if self.summary_cube is not None:
+            # Correlations from the co-moments the cube keeps
+            correlation_matrix = self.summary_cube.correlation(self.HEATMAP_COLUMNS)
+        else:
+            # Select relevant columns for the heatmap and compute the correlation matrix
+            correlation_matrix = self.df[self.HEATMAP_COLUMNS].corr()
 
         # Create the heatmap
         fig, ax = plt.subplots(figsize=(10, 6))
@@ -2,6 +2,9 @@ import pandas as pd
 import numpy as np
 from datetime import datetime
 
+from src.data_analysis.aggregates import aggregate_per_asset
+from src.data_analysis.label_encoding import encode_labels, score_lookup
+
 
 class VulnerabilityScorer:
     VulnSeverityScoreDef = {'1': 1, '2': 2, '3': 3, '4': 4, '5': 5}
@@ -11,8 +14,18 @@ class VulnerabilityScorer:
     VulnDetTimesScoreDef = {'Zero': 0, 'One': 1, 'LessThan5': 2, 'MoreThan5': 3}
     VulnPatchScoreDef = {'Yes': 0, 'No': 5}
 
-    def __init__(self, df):
+    # Bucket labels, indexed by the codes the bucketing helpers return
+    PatchReleasedLabels = ['NoPatch', 'Future', 'Within30days', 'Morethan30days']
+    DetAgeLabels = ['NoDays', '7days', '30days', '60days', 'Morethan60days']
+    DetTimesLabels = ['Zero', 'One', 'LessThan5', 'MoreThan5']
+
+    # Score components, each stored per vulnerability as vulnerability_<component>_score
+    SCORE_COMPONENTS = ['severity', 'patchReleased', 'status', 'detectedAge', 'detectedTimes', 'patch']
+
+    def __init__(self, df, reference_time=None):
         self.df = df
+        # Patch ages are measured against one instant, so every row of a run sees the same "now"
+        self.reference_time = pd.Timestamp(reference_time) if reference_time is not None else None
 
     @staticmethod
     def calculate_minmax(df, minmaxcols):
@@ -30,76 +43,104 @@ class VulnerabilityScorer:
 
         return mins, maxs
 
-    def _fn_patch(self, dt):
-        """Categorize patch based on release date."""
-        if pd.isna(dt):
-            return 'NoPatch'
-
-        now = pd.Timestamp(datetime.now())
-        dt2 = pd.to_datetime(dt, format='%d-%b-%y')
-
-        result = (
-            "Future" if (now - dt2).days < 0 else
-            "Within30days" if (now - dt2).days <= 30 else
-            "Morethan30days"
-        )
-        return result
-
-    def _fn_det_age(self, dys):
-        """Categorize detection age."""
-        if pd.isna(dys):
-            return 'NoDays'
-
-        result = (
-            "7days" if dys <= 7 else
-            "30days" if dys <= 30 else
-            "60days" if dys <= 60 else
-            "Morethan60days"
-        )
-        return result
-
-    def _fn_det_times(self, cnt):
-        """Categorize detection times."""
-        if pd.isna(cnt):
-            return 'Zero'
-
-        result = (
-            "Zero" if cnt == 0 else
-            "One" if cnt <= 1 else
-            "LessThan5" if cnt <= 5 else
-            "MoreThan5"
-        )
-        return result
+    @staticmethod
+    def parse_patch_released(patch_released):
+        """Parse a 'Patch Released' column (e.g. '05-Mar-24') in one pass, unless it already holds dates."""
+        if pd.api.types.is_datetime64_any_dtype(patch_released):
+            return patch_released
+        return pd.to_datetime(patch_released, format='%d-%b-%y')
+
+    def _patch_released_codes(self, patch_released, reference_time):
+        """Bucket codes into PatchReleasedLabels, from one parse of the whole column."""
+        patch_released = self.parse_patch_released(patch_released)
+
+        # Whole days since release, floored like Timedelta.days; negative means a future release
+        days = (reference_time - patch_released).dt.days.to_numpy(dtype=float)
+        codes = np.searchsorted([-1, 30], days, side='left') + 1
+        codes[np.isnan(days)] = 0
+        return codes
+
+    @staticmethod
+    def _det_age_codes(detection_age):
+        """Bucket codes into DetAgeLabels: up to 7, 30, 60 days, or older."""
+        values = pd.to_numeric(detection_age).to_numpy(dtype=float)
+        codes = np.searchsorted([7, 30, 60], values, side='left') + 1
+        codes[np.isnan(values)] = 0
+        return codes
+
+    @staticmethod
+    def _det_times_codes(times_detected):
+        """Bucket codes into DetTimesLabels: never (or unknown), once, up to 5 times, or more."""
+        values = pd.to_numeric(times_detected).to_numpy(dtype=float)
+        codes = np.searchsorted([1, 5], values, side='left') + 1
+        codes[(values == 0) | np.isnan(values)] = 0
+        return codes
+
+    @staticmethod
+    def _lookup_scores(codes, labels, score_def):
+        """Map bucket codes to their scores; labels without a score definition score 0."""
+        return np.array([score_def.get(label, 0) for label in labels])[codes]
 
     def add_score_def_columns(self):
         """Add calculated score definition columns to the dataframe."""
-        self.df['v_severity'] = self.df['Severity']
-        self.df['v_patchReleaseDt'] = self.df['Patch Released'].apply(self._fn_patch)
-        self.df['v_detAge'] = self.df['Detection AGE'].apply(self._fn_det_age)
-        self.df['v_detTimes'] = self.df['Times Detected'].apply(self._fn_det_times)
+        reference_time = self.reference_time if self.reference_time is not None else pd.Timestamp(datetime.now())
 
-    def calculate_vulnerability_stability(self):
-        """Calculate the overall vulnerability score and stability."""
-       
+        self._patch_released_code = self._patch_released_codes(self.df['Patch Released'], reference_time)
+        self._det_age_code = self._det_age_codes(self.df['Detection AGE'])
+        self._det_times_code = self._det_times_codes(self.df['Times Detected'])
+
+        self.df['v_severity'] = self.df['Severity']
+        # Bucket labels stay encoded as their codes
+        self.df['v_patchReleaseDt'] = pd.Categorical.from_codes(self._patch_released_code, categories=self.PatchReleasedLabels)
+        self.df['v_detAge'] = pd.Categorical.from_codes(self._det_age_code, categories=self.DetAgeLabels)
+        self.df['v_detTimes'] = pd.Categorical.from_codes(self._det_times_code, categories=self.DetTimesLabels)
+
+    def patch_released_scores(self, patch_released, reference_time):
+        """
+        Patch release scores at reference_time, and whether each score is settled: no patch, or
+        a release more than 30 days old, keeps its score however much later the reference time is.
+        """
+        codes = self._patch_released_codes(patch_released, pd.Timestamp(reference_time))
+        settled = np.isin(codes, [self.PatchReleasedLabels.index('NoPatch'), self.PatchReleasedLabels.index('Morethan30days')])
+        return self._lookup_scores(codes, self.PatchReleasedLabels, self.VulnPatchReleasedDaysScoreDef), settled
+
+    def add_score_columns(self):
+        """Add the individual score components of every vulnerability to the dataframe."""
         self.add_score_def_columns()
 
-        # Add individual score components to the dataframe
         self.df['vulnerability_severity_score'] = self.df['v_severity']
-        self.df['vulnerability_patchReleased_score'] = self.df.apply(lambda row: self.VulnPatchReleasedDaysScoreDef.get(row['v_patchReleaseDt'], 0), axis=1)
-        self.df['vulnerability_status_score'] = self.df.apply(lambda row: self.VulnStatusScoreDef.get(row['Status'], 0), axis=1)
-        self.df['vulnerability_detectedAge_score'] = self.df.apply(lambda row: self.VulnDetAgeScoreDef.get(row['v_detAge'], 0), axis=1)
-        self.df['vulnerability_detectedTimes_score'] = self.df.apply(lambda row: self.VulnDetTimesScoreDef.get(row['v_detTimes'], 0), axis=1)
-        self.df['vulnerability_patch_score'] = self.df.apply(lambda row: self.VulnPatchScoreDef.get(row['Vuln Patchable'], 0), axis=1)
-        
-        aggregated_df = self.df.groupby('asset_id').agg(
-           vulnerability_severity_score=('vulnerability_severity_score', 'mean'),
-           vulnerability_patchReleased_score=('vulnerability_patchReleased_score', 'mean'),
-           vulnerability_status_score=('vulnerability_status_score', 'mean'),
-           vulnerability_detectedAge_score=('vulnerability_detectedAge_score', 'mean'),
-           vulnerability_detectedTimes_score=('vulnerability_detectedTimes_score', 'mean'),
-           vulnerability_patch_score=('vulnerability_patch_score', 'mean'),
-           vulnerability_count=('asset_id', 'size')  
-        ).reset_index()
+        self.df['vulnerability_patchReleased_score'] = self._lookup_scores(self._patch_released_code, self.PatchReleasedLabels, self.VulnPatchReleasedDaysScoreDef)
+        self.df['vulnerability_status_score'] = score_lookup(encode_labels(self.df['Status']), self.VulnStatusScoreDef)
+        self.df['vulnerability_detectedAge_score'] = self._lookup_scores(self._det_age_code, self.DetAgeLabels, self.VulnDetAgeScoreDef)
+        self.df['vulnerability_detectedTimes_score'] = self._lookup_scores(self._det_times_code, self.DetTimesLabels, self.VulnDetTimesScoreDef)
+        self.df['vulnerability_patch_score'] = score_lookup(encode_labels(self.df['Vuln Patchable']), self.VulnPatchScoreDef)
+
+    def vulnerability_aggregates(self):
+        """
+        Per-asset sums of every score component, the count of known severities (the only component
+        that can be missing) and the vulnerability count. Batches combine by addition.
+        """
+        self.add_score_columns()
+
+        aggregations = {
+            f'{component}_sum': (self.df[f'vulnerability_{component}_score'], 'sum') for component in self.SCORE_COMPONENTS
+        }
+        aggregations['severity_count'] = (self.df['vulnerability_severity_score'], 'count')
+        aggregations['vulnerability_count'] = (None, 'size')
+        return aggregate_per_asset(self.df['asset_id'], aggregations, 'asset_id')
+
+    @classmethod
+    def vulnerability_stability_from_aggregates(cls, aggregates):
+        """Per-asset vulnerability scores from vulnerability_aggregates, normalized by the largest score."""
+        aggregates = aggregates.sort_index()
+        vulnerability_count = aggregates['vulnerability_count']
+
+        aggregated_df = pd.DataFrame({'asset_id': aggregates.index.to_numpy()})
+        for component in cls.SCORE_COMPONENTS:
+            # Like a grouped mean, missing severities are left out of the severity mean
+            count = aggregates['severity_count'] if component == 'severity' else vulnerability_count
+            aggregated_df[f'vulnerability_{component}_score'] = (aggregates[f'{component}_sum'] / count).to_numpy()
+        aggregated_df['vulnerability_count'] = vulnerability_count.to_numpy()
 
         # Step 3: Calculate the overall vulnerability score by multiplying with the count of vulnerabilities
         aggregated_df['vulnerability_score'] = (
@@ -109,33 +150,43 @@ class VulnerabilityScorer:
                 aggregated_df['vulnerability_detectedAge_score'] +
                 aggregated_df['vulnerability_detectedTimes_score'] +
                 aggregated_df['vulnerability_patch_score']
-            ) * aggregated_df['vulnerability_count']  
+            ) * aggregated_df['vulnerability_count']
 
         # Step 4: Calculate the overall_vuln_score by normalizing vuln_score with max(vuln_score)
         max_vulnerability_score = aggregated_df['vulnerability_score'].max()
         aggregated_df['overall_vulnerability_score'] = aggregated_df['vulnerability_score'] / max_vulnerability_score
-    
+
         return aggregated_df
 
+    def calculate_vulnerability_stability(self):
+        """Calculate the overall vulnerability score and stability."""
+        return self.vulnerability_stability_from_aggregates(self.vulnerability_aggregates())
+
     def generate_vulnerability_summary(self):
         """Generate a summary of vulnerability scores per asset."""
-        grouped = self.df.groupby('asset_id')
-        
-        results = []
-        for asset_id, group in grouped:
-            results.append({
-                'asset_id': asset_id,
-                'vuln_count': np.mean(group['asset_id'].count()),
-                'vuln_severity_score': np.sum(group['VulnSeverityScore'].to_numpy()),
-                'vuln_patchReleased_score': np.sum(group['VulnPatchReleasedDaysScore'].to_numpy()),
-                'vuln_status_score': np.sum(group['VulnStatusScore'].to_numpy()),
-                'vuln_detectedAge_score': np.sum(group['VulnDetAgeScore'].to_numpy()),
-                'vuln_detectedTimes_score': np.sum(group['VulnDetTimesScore'].to_numpy()),
-                'vuln_patch_score': np.sum(group['VulnPatchScore'].to_numpy()),
-                'overall_vuln_score': np.sum(group['vuln_score'].to_numpy())
-            })
-
-        results_df = pd.DataFrame(results)
+        summed_columns = {
+            'vuln_severity_score': 'VulnSeverityScore',
+            'vuln_patchReleased_score': 'VulnPatchReleasedDaysScore',
+            'vuln_status_score': 'VulnStatusScore',
+            'vuln_detectedAge_score': 'VulnDetAgeScore',
+            'vuln_detectedTimes_score': 'VulnDetTimesScore',
+            'vuln_patch_score': 'VulnPatchScore',
+            'overall_vuln_score': 'vuln_score',
+        }
+        aggregations = {'vuln_count': (None, 'size')}
+        for summary_column, score_column in summed_columns.items():
+            aggregations[summary_column] = (self.df[score_column], 'sum')
+            aggregations[f'{summary_column}_count'] = (self.df[score_column], 'count')
+        aggregates = aggregate_per_asset(self.df['asset_id'], aggregations, 'asset_id')
+
+        results_df = aggregates[['vuln_count']].astype(float)
+        for summary_column in summed_columns:
+            # Like np.sum, a single missing score makes the asset's sum missing
+            results_df[summary_column] = aggregates[summary_column].where(
+                aggregates[f'{summary_column}_count'] == aggregates['vuln_count']
+            )
+        results_df = results_df.reset_index()
+
         mins_ovs, maxs_ovs = self.calculate_minmax(results_df, ['overall_vuln_score'])
         results_df['n_vuln_score'] = results_df['overall_vuln_score'] / maxs_ovs[0]
         return results_df
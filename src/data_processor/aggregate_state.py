@@ -0,0 +1,206 @@
+import io
+import json
+import zipfile
+import pandas as pd
+
+from src.data_analysis.aggregates import combine_aggregates
+from src.data_analysis.usage_scorer import UsageScorer
+from src.data_analysis.incident_scorer import IncidentScoring
+from src.data_analysis.vulnerability_scorer import VulnerabilityScorer
+from src.data_analysis.maintenance_scorer import MaintenanceAnalyzer
+
+
+class AssetAggregateState:
+    """
+    Persisted per-asset aggregates of every scorer (score sums, counts and min/max), so a run
+    folds in only the input partitions that arrived after each dataset's watermark and scores
+    every asset, global normalizers included, from the compact state instead of the full history.
+
+    Watermarks are the greatest partition blob name processed per dataset, so partitions must be
+    named to sort chronologically (e.g. 'hw_incidents_2024-05-01.csv').
+    """
+
+    STATE_VERSION = 1
+    MANIFEST_NAME = 'state.json'
+    PENDING_PATCH_RELEASES_NAME = 'pending_patch_releases.csv'
+
+    # Datasets of append-only records whose aggregates are kept, and the asset id of each
+    DATASET_ASSET_IDS = {
+        'usage': 'hardware_asset_id',
+        'incidents': 'hardware_asset_id',
+        'patch_upgrades': 'hardware_asset_id',
+        'vulnerabilities': 'asset_id',
+    }
+
+    def __init__(self, aggregates: dict = None, watermarks: dict = None, pending_patch_releases: pd.DataFrame = None):
+        self.aggregates = dict(aggregates or {})
+        self.watermarks = dict(watermarks or {})
+        # Vulnerabilities whose patch release score still changes as time passes (see update_vulnerabilities)
+        self.pending_patch_releases = (
+            pending_patch_releases if pending_patch_releases is not None else self._empty_pending_patch_releases()
+        )
+
+    @staticmethod
+    def _empty_pending_patch_releases() -> pd.DataFrame:
+        return pd.DataFrame({
+            'asset_id': pd.Series(dtype='object'),
+            'patch_released': pd.Series(dtype='datetime64[ns]'),
+        })
+
+    def reset(self, dataset: str):
+        """Forget everything folded in for a dataset."""
+        self.aggregates.pop(dataset, None)
+        self.watermarks.pop(dataset, None)
+        if dataset == 'vulnerabilities':
+            self.pending_patch_releases = self._empty_pending_patch_releases()
+
+    def new_partitions(self, dataset: str, blob_names: list, partitioned: bool) -> list:
+        """
+        The blobs of a dataset that still have to be folded in. A dataset read from one fixed blob
+        is a full snapshot rather than a partition, so its state is rebuilt from it on every run.
+        """
+        if not partitioned:
+            self.reset(dataset)
+            return list(blob_names)
+        watermark = self.watermarks.get(dataset)
+        return [blob_name for blob_name in blob_names if watermark is None or blob_name > watermark]
+
+    def advance_watermark(self, dataset: str, blob_names: list):
+        """Record the partitions of a dataset as folded in."""
+        if blob_names:
+            self.watermarks[dataset] = max([*blob_names, self.watermarks.get(dataset, '')])
+
+    def _combine(self, dataset: str, aggregates: pd.DataFrame):
+        self.aggregates[dataset] = combine_aggregates([self.aggregates.get(dataset), aggregates])
+
+    def _aggregates(self, dataset: str) -> pd.DataFrame:
+        if dataset not in self.aggregates:
+            raise ValueError(f"No {dataset} data has been folded into the aggregate state.")
+        return self.aggregates[dataset]
+
+    def update_usage(self, usage):
+        """Fold usage telemetry in; usage is a DataFrame or an iterable of DataFrame chunks."""
+        usage_chunks = [usage] if isinstance(usage, pd.DataFrame) else usage
+        usage_scorer = UsageScorer()
+        for usage_chunk in usage_chunks:
+            self._combine('usage', usage_scorer.usage_aggregates(usage_chunk))
+
+    def update_incidents(self, incidents: pd.DataFrame, severity_mapping: dict, impact_mapping: dict):
+        self._combine('incidents', IncidentScoring(incidents, None, severity_mapping, impact_mapping).incident_aggregates())
+
+    def update_patch_upgrades(self, patch_upgrades: pd.DataFrame):
+        self._combine('patch_upgrades', MaintenanceAnalyzer(patch_upgrades).maintenance_aggregates())
+
+    def update_vulnerabilities(self, vulnerabilities: pd.DataFrame, reference_time):
+        """
+        Fold vulnerabilities in. A patch released within the last 30 days, or announced for the
+        future, scores differently once time moves on, so those findings are kept aside with their
+        release date and re-scored on every run until they settle.
+        """
+        vulnerability_scorer = VulnerabilityScorer(vulnerabilities, reference_time)
+        aggregates = vulnerability_scorer.vulnerability_aggregates()
+
+        patch_released = VulnerabilityScorer.parse_patch_released(vulnerabilities['Patch Released'])
+        patch_released_scores, settled = vulnerability_scorer.patch_released_scores(patch_released, reference_time)
+        pending = pd.DataFrame({
+            'asset_id': vulnerabilities['asset_id'].to_numpy()[~settled],
+            'patch_released': patch_released.to_numpy()[~settled],
+        })
+
+        # Only settled patch release scores stay in the sums
+        unsettled_sums = pd.Series(patch_released_scores[~settled], index=pending['asset_id']).groupby(level=0).sum()
+        aggregates['patchReleased_sum'] = aggregates['patchReleased_sum'].sub(unsettled_sums, fill_value=0)
+
+        self._combine('vulnerabilities', aggregates)
+        self.pending_patch_releases = pd.concat([self.pending_patch_releases, pending], ignore_index=True)
+
+    def usage_scores(self) -> pd.DataFrame:
+        return UsageScorer().calculate_weighted_usage_scores_from_aggregates(self._aggregates('usage'))
+
+    def incident_scores(self) -> pd.DataFrame:
+        return IncidentScoring.incident_stability_from_aggregates(self._aggregates('incidents'))
+
+    def maintenance_scores(self) -> pd.DataFrame:
+        return MaintenanceAnalyzer.maintenance_scores_from_aggregates(self._aggregates('patch_upgrades'))
+
+    def vulnerability_scores(self, reference_time) -> pd.DataFrame:
+        """Vulnerability scores with every pending patch release scored at reference_time."""
+        aggregates = self._aggregates('vulnerabilities')
+        pending = self.pending_patch_releases
+        patch_released_scores, settled = VulnerabilityScorer(None).patch_released_scores(pending['patch_released'], reference_time)
+        scores_by_asset = pd.Series(patch_released_scores, index=pending['asset_id'])
+
+        # Findings whose patch is now more than 30 days old move into the settled sums for good
+        aggregates['patchReleased_sum'] = aggregates['patchReleased_sum'].add(
+            scores_by_asset[settled].groupby(level=0).sum(), fill_value=0
+        )
+        self.pending_patch_releases = pending[~settled].reset_index(drop=True)
+
+        current = aggregates.copy()
+        current['patchReleased_sum'] = current['patchReleased_sum'].add(
+            scores_by_asset[~settled].groupby(level=0).sum(), fill_value=0
+        )
+        return VulnerabilityScorer.vulnerability_stability_from_aggregates(current)
+
+    def to_bytes(self) -> bytes:
+        """Serialize the state as a zip of one CSV per table and a JSON manifest."""
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+            manifest = {
+                'version': self.STATE_VERSION,
+                'watermarks': self.watermarks,
+                'datasets': sorted(self.aggregates),
+            }
+            archive.writestr(self.MANIFEST_NAME, json.dumps(manifest, indent=2))
+            for dataset, aggregates in self.aggregates.items():
+                # Floats are written with full precision, so sums survive the round trip exactly
+                archive.writestr(f'{dataset}.csv', aggregates.to_csv(index_label='asset_id'))
+            archive.writestr(self.PENDING_PATCH_RELEASES_NAME, self.pending_patch_releases.to_csv(index=False))
+        return buffer.getvalue()
+
+    @classmethod
+    def from_bytes(cls, data) -> 'AssetAggregateState':
+        with zipfile.ZipFile(io.BytesIO(data)) as archive:
+            manifest = json.loads(archive.read(cls.MANIFEST_NAME))
+            if manifest['version'] != cls.STATE_VERSION:
+                raise ValueError(f"Unsupported aggregate state version {manifest['version']}.")
+
+            aggregates = {}
+            for dataset in manifest['datasets']:
+                with archive.open(f'{dataset}.csv') as table_file:
+                    table = cls._read_table(table_file, index_col='asset_id', float_precision='round_trip')
+                table.index.name = cls.DATASET_ASSET_IDS[dataset]
+                aggregates[dataset] = table
+
+            with archive.open(cls.PENDING_PATCH_RELEASES_NAME) as pending_file:
+                pending_patch_releases = cls._read_table(pending_file, parse_dates=['patch_released'])
+
+        return cls(aggregates, manifest['watermarks'], pending_patch_releases)
+
+    @staticmethod
+    def _read_table(table_file, **read_options) -> pd.DataFrame:
+        """
+        Read a state table keeping every asset id verbatim, so ids such as 'NA', 'null' or '' are
+        not mistaken for missing values; in the other columns an empty field is a missing value.
+        """
+        data = table_file.read()
+        header = pd.read_csv(io.BytesIO(data), nrows=0).columns
+        return pd.read_csv(
+            io.BytesIO(data),
+            dtype={'asset_id': str},
+            keep_default_na=False,
+            na_values={column: [''] for column in header if column != 'asset_id'},
+            **read_options,
+        )
+
+    def save(self, storage, blob_name: str):
+        writer = storage.open_writer(blob_name)
+        writer.write(self.to_bytes())
+        writer.commit('application/zip')
+
+    @classmethod
+    def load(cls, storage, blob_name: str) -> 'AssetAggregateState':
+        """Load the state saved at blob_name, or start an empty one on the first run."""
+        if blob_name not in storage.list_blobs(blob_name):
+            return cls()
+        return cls.from_bytes(bytes(storage.read_bytes(blob_name)))
@@ -0,0 +1,54 @@
+import numpy as np
+import pandas as pd
+
+# Index name of frames keyed by asset code
+ASSET_CODE = 'asset_code'
+
+
+class AssetIndex:
+    """
+    The fleet's asset ids interned once, from the server inventory, as dense integer codes
+    0..n-1 in inventory order. Frames keyed by code line up with each other by array indexing
+    instead of hash joins on the string ids.
+    """
+
+    def __init__(self, asset_ids):
+        self.asset_ids = pd.Index(pd.unique(np.asarray(asset_ids, dtype=object)))
+
+    @classmethod
+    def from_servers(cls, hw_server: pd.DataFrame) -> 'AssetIndex':
+        return cls(hw_server['hardware_asset_id'])
+
+    def __len__(self) -> int:
+        return len(self.asset_ids)
+
+    def encode(self, asset_ids) -> np.ndarray:
+        """Code of every asset id; -1 for ids that are not in the inventory."""
+        return self.asset_ids.get_indexer(asset_ids)
+
+    def key_by_code(self, df: pd.DataFrame, asset_column: str) -> pd.DataFrame:
+        """A shallow copy of a per-asset frame indexed by the code of its asset id column."""
+        keyed = df.copy(deep=False)
+        keyed.index = pd.Index(self.encode(df[asset_column]), name=ASSET_CODE)
+        return keyed
+
+    def align(self, df_by_code: pd.DataFrame, codes: np.ndarray) -> pd.DataFrame:
+        """
+        The row of a frame keyed by unique codes for each of codes, like a left join on them:
+        codes without a row get missing values, promoting integer columns to float.
+        """
+        # Code -1 picks the trailing slot, which has no row either
+        row_of_code = np.full(len(self) + 1, -1, dtype=np.intp)
+        row_of_code[df_by_code.index.to_numpy()] = np.arange(len(df_by_code))
+        rows = row_of_code[codes]
+
+        aligned = {}
+        for column in df_by_code.columns:
+            values = df_by_code[column]
+            values = values.array if pd.api.types.is_extension_array_dtype(values.dtype) else values.to_numpy()
+            aligned[column] = pd.api.extensions.take(values, rows, allow_fill=True)
+        return pd.DataFrame(aligned, columns=df_by_code.columns)
+
+    def lookup(self, asset_ids, values_by_code: np.ndarray, fill_value=np.nan) -> np.ndarray:
+        """Per-asset values (one per code) looked up for each asset id; fill_value for unknown ids."""
+        return np.append(values_by_code, np.array([fill_value], dtype=values_by_code.dtype))[self.encode(asset_ids)]
@@ -1,18 +1,257 @@
+import os
+import re
+import glob
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 import pandas as pd
 
+from src.data_analysis.label_encoding import encode_label_columns
+
+try:
+    import pyarrow  # noqa: F401
+    CSV_ENGINE = 'pyarrow'
+except ImportError:
+    CSV_ENGINE = 'c'
+
+logger = logging.getLogger(__name__)
+
+# Worker processes used to parse partition files in parallel
+LOAD_WORKERS = int(os.getenv('LOAD_WORKERS', str(os.cpu_count() or 1)))
+
+# Warranty columns loaded: 'all' (default) passes every warranty column through to the summarized
+# scores; 'dates' keeps only the asset id and the end-of-life dates, dropping the rest from the summary
+WARRANTY_COLUMNS = os.getenv('WARRANTY_COLUMNS', 'all').lower()
+WARRANTY_COLUMN_OPTIONS = ['all', 'dates']
+
+# Byte-order marks that show up in exported headers once decoded as ISO-8859-1
+HEADER_BOMS = ['ï»¿', '\ufeff']
+
+# Columns each dataset needs and how they are typed. 'dtypes' are applied while parsing,
+# 'dates' are parsed afterwards with the given format (None lets pandas infer it) and a value
+# that does not parse is an error, except in the 'lenient_dates' columns, where it counts as no
+# date and is logged. With 'passthrough' every other column of the file is loaded as well.
+# Low-cardinality label columns are read as categories; those listed under 'lowercase' are
+# matched case-insensitively by the scorers and have their categories folded to lower case.
+# Columns missing from a file are skipped; the scorers report the ones they require.
+DATASET_SCHEMAS = {
+    'usage': {
+        'dtypes': {
+            'hardware_asset_id': 'object',
+            'CPU Usage (%)': 'float64',
+            'Memory Usage (%)': 'float64',
+            'Disk Usage (%)': 'float64',
+            'Network Throughput (Mbps)': 'float64',
+        },
+        'dates': {},
+    },
+    'incidents': {
+        'dtypes': {
+            'hardware_asset_id': 'object',
+            'number': 'object',
+            'severity': 'category',
+            'impact': 'category',
+            'u_event_severity': 'category',
+        },
+        'dates': {},
+        'lowercase': ['severity', 'impact'],
+    },
+    'patch_upgrades': {
+        'dtypes': {
+            'hardware_asset_id': 'object',
+            'maintenance_status': 'category',
+            'maintenance_score': 'float64',
+        },
+        'dates': {},
+    },
+    'warranty': {
+        'dtypes': {
+            'hardware_asset_id': 'object',
+        },
+        'dates': {
+            'end_of_life_date': None,
+            'end_of_sale_date': None,
+            'end_of_support_date': None,
+            'end_of_extended_support_date': None,
+        },
+        # Warranty dates only ever decide EOL buckets, where an unreadable date is an unknown one
+        'lenient_dates': ['end_of_life_date', 'end_of_sale_date', 'end_of_support_date', 'end_of_extended_support_date'],
+        # The warranty's other columns (e.g. vendor) are published with the summarized scores
+        'passthrough': WARRANTY_COLUMNS == 'all',
+    },
+    'servers': {
+        'dtypes': {
+            'hardware_asset_id': 'object',
+            'company': 'object',
+        },
+        'dates': {},
+    },
+    'vulnerabilities': {
+        'dtypes': {
+            'asset_id': 'object',
+            'Severity': 'float64',
+            'Status': 'category',
+            'Detection AGE': 'float64',
+            'Times Detected': 'float64',
+            'Vuln Patchable': 'category',
+        },
+        'dates': {
+            'Patch Released': '%d-%b-%y',
+        },
+    },
+}
+
+
 class DataLoader:
     @staticmethod
-    def load_csv(file_path: str) -> pd.DataFrame:
-        """Load a CSV file into a DataFrame."""
+    def _clean_column_name(column: str) -> str:
+        for bom in HEADER_BOMS:
+            column = column.replace(bom, '')
+        return column
+
+    @staticmethod
+    def _schema_read_options(file_path: str, schema: dict) -> dict:
+        """Map the schema's clean column names onto the file header and build the read_csv dtypes."""
+        header = pd.read_csv(file_path, encoding='ISO-8859-1', nrows=0).columns
+        raw_names = {DataLoader._clean_column_name(column): column for column in header}
+
+        # Dates are read as text and parsed with their known format afterwards
+        wanted_dtypes = dict(schema['dtypes'])
+        wanted_dtypes.update({column: 'object' for column in schema['dates']})
+        dtypes = {raw_names[column]: dtype for column, dtype in wanted_dtypes.items() if column in raw_names}
+
+        # Passed-through columns are typed by the parser, as a plain read_csv would
+        usecols = list(header) if schema.get('passthrough') else list(dtypes)
+        return {'encoding': 'ISO-8859-1', 'usecols': usecols, 'dtype': dtypes}
+
+    @staticmethod
+    def _apply_schema(df: pd.DataFrame, schema: dict) -> pd.DataFrame:
+        """Clean the header, parse the schema's date columns and fold its case-insensitive labels."""
+        df.columns = [DataLoader._clean_column_name(column) for column in df.columns]
+        encode_label_columns(df, schema.get('lowercase', []))
+
+        lenient_dates = schema.get('lenient_dates', [])
+        for column, date_format in schema['dates'].items():
+            if column not in df.columns:
+                continue
+            if column not in lenient_dates:
+                df[column] = pd.to_datetime(df[column], format=date_format)
+                continue
+
+            parsed = pd.to_datetime(df[column], format=date_format, errors='coerce')
+            unparsed = int((parsed.isna() & df[column].notna()).sum())
+            if unparsed:
+                logger.warning(f"{unparsed} of {len(df)} '{column}' values are not dates and are treated as missing")
+            df[column] = parsed
+
+        return df
+
+    @staticmethod
+    def _read_with_schema(file_path: str, schema: dict) -> pd.DataFrame:
+        """Read only the schema's columns with explicit dtypes, then parse its date columns."""
+        read_options = DataLoader._schema_read_options(file_path, schema)
+        if schema.get('passthrough'):
+            # Passed-through columns get the C parser's type inference, which the pyarrow engine does not share
+            df = pd.read_csv(file_path, engine='c', low_memory=False, **read_options)
+        else:
+            df = pd.read_csv(file_path, engine=CSV_ENGINE, **read_options)
+        return DataLoader._apply_schema(df, schema)
+
+    @staticmethod
+    def load_csv(file_path: str, dataset: str = None) -> pd.DataFrame:
+        """Load a CSV file into a DataFrame, applying the dataset's schema when one is named."""
+        if dataset is not None and dataset not in DATASET_SCHEMAS:
+            raise ValueError(f"Unknown dataset '{dataset}'. Expected one of {list(DATASET_SCHEMAS)}.")
+
         try:
-            return pd.read_csv(file_path, encoding='ISO-8859-1',low_memory=False)
+            if dataset is None:
+                return pd.read_csv(file_path, encoding='ISO-8859-1',low_memory=False)
+            return DataLoader._read_with_schema(file_path, DATASET_SCHEMAS[dataset])
         except Exception as e:
             raise FileNotFoundError(f"Error loading {file_path}: {e}")
 
     @staticmethod
-    def load_datasets(data_files: list) -> tuple:
-        """Load all datasets from the provided list of CSV file paths."""
+    def iter_csv_chunks(file_path: str, dataset: str, chunksize: int):
+        """Yield a dataset's CSV in typed chunks of at most chunksize rows, for inputs larger than memory."""
+        if dataset not in DATASET_SCHEMAS:
+            raise ValueError(f"Unknown dataset '{dataset}'. Expected one of {list(DATASET_SCHEMAS)}.")
+        schema = DATASET_SCHEMAS[dataset]
+
+        try:
+            read_options = DataLoader._schema_read_options(file_path, schema)
+            # The pyarrow engine cannot read incrementally, so chunks always use the C parser
+            chunk_reader = pd.read_csv(file_path, engine='c', chunksize=chunksize, **read_options)
+        except Exception as e:
+            raise FileNotFoundError(f"Error loading {file_path}: {e}")
+
+        with chunk_reader:
+            for chunk in chunk_reader:
+                yield DataLoader._apply_schema(chunk, schema)
+
+    @staticmethod
+    def is_pattern(path: str) -> bool:
+        """Return True when a path contains glob wildcards."""
+        return re.search(r'[*?\[]', path) is not None
+
+    @staticmethod
+    def discover_files(path_pattern: str) -> list:
+        """Expand a local path or glob pattern into the sorted list of partition files it matches."""
+        if not DataLoader.is_pattern(path_pattern):
+            return [path_pattern]
+
+        file_paths = sorted(glob.glob(path_pattern))
+        if not file_paths:
+            raise FileNotFoundError(f"No files match {path_pattern}")
+        return file_paths
+
+    @staticmethod
+    def concat_partitions(frames: list) -> pd.DataFrame:
+        """Concatenate partition frames into one, keeping categorical columns categorical."""
+        if len(frames) == 1:
+            return frames[0]
+
+        # Partitions carry their own categories; align them so concat does not fall back to object.
+        # A partition whose column is entirely empty has no categories and takes no part in the union.
+        for column, dtype in frames[0].dtypes.items():
+            if isinstance(dtype, pd.CategoricalDtype):
+                category_sets = [frame[column].cat.categories for frame in frames if len(frame[column].cat.categories)]
+                categories = category_sets[0].append(category_sets[1:]).unique() if category_sets else []
+                for frame in frames:
+                    frame[column] = frame[column].cat.set_categories(categories)
+
+        return pd.concat(frames, ignore_index=True, copy=False)
+
+    @staticmethod
+    def load_datasets(data_files: list, datasets: list = None) -> tuple:
+        """
+        Load all datasets from the provided list of CSV file paths, optionally with their schema names.
+        Entries may be glob patterns or lists of partition files; every partition of every dataset
+        is parsed in parallel across worker processes and each dataset is returned as one frame.
+        """
+        if datasets is None:
+            datasets = [None] * len(data_files)
+
+        dataset_files = []
+        for data_file in data_files:
+            if isinstance(data_file, (list, tuple)):
+                dataset_files.append(list(data_file))
+            else:
+                dataset_files.append(DataLoader.discover_files(data_file))
+
+        load_jobs = [(file_path, dataset) for file_paths, dataset in zip(dataset_files, datasets) for file_path in file_paths]
+
+        if len(load_jobs) == 1 or LOAD_WORKERS <= 1:
+            loaded_frames = [DataLoader.load_csv(file_path, dataset) for file_path, dataset in load_jobs]
+        else:
+            # Spawned workers are safe to start while the caller still has download threads running
+            with ProcessPoolExecutor(
+                max_workers=min(LOAD_WORKERS, len(load_jobs)),
+                mp_context=multiprocessing.get_context('spawn')
+            ) as executor:
+                loaded_frames = list(executor.map(DataLoader.load_csv, *zip(*load_jobs)))
+
         data_frames = []
-        for file_path in data_files:
-            data_frames.append(DataLoader.load_csv(file_path))
+        for file_paths in dataset_files:
+            partition_frames, loaded_frames = loaded_frames[:len(file_paths)], loaded_frames[len(file_paths):]
+            data_frames.append(DataLoader.concat_partitions(partition_frames))
         return tuple(data_frames)
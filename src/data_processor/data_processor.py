@@ -1,6 +1,13 @@
 import pandas as pd
 import numpy as np
 
+from src.data_analysis.label_encoding import encode_labels, score_lookup
+from src.data_processor.asset_index import AssetIndex, ASSET_CODE
+
+# Filled score columns with fewer non-zero values than this share are stored sparse: each stored
+# value also costs an index entry, so denser columns are smaller kept dense
+SPARSE_MAX_DENSITY = 0.5
+
 class DataProcessor:
     def __init__(self):
         pass
@@ -8,17 +15,16 @@ class DataProcessor:
     @staticmethod
     def convert_categorical_to_numeric(df: pd.DataFrame,severity_mapping,impact_mapping,u_event_severity_mapping) -> pd.DataFrame:
         """Convert categorical severity and impact to numeric scores."""
-        # Define the mappings for severity and impact
-
-
-        # Convert all the relevant columns to lowercase to ensure proper mapping
-        df['severity'] = df['severity'].str.lower()
-        df['impact'] = df['impact'].str.lower()
+        # Lower-case severity and impact once per distinct label to ensure proper mapping
+        severity = encode_labels(df['severity'], lowercase=True)
+        impact = encode_labels(df['impact'], lowercase=True)
+        df['severity'] = pd.Series(severity, index=df.index)
+        df['impact'] = pd.Series(impact, index=df.index)
 
-        # Map the categorical values to numeric scores using the dictionaries
-        df['uevent_severity_score'] = df['u_event_severity'].map(u_event_severity_mapping).fillna(0)
-        df['severity_score'] = df['severity'].map(severity_mapping).fillna(0)
-        df['impact_score'] = df['impact'].map(impact_mapping).fillna(0)
+        # Map the encoded labels to numeric scores through lookup arrays; unknown labels score 0
+        df['uevent_severity_score'] = score_lookup(encode_labels(df['u_event_severity']), u_event_severity_mapping)
+        df['severity_score'] = score_lookup(severity, severity_mapping)
+        df['impact_score'] = score_lookup(impact, impact_mapping)
 
         return df
 
@@ -43,38 +49,72 @@ class DataProcessor:
 
     @staticmethod
     def merge_data(hw_server: pd.DataFrame, usage_metrics: pd.DataFrame, incident_metrics: pd.DataFrame,
-                   maintenance_metrics: pd.DataFrame, warranty_data: pd.DataFrame,vuln_summary: pd.DataFrame) -> pd.DataFrame:
-        """Merge all data using full outer join."""
-        vuln_summary.rename(columns={'asset_id': 'hardware_asset_id'}, inplace=True)
-
-        merged_data = (
-            hw_server[['hardware_asset_id']]
-            .merge(usage_metrics, on='hardware_asset_id', how='left')
-            .merge(incident_metrics, on='hardware_asset_id', how='left')
-            .merge(maintenance_metrics, on='hardware_asset_id', how='left')
-            .merge(warranty_data, on='hardware_asset_id', how='left')
-            .merge(vuln_summary,on='hardware_asset_id', how='left')
-        )
-        return merged_data
+                   maintenance_metrics: pd.DataFrame, warranty_data: pd.DataFrame,vuln_summary: pd.DataFrame,
+                   asset_index: AssetIndex = None) -> pd.DataFrame:
+        """
+        Left-join every per-asset frame onto the server inventory. Frames keyed by asset code
+        (AssetIndex.key_by_code) are aligned by array indexing; others are keyed here first.
+        """
+        if asset_index is None:
+            asset_index = AssetIndex.from_servers(hw_server)
+
+        blocks = [hw_server[['hardware_asset_id']].reset_index(drop=True)]
+        row_codes = asset_index.encode(hw_server['hardware_asset_id'])
+        per_asset_frames = [
+            (usage_metrics, 'hardware_asset_id'),
+            (incident_metrics, 'hardware_asset_id'),
+            (maintenance_metrics, 'hardware_asset_id'),
+            (warranty_data, 'hardware_asset_id'),
+            (vuln_summary, 'asset_id'),
+        ]
+        for frame, asset_column in per_asset_frames:
+            if frame.index.name != ASSET_CODE:
+                frame = asset_index.key_by_code(frame, asset_column)
+            # Rows of assets outside the inventory never match in a left join
+            frame = frame[frame.index >= 0]
+            value_columns = frame.columns.drop(asset_column)
+
+            merged_columns = {column for block in blocks for column in block.columns}
+            if frame.index.has_duplicates or merged_columns.intersection(value_columns):
+                # Repeated asset rows fan out and clashing names get suffixes, which only a join does
+                merged_data = pd.concat(blocks, axis=1).merge(
+                    frame.reset_index(drop=True).rename(columns={asset_column: 'hardware_asset_id'}),
+                    on='hardware_asset_id', how='left'
+                )
+                blocks = [merged_data]
+                row_codes = asset_index.encode(merged_data['hardware_asset_id'])
+                continue
+
+            blocks.append(asset_index.align(frame[value_columns], row_codes))
+
+        # One concatenation instead of a copy of the growing frame per join
+        return pd.concat(blocks, axis=1)
 
 
     @staticmethod
-    def add_company_names(merged_data: pd.DataFrame, hw_server: pd.DataFrame) -> pd.DataFrame:
+    def add_company_names(merged_data: pd.DataFrame, hw_server: pd.DataFrame, asset_index: AssetIndex = None) -> pd.DataFrame:
         """Add company names to merged data from server and incident files."""
+        if asset_index is None:
+            asset_index = AssetIndex.from_servers(hw_server)
+
+        # The last company listed for an asset wins
         server_company_mapping = hw_server[['hardware_asset_id', 'company']].drop_duplicates()
-        
-        # Convert to dictionaries
-        server_company_dict = dict(zip(server_company_mapping['hardware_asset_id'], server_company_mapping['company']))
+        server_company_mapping = server_company_mapping.drop_duplicates('hardware_asset_id', keep='last')
 
+        # Company of every asset code, then looked up for each row of the merged data
+        company_by_code = np.full(len(asset_index), np.nan, dtype=object)
+        company_by_code[asset_index.encode(server_company_mapping['hardware_asset_id'])] = server_company_mapping['company'].to_numpy()
+        merged_data['company'] = asset_index.lookup(merged_data['hardware_asset_id'], company_by_code)
 
-        # Add company names from server mapping
-        merged_data['company'] = merged_data['hardware_asset_id'].map(server_company_dict)
-        
         return merged_data
 
     @staticmethod
     def handle_missing_values(merged_data: pd.DataFrame) -> pd.DataFrame:
-        """Handle missing values in merged data."""
+        """
+        Handle missing values in merged data: missing scores count as 0. Assets without incidents
+        or vulnerabilities have no scores of those domains, so mostly-zero score columns are kept
+        as sparse columns with a fill value of 0 rather than dense zeros.
+        """
         # Define the columns to handle missing values
         columns_to_fill = [
             'w_cpu_usage',
@@ -101,7 +141,11 @@ class DataProcessor:
 
         # Fill missing values with zero for the specified columns
         for column in columns_to_fill:
-            merged_data[column].fillna(0, inplace=True)
+            filled = merged_data[column].fillna(0).to_numpy()
+            if np.count_nonzero(filled) < SPARSE_MAX_DENSITY * len(filled):
+                merged_data[column] = pd.arrays.SparseArray(filled, fill_value=0)
+            else:
+                merged_data[column] = filled
 
         return merged_data
     
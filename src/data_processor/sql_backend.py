@@ -0,0 +1,276 @@
+import numpy as np
+import pandas as pd
+
+from src.data_processor.data_loader import DataLoader, DATASET_SCHEMAS
+from src.data_analysis.usage_scorer import UsageScorer
+from src.data_analysis.incident_scorer import IncidentScoring
+from src.data_analysis.vulnerability_scorer import VulnerabilityScorer
+from src.data_analysis.maintenance_scorer import MaintenanceAnalyzer
+
+# SQL types of the schema dtypes; category and object columns are read as text
+SQL_TYPES = {'float64': 'DOUBLE', 'int64': 'BIGINT', 'object': 'VARCHAR', 'category': 'VARCHAR'}
+
+# Microseconds per day, for whole days between two timestamps
+MICROSECONDS_PER_DAY = 86400 * 10 ** 6
+
+
+def quote_identifier(name: str) -> str:
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def quote_literal(value) -> str:
+    if isinstance(value, str):
+        return "'" + value.replace("'", "''") + "'"
+    return repr(float(value))
+
+
+class SqlScoringBackend:
+    """
+    Per-asset aggregations of the four scorers and the merge, run as queries in an embedded
+    DuckDB database over the local input files. The raw rows never become pandas frames: the
+    database streams them and spills to temp_directory past memory_limit, and only per-asset
+    aggregates come back, to be scored by the same *_from_aggregates steps as in memory.
+    """
+
+    def __init__(self, memory_limit: str = '', temp_directory: str = ''):
+        try:
+            import duckdb
+        except ImportError as e:
+            raise ImportError("SCORING_BACKEND=sql requires the 'duckdb' package") from e
+
+        config = {}
+        if memory_limit:
+            config['memory_limit'] = memory_limit
+        if temp_directory:
+            config['temp_directory'] = temp_directory
+        self._connection = duckdb.connect(database=':memory:', config=config)
+
+    def close(self):
+        self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _query(self, query: str, frames: dict = None) -> pd.DataFrame:
+        """Run a query on a cursor of its own, so stages on different threads can query at once."""
+        with self._connection.cursor() as cursor:
+            for name, frame in (frames or {}).items():
+                cursor.register(name, frame)
+            return cursor.execute(query).df()
+
+    @staticmethod
+    def dataset_query(file_paths: list, dataset: str) -> str:
+        """
+        A query over the schema's columns of a dataset's partition files, typed like DataLoader
+        types them: date columns parsed, label columns to be compared case-insensitively lowered.
+        """
+        schema = DATASET_SCHEMAS[dataset]
+        lowercase_columns = schema.get('lowercase', [])
+        partition_queries = []
+        for file_path in file_paths:
+            # The loader's own header mapping, which also strips byte-order marks from the names
+            read_options = DataLoader._schema_read_options(file_path, schema)
+            clean_names = {DataLoader._clean_column_name(column): column for column in read_options['dtype']}
+
+            select_list = []
+            for column, dtype in schema['dtypes'].items():
+                if column not in clean_names:
+                    continue
+                expression = f"CAST({quote_identifier(clean_names[column])} AS {SQL_TYPES[dtype]})"
+                if column in lowercase_columns:
+                    expression = f"lower({expression})"
+                select_list.append(f"{expression} AS {quote_identifier(column)}")
+            for column, date_format in schema['dates'].items():
+                if column not in clean_names:
+                    continue
+                raw_column = quote_identifier(clean_names[column])
+                # Like the loader, a date that does not parse is an error unless the column is lenient
+                lenient = column in schema.get('lenient_dates', [])
+                if date_format:
+                    expression = f"{'try_strptime' if lenient else 'strptime'}({raw_column}, {quote_literal(date_format)})"
+                else:
+                    expression = f"{'TRY_CAST' if lenient else 'CAST'}({raw_column} AS TIMESTAMP)"
+                select_list.append(f"{expression} AS {quote_identifier(column)}")
+
+            partition_queries.append(
+                f"SELECT {', '.join(select_list)} FROM read_csv({quote_literal(file_path)}, "
+                f"header = true, all_varchar = true, encoding = 'latin-1')"
+            )
+        return ' UNION ALL BY NAME '.join(f"({partition_query})" for partition_query in partition_queries)
+
+    def _aggregate(self, file_paths: list, dataset: str, asset_column: str, aggregations: dict) -> pd.DataFrame:
+        """
+        Grouped aggregates of a dataset's rows per asset id, in sorted asset id order, like
+        aggregate_per_asset: rows without an asset id are left out and sums of groups without
+        values are 0. aggregations maps each output name to a SQL aggregate expression.
+        """
+        select_list = ', '.join(f"{expression} AS {quote_identifier(name)}" for name, expression in aggregations.items())
+        asset = quote_identifier(asset_column)
+        aggregates = self._query(
+            f"SELECT {asset}, {select_list} FROM ({self.dataset_query(file_paths, dataset)}) "
+            f"WHERE {asset} IS NOT NULL GROUP BY {asset} ORDER BY {asset}"
+        )
+        return aggregates.set_index(asset_column)
+
+    @staticmethod
+    def _sum(expression: str) -> str:
+        return f"COALESCE(SUM({expression}), 0)"
+
+    @staticmethod
+    def _label_scores(expression: str, score_def: dict) -> str:
+        """Score of a label through a score definition; labels without one, and missing labels, score 0."""
+        cases = ' '.join(f"WHEN {quote_literal(label)} THEN {quote_literal(score)}" for label, score in score_def.items())
+        return f"CASE {expression} {cases} ELSE 0 END"
+
+    @staticmethod
+    def _bucket_scores(buckets: list, labels: list, score_def: dict) -> str:
+        """Score of the first bucket whose condition holds, each bucket given as (condition, label code)."""
+        cases = ' '.join(
+            f"WHEN {condition} THEN {quote_literal(score_def.get(labels[code], 0))}" for condition, code in buckets[:-1]
+        )
+        return f"CASE {cases} ELSE {quote_literal(score_def.get(labels[buckets[-1][1]], 0))} END"
+
+    def usage_aggregates(self, file_paths: list) -> pd.DataFrame:
+        """UsageScorer.usage_aggregates over usage partition files."""
+        columns = dict(zip(UsageScorer.AGGREGATE_KEYS, (quote_identifier(column) for column in UsageScorer.USAGE_COLUMNS)))
+        aggregations = {f'{key}_sum': self._sum(column) for key, column in columns.items()}
+        aggregations.update({f'{key}_count': f"COUNT({column})" for key, column in columns.items()})
+        aggregations['row_count'] = 'COUNT(*)'
+        aggregations['network_min'] = f"MIN({columns['network']})"
+        aggregations['network_max'] = f"MAX({columns['network']})"
+        return self._aggregate(file_paths, 'usage', 'hardware_asset_id', aggregations)
+
+    def incident_aggregates(self, file_paths: list, severity_mapping: dict, impact_mapping: dict) -> pd.DataFrame:
+        """IncidentScoring.incident_aggregates over incident partition files."""
+        return self._aggregate(file_paths, 'incidents', 'hardware_asset_id', {
+            'severity_score_sum': self._sum(self._label_scores('severity', severity_mapping)),
+            'impact_score_sum': self._sum(self._label_scores('impact', impact_mapping)),
+            'incident_count': 'COUNT(*)',
+        })
+
+    def vulnerability_aggregates(self, file_paths: list, reference_time) -> pd.DataFrame:
+        """VulnerabilityScorer.vulnerability_aggregates over vulnerability partition files, patch ages at reference_time."""
+        scorer = VulnerabilityScorer
+        reference_time = pd.Timestamp(reference_time)
+
+        # Whole days since release, floored like Timedelta.days; negative means a future release
+        days = (
+            f"floor((epoch_us(TIMESTAMP {quote_literal(reference_time.isoformat(sep=' '))}) "
+            f"- epoch_us(\"Patch Released\")) / {MICROSECONDS_PER_DAY}.0)"
+        )
+        detection_age, times_detected = '"Detection AGE"', '"Times Detected"'
+
+        # Buckets in the order of the label codes VulnerabilityScorer's bucketing helpers return
+        component_scores = {
+            'severity': '"Severity"',
+            'patchReleased': self._bucket_scores([
+                ('"Patch Released" IS NULL', 0), (f"{days} <= -1", 1), (f"{days} <= 30", 2), ('TRUE', 3),
+            ], scorer.PatchReleasedLabels, scorer.VulnPatchReleasedDaysScoreDef),
+            'status': self._label_scores('"Status"', scorer.VulnStatusScoreDef),
+            'detectedAge': self._bucket_scores([
+                (f"{detection_age} IS NULL", 0), (f"{detection_age} <= 7", 1), (f"{detection_age} <= 30", 2),
+                (f"{detection_age} <= 60", 3), ('TRUE', 4),
+            ], scorer.DetAgeLabels, scorer.VulnDetAgeScoreDef),
+            'detectedTimes': self._bucket_scores([
+                (f"{times_detected} IS NULL OR {times_detected} = 0", 0), (f"{times_detected} <= 1", 1),
+                (f"{times_detected} <= 5", 2), ('TRUE', 3),
+            ], scorer.DetTimesLabels, scorer.VulnDetTimesScoreDef),
+            'patch': self._label_scores('"Vuln Patchable"', scorer.VulnPatchScoreDef),
+        }
+
+        aggregations = {f'{component}_sum': self._sum(component_scores[component]) for component in scorer.SCORE_COMPONENTS}
+        aggregations['severity_count'] = 'COUNT("Severity")'
+        aggregations['vulnerability_count'] = 'COUNT(*)'
+        return self._aggregate(file_paths, 'vulnerabilities', 'asset_id', aggregations)
+
+    def maintenance_aggregates(self, file_paths: list) -> pd.DataFrame:
+        """MaintenanceAnalyzer.maintenance_aggregates over patch upgrade partition files."""
+        return self._aggregate(file_paths, 'patch_upgrades', 'hardware_asset_id', {
+            'maintenance_score_sum': self._sum('maintenance_score'),
+            'maintenance_score_count': 'COUNT(maintenance_score)',
+            'maintenance_score_max': 'MAX(maintenance_score)',
+        })
+
+    def score_usage(self, file_paths: list) -> pd.DataFrame:
+        return UsageScorer().calculate_weighted_usage_scores_from_aggregates(self.usage_aggregates(file_paths))
+
+    def score_incidents(self, file_paths: list, severity_mapping: dict, impact_mapping: dict) -> pd.DataFrame:
+        return IncidentScoring.incident_stability_from_aggregates(
+            self.incident_aggregates(file_paths, severity_mapping, impact_mapping)
+        )
+
+    def score_vulnerabilities(self, file_paths: list, reference_time) -> pd.DataFrame:
+        return VulnerabilityScorer.vulnerability_stability_from_aggregates(
+            self.vulnerability_aggregates(file_paths, reference_time)
+        )
+
+    def score_maintenance(self, file_paths: list) -> pd.DataFrame:
+        return MaintenanceAnalyzer.maintenance_scores_from_aggregates(self.maintenance_aggregates(file_paths))
+
+    def merge_data(self, hw_server: pd.DataFrame, usage_metrics: pd.DataFrame, incident_metrics: pd.DataFrame,
+                   maintenance_metrics: pd.DataFrame, warranty_data: pd.DataFrame, vuln_summary: pd.DataFrame) -> pd.DataFrame:
+        """
+        DataProcessor.merge_data as one query: every per-asset frame left-joined onto the server
+        inventory, in inventory order, with repeated asset rows fanning out and clashing column
+        names suffixed _x/_y like successive pandas merges.
+        """
+        per_asset_frames = [
+            (usage_metrics, 'hardware_asset_id'),
+            (incident_metrics, 'hardware_asset_id'),
+            (maintenance_metrics, 'hardware_asset_id'),
+            (warranty_data, 'hardware_asset_id'),
+            (vuln_summary, 'asset_id'),
+        ]
+
+        # Row positions order the result like the left joins: inventory rows, then matches in order
+        frames = {'merge_0': hw_server[['hardware_asset_id']].reset_index(drop=True).assign(merge_row_0=np.arange(len(hw_server)))}
+        output_columns = {'hardware_asset_id': ('merge_0', 'hardware_asset_id')}
+        source_dtypes = {'hardware_asset_id': hw_server['hardware_asset_id'].dtype}
+        joins = []
+        for position, (frame, asset_column) in enumerate(per_asset_frames, start=1):
+            table = f'merge_{position}'
+            frame = frame.reset_index(drop=True)
+            frames[table] = frame.assign(**{f'merge_row_{position}': np.arange(len(frame))})
+            joins.append(
+                f"LEFT JOIN {table} ON merge_0.hardware_asset_id IS NOT DISTINCT FROM {table}.{quote_identifier(asset_column)}"
+            )
+
+            for column in frame.columns.drop(asset_column):
+                if column in output_columns:
+                    output_columns[f'{column}_x'] = output_columns.pop(column)
+                    source_dtypes[f'{column}_x'] = source_dtypes.pop(column)
+                    column_name = f'{column}_y'
+                else:
+                    column_name = column
+                output_columns[column_name] = (table, column)
+                source_dtypes[column_name] = frame[column].dtype
+
+        select_list = ', '.join(
+            f"{table}.{quote_identifier(column)} AS {quote_identifier(name)}" for name, (table, column) in output_columns.items()
+        )
+        order_by = ', '.join(f'merge_row_{position}' for position in range(len(frames)))
+        merged_data = self._query(f"SELECT {select_list} FROM merge_0 {' '.join(joins)} ORDER BY {order_by}", frames)
+
+        for column, dtype in source_dtypes.items():
+            merged_data[column] = self._pandas_join_dtype(merged_data[column], dtype)
+        return merged_data
+
+    @staticmethod
+    def _pandas_join_dtype(values: pd.Series, dtype) -> pd.Series:
+        """
+        A joined column typed like the same left join in pandas: integers (and booleans) with
+        missing values become float (object), the rest keeps the type of the source column.
+        Missing text is NaN rather than None.
+        """
+        if values.dtype == dtype:
+            return values.where(values.notna(), np.nan) if dtype == object and values.hasnans else values
+        if not values.hasnans or isinstance(dtype, pd.CategoricalDtype) or pd.api.types.is_datetime64_any_dtype(dtype):
+            return values.astype(dtype)
+        if pd.api.types.is_bool_dtype(dtype):
+            return values.astype(object).fillna(np.nan)
+        if pd.api.types.is_integer_dtype(dtype):
+            return values.astype(float)
+        return values
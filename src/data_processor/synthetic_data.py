@@ -0,0 +1,179 @@
+import os
+import numpy as np
+import pandas as pd
+
+# Fleet sizes used by the benchmark suite
+FLEET_SIZES = {'10k': 10_000, '100k': 100_000, '1m': 1_000_000}
+
+# Blob each dataset is written to, matching the default input names read by HWDataPreprocessing
+DATASET_BLOB_NAMES = {
+    'usage': 'hw_servers_usage_5.csv',
+    'warranty': 'hw_warranty_5.csv',
+    'servers': 'hw_servers_5.csv',
+    'vulnerabilities': 'hw_vulnerabilities_data.csv',
+    'patch_upgrades': 'patchupgrades.csv',
+    'incidents': 'hw_incidents_5.csv',
+}
+
+INCIDENT_LABELS = ['1 - High', '2 - Medium', '3 - Low', 'High', 'Medium', 'Low', None]
+INCIDENT_LABEL_WEIGHTS = [0.08, 0.22, 0.35, 0.05, 0.1, 0.15, 0.05]
+
+
+class SyntheticFleetGenerator:
+    """
+    Generate a consistent synthetic hardware fleet in the layout of the production exports.
+    Every dataset refers to the same asset ids, and per-asset activity is heavy tailed so a
+    small share of the assets carries most incidents and vulnerabilities.
+    """
+
+    def __init__(self, num_assets: int, seed: int = 0, reference_date=None, usage_readings_per_asset: int = 12):
+        self.num_assets = num_assets
+        self.seed = seed
+        self.reference_date = pd.Timestamp(reference_date) if reference_date is not None else pd.Timestamp.today().normalize()
+        self.usage_readings_per_asset = usage_readings_per_asset
+
+        rng = np.random.default_rng(seed)
+        self.asset_ids = np.array([f'HW{index:07d}' for index in range(num_assets)], dtype=object)
+
+        # Pareto-distributed activity, scaled to a mean of 1, drives the incident and vulnerability counts
+        activity = rng.pareto(1.5, num_assets) + 0.2
+        self.activity = activity / activity.mean()
+
+        # Each asset runs around its own utilization level
+        self.base_utilization = rng.beta(2, 3, size=(num_assets, 3)) * 100
+
+    def _rng(self, dataset: str) -> np.random.Generator:
+        """One independent stream per dataset, so each can be regenerated on its own."""
+        return np.random.default_rng([self.seed, sorted(DATASET_BLOB_NAMES).index(dataset)])
+
+    def _rows_per_asset(self, rng: np.random.Generator, mean_rows: float, skewed: bool) -> np.ndarray:
+        """Asset index of every row, with per-asset row counts drawn around the mean."""
+        expected = mean_rows * self.activity if skewed else np.full(self.num_assets, float(mean_rows))
+        return np.repeat(np.arange(self.num_assets), rng.poisson(expected))
+
+    def _days_from_reference(self, days: np.ndarray) -> pd.DatetimeIndex:
+        return self.reference_date + pd.to_timedelta(days, unit='D')
+
+    def generate_servers(self) -> pd.DataFrame:
+        rng = self._rng('servers')
+        companies = np.array([f'Company {index:02d}' for index in range(40)], dtype=object)
+        company_weights = 1 / np.arange(1, len(companies) + 1)
+        company = rng.choice(companies, self.num_assets, p=company_weights / company_weights.sum())
+        company[rng.random(self.num_assets) < 0.02] = None
+
+        return pd.DataFrame({
+            'hardware_asset_id': self.asset_ids,
+            'company': company,
+            'model': rng.choice(['R640', 'R740', 'DL360', 'DL380', 'SR650'], self.num_assets),
+            'location': rng.choice(['DC-East', 'DC-West', 'DC-Central', 'Edge'], self.num_assets, p=[0.4, 0.3, 0.2, 0.1]),
+        })
+
+    def generate_warranty(self) -> pd.DataFrame:
+        rng = self._rng('warranty')
+        covered = np.flatnonzero(rng.random(self.num_assets) < 0.9)
+        count = len(covered)
+
+        end_of_sale = rng.integers(-2500, 700, count)
+        end_of_support = end_of_sale + rng.integers(2 * 365, 5 * 365, count)
+        end_of_extended_support = end_of_support + rng.integers(365, 3 * 365, count)
+        end_of_life = end_of_support + rng.integers(0, 2 * 365, count)
+
+        warranty = pd.DataFrame({
+            'hardware_asset_id': self.asset_ids[covered],
+            'end_of_life_date': self._days_from_reference(end_of_life).strftime('%Y-%m-%d'),
+            'end_of_sale_date': self._days_from_reference(end_of_sale).strftime('%Y-%m-%d'),
+            'end_of_support_date': self._days_from_reference(end_of_support).strftime('%Y-%m-%d'),
+            'end_of_extended_support_date': self._days_from_reference(end_of_extended_support).strftime('%Y-%m-%d'),
+            'vendor': rng.choice(['Dell', 'HPE', 'Lenovo'], count),
+        })
+        warranty.loc[rng.random(count) < 0.05, 'end_of_life_date'] = None
+        return warranty
+
+    def generate_usage(self) -> pd.DataFrame:
+        rng = self._rng('usage')
+        asset_index = self._rows_per_asset(rng, self.usage_readings_per_asset, skewed=False)
+        count = len(asset_index)
+
+        utilization = self.base_utilization[asset_index] + rng.normal(0, 10, size=(count, 3))
+        utilization = np.clip(utilization, 0, 100)
+
+        return pd.DataFrame({
+            'hardware_asset_id': self.asset_ids[asset_index],
+            'CPU Usage (%)': utilization[:, 0],
+            'Memory Usage (%)': utilization[:, 1],
+            'Disk Usage (%)': utilization[:, 2],
+            'Network Throughput (Mbps)': rng.lognormal(5, 1, count),
+            'timestamp': self._days_from_reference(-rng.integers(0, 30, count)).strftime('%Y-%m-%d'),
+        })
+
+    def generate_incidents(self) -> pd.DataFrame:
+        rng = self._rng('incidents')
+        asset_index = self._rows_per_asset(rng, 0.8, skewed=True)
+        count = len(asset_index)
+
+        return pd.DataFrame({
+            'number': np.char.add('INC', np.char.zfill(np.arange(count).astype(str), 9)).astype(object),
+            'hardware_asset_id': self.asset_ids[asset_index],
+            'severity': rng.choice(np.array(INCIDENT_LABELS, dtype=object), count, p=INCIDENT_LABEL_WEIGHTS),
+            'impact': rng.choice(np.array(INCIDENT_LABELS, dtype=object), count, p=INCIDENT_LABEL_WEIGHTS),
+            'u_event_severity': rng.choice(['CRITICAL', 'MAJOR', 'MINOR'], count, p=[0.1, 0.3, 0.6]),
+        })
+
+    def generate_patch_upgrades(self) -> pd.DataFrame:
+        rng = self._rng('patch_upgrades')
+        asset_index = self._rows_per_asset(rng, 2, skewed=False)
+        count = len(asset_index)
+
+        return pd.DataFrame({
+            'hardware_asset_id': self.asset_ids[asset_index],
+            'maintenance_status': rng.choice(['Completed', 'Pending', 'Failed', 'Scheduled'], count, p=[0.6, 0.2, 0.05, 0.15]),
+            'maintenance_score': rng.integers(0, 11, count),
+        })
+
+    def generate_vulnerabilities(self) -> pd.DataFrame:
+        rng = self._rng('vulnerabilities')
+        asset_index = self._rows_per_asset(rng, 4, skewed=True)
+        count = len(asset_index)
+
+        # Mostly past patch releases, some still unreleased and a few announced for the future
+        patch_released = pd.Series(self._days_from_reference(-rng.integers(-30, 400, count)).strftime('%d-%b-%y'), dtype=object)
+        patch_released[rng.random(count) < 0.15] = None
+
+        detection_age = np.floor(rng.exponential(45, count))
+        detection_age[rng.random(count) < 0.05] = np.nan
+        times_detected = rng.geometric(0.35, count).astype(float) - 1
+        times_detected[rng.random(count) < 0.05] = np.nan
+
+        return pd.DataFrame({
+            'asset_id': self.asset_ids[asset_index],
+            'QID': rng.integers(10000, 400000, count),
+            'Severity': rng.choice([1, 2, 3, 4, 5], count, p=[0.1, 0.2, 0.35, 0.25, 0.1]),
+            'Patch Released': patch_released,
+            'Status': rng.choice(['ACTIVE', 'CLOSED', 'FIXED', 'NEW'], count, p=[0.5, 0.3, 0.15, 0.05]),
+            'Detection AGE': detection_age,
+            'Times Detected': times_detected,
+            'Vuln Patchable': rng.choice(['Yes', 'No'], count, p=[0.7, 0.3]),
+        })
+
+    def generate(self, dataset: str) -> pd.DataFrame:
+        """Generate one dataset by its schema name (see DATASET_BLOB_NAMES)."""
+        if dataset not in DATASET_BLOB_NAMES:
+            raise ValueError(f"Unknown dataset '{dataset}'. Expected one of {list(DATASET_BLOB_NAMES)}.")
+        return getattr(self, f'generate_{dataset}')()
+
+    def write_csv(self, output_dir: str, folder_name: str = 'AssetFiles') -> dict:
+        """
+        Write every dataset as CSV under output_dir/folder_name using the production blob names,
+        one dataset at a time to bound memory. Returns the written path of each dataset.
+        """
+        dataset_dir = os.path.join(output_dir, folder_name)
+        os.makedirs(dataset_dir, exist_ok=True)
+
+        written_paths = {}
+        for dataset, blob_name in DATASET_BLOB_NAMES.items():
+            file_path = os.path.join(dataset_dir, blob_name)
+            # The vulnerability export carries a byte-order mark, like the real one
+            encoding = 'utf-8-sig' if dataset == 'vulnerabilities' else 'utf-8'
+            self.generate(dataset).to_csv(file_path, index=False, encoding=encoding)
+            written_paths[dataset] = file_path
+        return written_paths
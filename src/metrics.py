@@ -1,21 +1,71 @@
+import logging
 import pandas as pd
 import numpy as np
-from datetime import datetime, timedelta
+from datetime import datetime
+
+from src.data_analysis.eol_horizons import DEFAULT_EOL_HORIZONS, eol_horizon_crosstab, top_k_positions
+from src.data_analysis.score_statistics import ScoreMoments, QuantileSketch
+
+logger = logging.getLogger(__name__)
 
 class MetricsCalculator:
+    # Columns each report section reads from the summarized asset scores
+    RISK_CATEGORY_SUMMARY_COLUMNS = ['risk_category']
+    USAGE_SUMMARY_COLUMNS = ['w_cpu_usage', 'w_memory_usage', 'w_disk_usage', 'w_network_bandwidth', 'overall_usage_score','n_usage_score']
+    INCIDENT_SUMMARY_COLUMNS = ['incident_count', 'severity_score', 'impact_score', 'incident_score', 'overall_incident_score']
+    MAINTENANCE_SUMMARY_COLUMNS = ['maintenance_score','overall_maintenance_score']
+    HIGH_RISK_SERVERS_SUMMARY_COLUMNS = ['hardware_asset_id', 'company', 'risk_category', 'end_of_life_date']
+    # Report names of the high risk servers summary columns; other horizon buckets keep their labels
+    HIGH_RISK_SERVERS_SUMMARY_NAMES = {
+        'total_asset_count': 'Total Asset Count',
+        'expired': 'Expired Assets',
+        'expiring_soon': 'Expiring Soon Assets',
+        'expiring_later': 'Expiring Later Assets',
+    }
+
+    @staticmethod
+    def weighted_sum(df: pd.DataFrame, column_weights: list) -> np.ndarray:
+        """
+        Sum of (column, weight) products as a dense array. Sparse columns filled with 0 only
+        add their stored values, so they are never expanded to dense columns.
+        """
+        total = np.zeros(len(df))
+        for column, weight in column_weights:
+            values = df[column].array
+            if isinstance(values, pd.arrays.SparseArray) and values.fill_value == 0:
+                total[values.sp_index.indices] += values.sp_values * weight
+            else:
+                total += df[column].to_numpy(dtype=float) * weight
+        return total
+
+    @staticmethod
+    def composite_stability_scores(merged_data: pd.DataFrame, weights_composite_stability_score) -> np.ndarray:
+        """Composite stability score of every asset: the weighted sum of its normalized domain scores."""
+        return MetricsCalculator.weighted_sum(merged_data, [
+            ('n_usage_score', weights_composite_stability_score['overall_usage_score']),
+            ('overall_incident_score', weights_composite_stability_score['overall_incident_score']),
+            ('overall_maintenance_score', weights_composite_stability_score['maintenance_score']),
+            ('overall_vulnerability_score', weights_composite_stability_score['vulnerability_score']),
+        ])
+
     @staticmethod
     def calculate_stability_scores(merged_data: pd.DataFrame,weights_composite_stability_score) -> pd.DataFrame:
         """Calculate the overall stability scores and categorize assets."""
 
         # Calculate composite stability score using weighted averages
-        merged_data['composite_stability_score'] = (
-            (merged_data['n_usage_score'] * weights_composite_stability_score['overall_usage_score']) +
-            (merged_data['overall_incident_score'] * weights_composite_stability_score['overall_incident_score']) +
-            (merged_data['overall_maintenance_score'] * weights_composite_stability_score['maintenance_score']) +
-            (merged_data['overall_vulnerability_score'] * weights_composite_stability_score['vulnerability_score'])
-        )
+        merged_data['composite_stability_score'] = MetricsCalculator.composite_stability_scores(merged_data, weights_composite_stability_score)
         
         return merged_data
+
+    @staticmethod
+    def calculate_stability_and_risk(merged_data: pd.DataFrame, weights_composite_stability_score, mode: str = 'zscore') -> pd.DataFrame:
+        """
+        calculate_stability_scores and RiskCategorizer.categorize_asset_risk fused: the composite
+        score, its z-score and the risk category come from one accumulated score array, without
+        any intermediate weighted columns.
+        """
+        composite_scores = MetricsCalculator.composite_stability_scores(merged_data, weights_composite_stability_score)
+        return RiskCategorizer.categorize_scores(merged_data, composite_scores, mode)
     
     @staticmethod
     def summarize_risk_categories(complete_df):
@@ -38,15 +88,25 @@ class MetricsCalculator:
         summary_df = pd.DataFrame(summary_data)
 
         return summary_df
+
+    @staticmethod
+    def summarize_risk_categories_from_cube(summary_cube) -> pd.DataFrame:
+        """summarize_risk_categories from the asset counts of a SummaryCube."""
+        counts = summary_cube.risk_category_counts()
+        categories = ['High Risk', 'Moderate Risk', 'Low Risk']
+        return pd.DataFrame({
+            'Risk Category': categories,
+            'Total Assets': [int(counts[category]) for category in categories]
+        })
     
     @staticmethod
     def display_metrics_summary(merged_data: pd.DataFrame) -> tuple:
         """Create separate summary statistics tables for Usage, Incident, and Maintenance Metrics."""
 
         # Define the relevant columns for each category
-        usage_columns = ['w_cpu_usage', 'w_memory_usage', 'w_disk_usage', 'w_network_bandwidth', 'overall_usage_score','n_usage_score']
-        incident_columns = ['incident_count', 'severity_score', 'impact_score', 'incident_score', 'overall_incident_score']
-        maintenance_columns = ['maintenance_score','overall_maintenance_score']
+        usage_columns = MetricsCalculator.USAGE_SUMMARY_COLUMNS
+        incident_columns = MetricsCalculator.INCIDENT_SUMMARY_COLUMNS
+        maintenance_columns = MetricsCalculator.MAINTENANCE_SUMMARY_COLUMNS
 
         # Create summary statistics DataFrames
         usage_summary = merged_data[usage_columns].describe().T.round(3)
@@ -54,77 +114,142 @@ class MetricsCalculator:
         maintenance_summary = merged_data[maintenance_columns].describe().T.round(3)
 
         return usage_summary, incident_summary, maintenance_summary
+
+    @staticmethod
+    def display_metrics_summary_from_cube(summary_cube) -> tuple:
+        """display_metrics_summary from the cell statistics and fleet quantiles of a SummaryCube."""
+        return tuple(
+            summary_cube.describe(columns).round(3)
+            for columns in [
+                MetricsCalculator.USAGE_SUMMARY_COLUMNS,
+                MetricsCalculator.INCIDENT_SUMMARY_COLUMNS,
+                MetricsCalculator.MAINTENANCE_SUMMARY_COLUMNS,
+            ]
+        )
     
     @staticmethod
-    def get_top_10_high_risk_servers_summary(merged_data):
-
-        current_date = datetime.now()
-        one_month_from_now = current_date + timedelta(days=30)
-
-        merged_data['end_of_life_date'] = pd.to_datetime(merged_data['end_of_life_date'], errors='coerce')
-
-        # Filter data into three categories
-        expired_servers = merged_data[(merged_data['risk_category'] == 'High Risk') & (merged_data['end_of_life_date'] < current_date)]
-        expiring_soon_servers = merged_data[(merged_data['risk_category'] == 'High Risk') & (merged_data['end_of_life_date'] >= current_date) & (merged_data['end_of_life_date'] <= one_month_from_now)]
-        expiring_later_servers = merged_data[(merged_data['risk_category'] == 'High Risk') & (merged_data['end_of_life_date'] > one_month_from_now)]
-
-        # Group and count the assets by company for each category
-        expired_count = expired_servers.groupby('company')['hardware_asset_id'].count().reset_index(name='expired')
-        expiring_soon_count = expiring_soon_servers.groupby('company')['hardware_asset_id'].count().reset_index(name='expiring_soon')
-        expiring_later_count = expiring_later_servers.groupby('company')['hardware_asset_id'].count().reset_index(name='expiring_later')
-
-        # Merge all the counts into a single DataFrame, fill NaN values with 0
-        summary = pd.merge(expired_count, expiring_soon_count, on='company', how='outer')
-        summary = pd.merge(summary, expiring_later_count, on='company', how='outer')
-        summary = summary.fillna(0)
-
-        # Add a total asset count column
-        summary['total_asset_count'] = summary['expired'] + summary['expiring_soon'] + summary['expiring_later']
-
-        # Reorder columns to have 'company', 'total_asset_count', 'expired', 'expiring_soon', 'expiring_later'
-        summary = summary[['company', 'total_asset_count', 'expired', 'expiring_soon', 'expiring_later']]
-
-        # Convert counts to integer for better readability
-        summary[['total_asset_count', 'expired', 'expiring_soon', 'expiring_later']] = summary[['total_asset_count', 'expired', 'expiring_soon', 'expiring_later']].astype(int)
+    def summarize_eol_horizons(merged_data: pd.DataFrame, horizons: list = DEFAULT_EOL_HORIZONS,
+                               risk_category: str = 'High Risk', reference_time: datetime = None) -> pd.DataFrame:
+        """
+        Count the assets of a risk category per company and EOL horizon bucket, with a
+        total_asset_count column first. Only assets with an asset id and an end-of-life date are
+        counted, and merged_data is left as it is.
+        """
+        at_risk = ((merged_data['risk_category'] == risk_category) & merged_data['hardware_asset_id'].notna()).to_numpy()
+        crosstab = eol_horizon_crosstab(
+            merged_data['company'][at_risk],
+            merged_data['end_of_life_date'][at_risk],
+            horizons,
+            reference_time,
+        )
+        crosstab.insert(0, 'total_asset_count', crosstab.sum(axis=1))
+        return crosstab
 
-        # Sort the DataFrame by total asset count in descending order
-        summary = summary.sort_values(by='total_asset_count', ascending=False)
+    @staticmethod
+    def _top_companies(summary: pd.DataFrame, top_k: int) -> pd.DataFrame:
+        """The top_k companies of an EOL horizon summary by total asset count, in descending order."""
+        summary = summary.reset_index(names='company')
+        summary = summary.take(top_k_positions(summary['total_asset_count'].to_numpy(), top_k))
+        return summary.rename(columns=MetricsCalculator.HIGH_RISK_SERVERS_SUMMARY_NAMES)
 
-        summary = summary.rename(columns={
-        'total_asset_count': 'Total Asset Count',
-        'expired': 'Expired Assets',
-        'expiring_soon': 'Expiring Soon Assets',
-        'expiring_later': 'Expiring Later Assets'
-        })
+    @staticmethod
+    def get_top_10_high_risk_servers_summary(merged_data, horizons: list = DEFAULT_EOL_HORIZONS, top_k: int = 10,
+                                             reference_time: datetime = None):
+        """
+        The top_k companies by count of high risk assets with an end-of-life date, with their counts
+        per EOL horizon bucket (by default expired, expiring within 30 days and expiring later).
+        """
+        summary = MetricsCalculator.summarize_eol_horizons(merged_data, horizons, 'High Risk', reference_time)
+        return MetricsCalculator._top_companies(summary, top_k)
 
-        # Return the top 10 companies by total asset count
-        return summary.head(10)
+    @staticmethod
+    def get_top_10_high_risk_servers_summary_from_cube(summary_cube, top_k: int = 10):
+        """
+        get_top_10_high_risk_servers_summary from the cell counts of a SummaryCube, with the cube's
+        EOL horizon buckets as of the time it was built.
+        """
+        summary = summary_cube.eol_horizon_crosstab('High Risk')
+        summary.insert(0, 'total_asset_count', summary.sum(axis=1))
+        return MetricsCalculator._top_companies(summary, top_k)
     
 
 class RiskCategorizer:
+    # Risk categories by code: scores up to the lower threshold, up to the upper one and above it,
+    # then assets without a score
+    RISK_CATEGORIES = ['Low Risk', 'Moderate Risk', 'High Risk', 'Unknown']
+
+    # Categorization modes: 'zscore' thresholds z-scores at 0 and 1; 'quantile' thresholds the
+    # composite score at RISK_QUANTILES of the fleet's scores
+    MODES = ['zscore', 'quantile']
+    ZSCORE_THRESHOLDS = (0.0, 1.0)
+    # The quantiles at which the z-score thresholds sit for normally distributed scores
+    RISK_QUANTILES = (0.5, 0.8413)
 
     @staticmethod
-    def categorize_asset_risk(df):
-        # Ensure the composite stability score is numeric
-        df['composite_stability_score'] = pd.to_numeric(df['composite_stability_score'], errors='coerce')
+    def zscores(scores: np.ndarray, moments: ScoreMoments = None) -> np.ndarray:
+        """
+        Z-scores of an array of scores against the mean and sample standard deviation of the
+        moments, by default those of the scores themselves (like pandas' skipna mean and std).
+        """
+        if moments is None:
+            moments = ScoreMoments.from_scores(scores)
+        zscores = np.subtract(scores, moments.mean)
+        zscores /= moments.std()
+        return zscores
 
-        # Calculate Z-scores for 'composite_stability_score'
-        df['zscore_composite_stability'] = (df['composite_stability_score'] - df['composite_stability_score'].mean()) / df['composite_stability_score'].std()
+    @staticmethod
+    def _categories(values: np.ndarray, thresholds) -> pd.Categorical:
+        """Risk categories as a compact categorical: Low up to the lower threshold, Moderate up to the upper one, else High."""
+        lower, upper = thresholds
+        codes = (values > lower).astype(np.int8)
+        codes += values > upper
+        codes[np.isnan(values)] = RiskCategorizer.RISK_CATEGORIES.index('Unknown')
+        return pd.Categorical.from_codes(codes, categories=RiskCategorizer.RISK_CATEGORIES)
 
-        # Categorize the assets into risk groups based on Z-scores
-        conditions = [
-            (df['zscore_composite_stability'] > 1.0),  # High Risk
-            (df['zscore_composite_stability'] > 0) & (df['zscore_composite_stability'] <= 1.0),  # Moderate Risk
-            (df['zscore_composite_stability'] <= 0)     # Low Risk
-        ]
+    @staticmethod
+    def risk_categories(zscores: np.ndarray) -> pd.Categorical:
+        """Risk category of each z-score: High above 1, Moderate above 0, else Low."""
+        return RiskCategorizer._categories(zscores, RiskCategorizer.ZSCORE_THRESHOLDS)
 
-        # Define the corresponding risk labels
-        risk_labels = ['High Risk', 'Moderate Risk', 'Low Risk']
+    @staticmethod
+    def quantile_risk_categories(scores: np.ndarray, sketch: QuantileSketch = None, quantiles=RISK_QUANTILES) -> pd.Categorical:
+        """
+        Risk category of each score against the quantiles of a sketched score distribution, by
+        default that of the scores themselves: High above the upper quantile, Moderate above the lower.
+        """
+        if sketch is None:
+            sketch = QuantileSketch.from_scores(scores)
+        return RiskCategorizer._categories(scores, [sketch.quantile(q) for q in quantiles])
 
-        # Create a new column 'risk_category' based on the conditions
-        df['risk_category'] = np.select(conditions, risk_labels, default='Unknown')
+    @staticmethod
+    def categorize_scores(df: pd.DataFrame, composite_scores: np.ndarray, mode: str = 'zscore',
+                          moments: ScoreMoments = None, sketch: QuantileSketch = None) -> pd.DataFrame:
+        """
+        Add a dense array of composite stability scores to df with their z-scores and risk categories.
+        The z-scores are taken against moments and, in quantile mode, the categories against the
+        quantiles of sketch. Either defaults to the distribution of composite_scores; passing the
+        merged statistics of a whole fleet categorizes one partition of it as the fleet would be.
+        """
+        if mode not in RiskCategorizer.MODES:
+            raise ValueError(f"Unknown risk categorization mode '{mode}'. Expected one of {RiskCategorizer.MODES}.")
+
+        df['composite_stability_score'] = composite_scores
+        zscores = RiskCategorizer.zscores(composite_scores, moments)
+        df['zscore_composite_stability'] = zscores
+        if mode == 'quantile':
+            df['risk_category'] = RiskCategorizer.quantile_risk_categories(composite_scores, sketch)
+        else:
+            df['risk_category'] = RiskCategorizer.risk_categories(zscores)
 
         # Get the count of each risk category
         risk_counts = df['risk_category'].value_counts()
-        print(risk_counts)
-        return df
\ No newline at end of file
+        logger.info(f"Assets per risk category:\n{risk_counts[risk_counts > 0].to_string()}")
+        return df
+
+    @staticmethod
+    def categorize_asset_risk(df, mode: str = 'zscore', moments: ScoreMoments = None, sketch: QuantileSketch = None):
+        # Ensure the composite stability score is numeric
+        composite_scores = pd.to_numeric(df['composite_stability_score'], errors='coerce').to_numpy(dtype=float)
+
+        # Z-scores of the composite stability score, then the risk group of each asset
+        return RiskCategorizer.categorize_scores(df, composite_scores, mode, moments, sketch)
@@ -0,0 +1,215 @@
+import io
+import os
+import gzip
+import pandas as pd
+
+# Format of the AssetFiles_With_Scores artifacts: 'csv' (default) or 'parquet'
+ARTIFACT_FORMAT = os.getenv('ARTIFACT_FORMAT', 'csv').lower()
+
+# Compression codec used inside Parquet artifacts
+PARQUET_COMPRESSION = os.getenv('PARQUET_COMPRESSION', 'zstd')
+
+# Columns stored as datetimes; CSV artifacts parse them back on read
+DATE_COLUMNS = ['end_of_life_date', 'end_of_sale_date', 'end_of_support_date', 'end_of_extended_support_date']
+
+ARTIFACT_EXTENSIONS = {'csv': '.csv', 'parquet': '.parquet'}
+
+ARTIFACT_CONTENT_TYPES = {'csv': 'text/csv', 'parquet': 'application/vnd.apache.parquet'}
+
+# Content encoding of CSV artifacts: 'none' (default), 'gzip' or 'zstd'. Parquet compresses internally.
+ARTIFACT_COMPRESSION = os.getenv('ARTIFACT_COMPRESSION', 'none').lower()
+
+ARTIFACT_COMPRESSIONS = ['none', 'gzip', 'zstd']
+
+# Rows serialized at a time when streaming an artifact upload
+UPLOAD_CHUNK_ROWS = int(os.getenv('UPLOAD_CHUNK_ROWS', '50000'))
+
+
+def validate_artifact_format(artifact_format: str):
+    """Ensure the artifact format is supported and its optional dependency is installed."""
+    if artifact_format not in ARTIFACT_EXTENSIONS:
+        raise ValueError(f"Unsupported artifact format '{artifact_format}'. Use one of {list(ARTIFACT_EXTENSIONS)}.")
+    if artifact_format == 'parquet':
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError as e:
+            raise ImportError("ARTIFACT_FORMAT=parquet requires the 'pyarrow' package") from e
+
+
+def validate_artifact_compression(compression: str):
+    """Ensure the artifact compression is supported and its optional dependency is installed."""
+    if compression not in ARTIFACT_COMPRESSIONS:
+        raise ValueError(f"Unsupported artifact compression '{compression}'. Use one of {ARTIFACT_COMPRESSIONS}.")
+    if compression == 'zstd':
+        try:
+            import zstandard  # noqa: F401
+        except ImportError as e:
+            raise ImportError("ARTIFACT_COMPRESSION=zstd requires the 'zstandard' package") from e
+
+
+def artifact_blob_name(blob_path: str, artifact_format: str = ARTIFACT_FORMAT) -> str:
+    """Swap the extension of an artifact path for the one matching the artifact format."""
+    base_path, _ = os.path.splitext(blob_path)
+    return f"{base_path}{ARTIFACT_EXTENSIONS[artifact_format]}"
+
+
+def decompress_content(data: bytes, content_encoding: str = None) -> bytes:
+    """Undo the content encoding an artifact was uploaded with."""
+    if not content_encoding:
+        return data
+    if content_encoding == 'gzip':
+        return gzip.decompress(data)
+    if content_encoding == 'zstd':
+        import zstandard
+        # Streamed frames do not record their size up front, so decompress incrementally
+        return zstandard.ZstdDecompressor().decompressobj().decompress(data)
+    raise ValueError(f"Unsupported content encoding '{content_encoding}'")
+
+
+def _row_chunks(df: pd.DataFrame):
+    """Yield consecutive row slices of at most UPLOAD_CHUNK_ROWS rows; an empty frame yields itself once."""
+    for start in range(0, max(len(df), 1), UPLOAD_CHUNK_ROWS):
+        yield df.iloc[start:start + UPLOAD_CHUNK_ROWS]
+
+
+def _write_csv(df: pd.DataFrame, stream, compression: str):
+    """Write a DataFrame as CSV one row chunk at a time, compressing on the fly."""
+    if compression == 'gzip':
+        output = gzip.GzipFile(fileobj=stream, mode='wb')
+    elif compression == 'zstd':
+        import zstandard
+        output = zstandard.ZstdCompressor().stream_writer(stream, closefd=False)
+    else:
+        output = stream
+
+    for chunk_number, chunk in enumerate(_row_chunks(df)):
+        output.write(chunk.to_csv(index=False, header=chunk_number == 0).encode('utf-8'))
+
+    # Flush the compressor's trailer; the underlying stream stays open
+    if output is not stream:
+        output.close()
+
+
+def _dense_columns(df: pd.DataFrame) -> pd.DataFrame:
+    """A shallow copy of a DataFrame with its sparse columns expanded, which Arrow cannot take."""
+    sparse_columns = [column for column, dtype in df.dtypes.items() if isinstance(dtype, pd.SparseDtype)]
+    if not sparse_columns:
+        return df
+
+    dense_df = df.copy(deep=False)
+    for column in sparse_columns:
+        dense_df[column] = df[column].sparse.to_dense()
+    return dense_df
+
+
+def _write_parquet(df: pd.DataFrame, stream):
+    """Write a DataFrame as Parquet with one row group per row chunk."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    # Take the schema from the whole frame so a chunk of all-missing values cannot change a column's type
+    schema = pa.Schema.from_pandas(_dense_columns(df), preserve_index=False)
+    parquet_writer = pq.ParquetWriter(stream, schema, compression=PARQUET_COMPRESSION)
+    try:
+        for chunk in _row_chunks(df):
+            parquet_writer.write_table(pa.Table.from_pandas(_dense_columns(chunk), schema=schema, preserve_index=False))
+    finally:
+        parquet_writer.close()
+
+
+def upload_dataframe(df: pd.DataFrame, storage, blob_name: str, artifact_format: str = ARTIFACT_FORMAT,
+                     compression: str = ARTIFACT_COMPRESSION):
+    """
+    Stream a DataFrame to a blob in the artifact format. Rows are serialized in chunks and handed
+    to the storage writer as they are produced, so memory stays flat however large the frame is.
+    CSV artifacts are compressed with the given content encoding; Parquet uses PARQUET_COMPRESSION.
+    """
+    validate_artifact_format(artifact_format)
+    validate_artifact_compression(compression)
+
+    content_encoding = None
+    writer = storage.open_writer(blob_name)
+    if artifact_format == 'parquet':
+        _write_parquet(df, writer)
+    else:
+        _write_csv(df, writer, compression)
+        if compression != 'none':
+            content_encoding = compression
+
+    writer.commit(ARTIFACT_CONTENT_TYPES[artifact_format], content_encoding)
+
+
+class BlobRangeFile(io.RawIOBase):
+    """Seekable, read-only file over a blob that fetches only the byte ranges actually read."""
+
+    def __init__(self, storage, blob_name: str):
+        self.storage = storage
+        self.blob_name = blob_name
+        self.size = storage.get_properties(blob_name).size
+        self.position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self.position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_SET:
+            self.position = offset
+        elif whence == io.SEEK_CUR:
+            self.position += offset
+        elif whence == io.SEEK_END:
+            self.position = self.size + offset
+        else:
+            raise ValueError(f"Invalid whence value: {whence}")
+        return self.position
+
+    def readinto(self, buffer) -> int:
+        length = min(len(buffer), self.size - self.position)
+        if length <= 0:
+            return 0
+
+        data = self.storage.read_bytes(self.blob_name, self.position, length)
+        buffer[:len(data)] = data
+        self.position += len(data)
+        return len(data)
+
+
+def read_csv_blob(storage, blob_name: str) -> pd.DataFrame:
+    """Read a CSV blob into a DataFrame, undoing its content encoding."""
+    content_encoding = storage.get_properties(blob_name).content_encoding
+    csv_data = decompress_content(storage.read_bytes(blob_name), content_encoding)
+    return pd.read_csv(io.BytesIO(csv_data))
+
+
+class ScoreArtifactReader:
+    """Reads a score artifact from storage, returning only the columns each caller asks for."""
+
+    def __init__(self, storage, blob_name: str, artifact_format: str = ARTIFACT_FORMAT):
+        validate_artifact_format(artifact_format)
+        self.storage = storage
+        self.blob_name = blob_name
+        self.artifact_format = artifact_format
+        self._csv_df = None
+
+    def read(self, columns: list = None) -> pd.DataFrame:
+        """Load the requested columns (all columns when None) with their stored dtypes."""
+        if self.artifact_format == 'parquet':
+            # Parquet stores columns separately, so only the requested column chunks are downloaded
+            return pd.read_parquet(BlobRangeFile(self.storage, self.blob_name), columns=columns, engine='pyarrow')
+
+        # CSV has to be transferred and parsed in full, so parse it once and project from memory
+        if self._csv_df is None:
+            self._csv_df = read_csv_blob(self.storage, self.blob_name)
+            for column in DATE_COLUMNS:
+                if column in self._csv_df.columns:
+                    self._csv_df[column] = pd.to_datetime(self._csv_df[column], errors='coerce')
+
+        # Hand out copies so a section that modifies its frame cannot affect the next one
+        if columns is None:
+            return self._csv_df.copy()
+        return self._csv_df[columns].copy()
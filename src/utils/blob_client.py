@@ -0,0 +1,52 @@
+import os
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from azure.core.pipeline.transport import RequestsTransport
+from azure.storage.blob import BlobServiceClient
+
+# Size of each ranged GET/PUT the SDK issues for large blobs
+TRANSFER_CHUNK_SIZE = int(os.getenv('DOWNLOAD_CHUNK_SIZE', str(4 * 1024 * 1024)))
+
+# Upper bound on keep-alive connections held open to the storage account
+BLOB_CONNECTION_POOL_SIZE = int(os.getenv('BLOB_CONNECTION_POOL_SIZE', '32'))
+
+_blob_service_clients = {}
+_blob_service_clients_lock = threading.Lock()
+
+
+def _create_pooled_transport():
+    """Build a requests transport whose connection pool is large enough for concurrent transfers."""
+    session = requests.Session()
+
+    # Retries are handled by the Azure SDK pipeline, so the adapter itself must not retry
+    adapter = HTTPAdapter(
+        pool_connections=BLOB_CONNECTION_POOL_SIZE,
+        pool_maxsize=BLOB_CONNECTION_POOL_SIZE,
+        max_retries=Retry(total=False, redirect=False, raise_on_status=False)
+    )
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+
+    return RequestsTransport(session=session, session_owner=False)
+
+
+def get_blob_service_client(connection_string: str) -> BlobServiceClient:
+    """Return the process-wide BlobServiceClient for a connection string, creating it on first use."""
+    if not connection_string:
+        raise ValueError("Azure Storage connection string is missing")
+
+    with _blob_service_clients_lock:
+        blob_service_client = _blob_service_clients.get(connection_string)
+        if blob_service_client is None:
+            blob_service_client = BlobServiceClient.from_connection_string(
+                connection_string,
+                transport=_create_pooled_transport(),
+                max_single_get_size=TRANSFER_CHUNK_SIZE,
+                max_chunk_get_size=TRANSFER_CHUNK_SIZE,
+                max_block_size=TRANSFER_CHUNK_SIZE
+            )
+            _blob_service_clients[connection_string] = blob_service_client
+
+    return blob_service_client
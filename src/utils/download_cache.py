@@ -0,0 +1,135 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import threading
+
+
+class DownloadCache:
+    """Local LRU cache of downloaded blobs, keyed on the blob name and its ETag/last-modified."""
+
+    INDEX_FILE_NAME = 'index.json'
+
+    def __init__(self, cache_dir: str, max_size_bytes: int):
+        self.cache_dir = cache_dir
+        self.max_size_bytes = max_size_bytes
+        self.index_path = os.path.join(cache_dir, self.INDEX_FILE_NAME)
+        self._lock = threading.Lock()
+
+        # A disabled cache never touches the cache directory
+        if not self.enabled:
+            self.entries = {}
+            return
+
+        os.makedirs(cache_dir, exist_ok=True)
+        self.entries = self._load_index()
+        # A cache left by a run with a larger cap is trimmed to this run's cap straight away
+        cached_entries = len(self.entries)
+        self._evict()
+        if len(self.entries) < cached_entries:
+            self._save_index()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size_bytes > 0
+
+    def _load_index(self) -> dict:
+        """Read the cache index, dropping entries whose files have disappeared."""
+        if not os.path.exists(self.index_path):
+            return {}
+        try:
+            with open(self.index_path, 'r') as index_file:
+                entries = json.load(index_file)
+        except (OSError, ValueError):
+            return {}
+        return {
+            blob_name: entry for blob_name, entry in entries.items()
+            if os.path.exists(os.path.join(self.cache_dir, entry['file_name']))
+        }
+
+    def _save_index(self):
+        """Persist the index atomically so a crash never leaves it half written."""
+        partial_index_path = f"{self.index_path}.part"
+        with open(partial_index_path, 'w') as index_file:
+            json.dump(self.entries, index_file)
+        os.replace(partial_index_path, self.index_path)
+
+    @staticmethod
+    def _cache_file_name(blob_name: str, etag: str) -> str:
+        return hashlib.sha256(f"{blob_name}|{etag}".encode('utf-8')).hexdigest()
+
+    def _remove_entry(self, blob_name: str):
+        entry = self.entries.pop(blob_name, None)
+        if entry is not None:
+            try:
+                os.remove(os.path.join(self.cache_dir, entry['file_name']))
+            except FileNotFoundError:
+                pass
+
+    def _evict(self):
+        """Drop least recently used entries until the cache fits within its size cap."""
+        total_size = sum(entry['size'] for entry in self.entries.values())
+        for blob_name, entry in sorted(self.entries.items(), key=lambda item: item[1]['last_access']):
+            if total_size <= self.max_size_bytes:
+                break
+            total_size -= entry['size']
+            self._remove_entry(blob_name)
+
+    def restore(self, blob_name: str, etag: str, last_modified: str, target_path: str) -> bool:
+        """Place the cached copy of an unchanged blob at the target path; return False on a miss."""
+        if not self.enabled:
+            return False
+
+        with self._lock:
+            entry = self.entries.get(blob_name)
+            if entry is None or entry['etag'] != etag or entry['last_modified'] != last_modified:
+                return False
+
+            cached_path = os.path.join(self.cache_dir, entry['file_name'])
+            if not os.path.exists(cached_path):
+                self.entries.pop(blob_name)
+                self._save_index()
+                return False
+
+            self._materialize(cached_path, target_path)
+            entry['last_access'] = time.time()
+            self._save_index()
+            return True
+
+    def store(self, blob_name: str, etag: str, last_modified: str, file_path: str, target_path: str):
+        """Move a freshly downloaded file into the cache and place it at the target path."""
+        size = os.path.getsize(file_path)
+        if not self.enabled or size > self.max_size_bytes:
+            os.replace(file_path, target_path)
+            return
+
+        file_name = self._cache_file_name(blob_name, etag)
+        cached_path = os.path.join(self.cache_dir, file_name)
+
+        with self._lock:
+            # Only the latest version of each blob is kept
+            self._remove_entry(blob_name)
+            os.replace(file_path, cached_path)
+            self._materialize(cached_path, target_path)
+            self.entries[blob_name] = {
+                'file_name': file_name,
+                'etag': etag,
+                'last_modified': last_modified,
+                'size': size,
+                'last_access': time.time()
+            }
+            self._evict()
+            self._save_index()
+
+    @staticmethod
+    def _materialize(cached_path: str, target_path: str):
+        """Place a cached file at the target path, hard-linking when the filesystem allows it."""
+        partial_target_path = f"{target_path}.cache"
+        if os.path.exists(partial_target_path):
+            os.remove(partial_target_path)
+        try:
+            os.link(cached_path, partial_target_path)
+        except OSError:
+            shutil.copyfile(cached_path, partial_target_path)
+        os.replace(partial_target_path, target_path)
@@ -2,12 +2,14 @@ import markdown2
 import base64
 from io import BytesIO
 import matplotlib.pyplot as plt  
-from datetime import datetime, timedelta
+from datetime import datetime
 import pandas as pd
 import pdfkit
 import io
 from PyPDF2 import PdfReader, PdfWriter
 
+from src.data_analysis.eol_horizons import eol_horizon_buckets
+
 class HTMLProcessor:
     @staticmethod
     def convert_markdown_to_html(markdown_text: str) -> str:
@@ -85,6 +87,13 @@ class HTMLProcessor:
         """
     
 class CSVProcessor:
+    # EOL horizon buckets of the high-risk servers CSV: expired, expiring within a month, expiring later
+    HIGH_RISK_EOL_HORIZONS = [
+        ('expired', 0, False),
+        ('expiring_within_a_month', 30, True),
+        ('expiring_later', None, False),
+    ]
+
     @staticmethod
     def save_to_csv(data, file_name):
         """Saves pandas DataFrame to a CSV file."""
@@ -108,42 +117,30 @@ class CSVProcessor:
         and saves them into a single CSV file, with the category label included.
 
         :param merged_data: DataFrame containing the server information
-        :param current_date: Current date used for filtering
-        :param one_month_from_now: Date one month from the current date for filtering
         """
 
-        current_date = datetime.now()
-        one_month_from_now = current_date + timedelta(days=30)
-
-        # Filter data into three categories
-        expired_servers = merged_data[(merged_data['risk_category'] == 'High Risk') & (merged_data['end_of_life_date'] < current_date)]
-        expiring_soon_servers = merged_data[(merged_data['risk_category'] == 'High Risk') & (merged_data['end_of_life_date'] >= current_date) & (merged_data['end_of_life_date'] <= one_month_from_now)]
-        expiring_later_servers = merged_data[(merged_data['risk_category'] == 'High Risk') & (merged_data['end_of_life_date'] > one_month_from_now)]
-
-        # Function to add category labels and group data by company and end_of_life_date
-        def group_data(data, category_label):
-            if not data.empty:
-                grouped_data = data.groupby(['company', 'end_of_life_date'])['hardware_asset_id'].apply(list).reset_index()
-                grouped_data.columns = ['company', 'end_of_life_date', 'asset_ids']
-                grouped_data['category'] = category_label  # Add the category column
-                return grouped_data
-            else:
-                return pd.DataFrame(columns=['company', 'end_of_life_date', 'asset_ids', 'category'])
-
-        # Group and label each category
-        expired_grouped = group_data(expired_servers, 'expired')
-        expiring_soon_grouped = group_data(expiring_soon_servers, 'expiring_within_a_month')
-        expiring_later_grouped = group_data(expiring_later_servers, 'expiring_later')
+        # Bucket the high-risk servers by end-of-life date in one pass, without touching merged_data
+        high_risk_servers = merged_data[merged_data['risk_category'] == 'High Risk']
+        high_risk_servers = pd.DataFrame({
+            'category': eol_horizon_buckets(high_risk_servers['end_of_life_date'], CSVProcessor.HIGH_RISK_EOL_HORIZONS),
+            'company': high_risk_servers['company'].to_numpy(),
+            'end_of_life_date': pd.to_datetime(high_risk_servers['end_of_life_date'], errors='coerce').to_numpy(),
+            'hardware_asset_id': high_risk_servers['hardware_asset_id'].to_numpy(),
+        })
 
-        # Concatenate all categories into a single DataFrame
-        all_high_risk_servers = pd.concat([expired_grouped, expiring_soon_grouped, expiring_later_grouped])
+        # Group by category, company and end_of_life_date, categories in horizon order
+        all_high_risk_servers = (
+            high_risk_servers.groupby(['category', 'company', 'end_of_life_date'], observed=True, sort=True)['hardware_asset_id']
+            .apply(list)
+            .reset_index(name='asset_ids')
+        )[['company', 'end_of_life_date', 'asset_ids', 'category']]
 
         # If the final DataFrame is not empty, save it to CSV
         if not all_high_risk_servers.empty:
             # Generate a timestamp for the filename
             dt = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
 
-            # Save the concatenated DataFrame to a single CSV file
+            # Save the grouped DataFrame to a single CSV file
             csv_filename = f'Reports/csv_report/Highrisk_expiring_and_expired_assets_report_{dt}.csv'
             all_high_risk_servers.to_csv(csv_filename, index=False)
 
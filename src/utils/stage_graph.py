@@ -0,0 +1,115 @@
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+
+class StageGraph:
+    """
+    Run a graph of stages, each on its own thread pool, as soon as the stages it takes its
+    inputs from have finished, and record when each stage ran. A stage's output is its return
+    value, passed positionally to every stage that lists it as an input.
+    """
+
+    def __init__(self, pool_sizes: dict):
+        self.pool_sizes = dict(pool_sizes)
+        self.stages = {}
+        self.timeline = []
+        self._timeline_lock = threading.Lock()
+
+    def add_stage(self, name: str, fn, inputs: list = (), pool: str = 'compute'):
+        if name in self.stages:
+            raise ValueError(f"Stage '{name}' is already defined.")
+        if pool not in self.pool_sizes:
+            raise ValueError(f"Unknown pool '{pool}'. Expected one of {list(self.pool_sizes)}.")
+        self.stages[name] = (fn, list(inputs), pool)
+
+    def _validate(self):
+        """Reject inputs that name no stage and dependency cycles before anything runs."""
+        for name, (_, inputs, _) in self.stages.items():
+            unknown_inputs = [input_name for input_name in inputs if input_name not in self.stages]
+            if unknown_inputs:
+                raise ValueError(f"Stage '{name}' depends on undefined stages {unknown_inputs}.")
+
+        resolved = set()
+        remaining = dict(self.stages)
+        while remaining:
+            ready = [name for name, (_, inputs, _) in remaining.items() if resolved.issuperset(inputs)]
+            if not ready:
+                raise ValueError(f"Stages {sorted(remaining)} form a dependency cycle.")
+            resolved.update(ready)
+            for name in ready:
+                del remaining[name]
+
+    def _run_stage(self, name: str, fn, args: list, pool: str, run_started: float):
+        started = time.perf_counter()
+        status = 'failed'
+        try:
+            result = fn(*args)
+            status = 'completed'
+            return result
+        finally:
+            finished = time.perf_counter()
+            with self._timeline_lock:
+                self.timeline.append({
+                    'stage': name,
+                    'pool': pool,
+                    'thread': threading.current_thread().name,
+                    'start_seconds': started - run_started,
+                    'end_seconds': finished - run_started,
+                    'seconds': finished - started,
+                    'status': status,
+                })
+
+    def run(self) -> dict:
+        """Run every stage and return the outputs by stage name; the first stage failure is raised."""
+        self._validate()
+        self.timeline = []
+        results = {}
+        running = {}
+        run_started = time.perf_counter()
+        executors = {
+            pool: ThreadPoolExecutor(max_workers=max(size, 1), thread_name_prefix=pool)
+            for pool, size in self.pool_sizes.items()
+        }
+
+        def submit_ready_stages():
+            submitted = set(running.values())
+            for name, (fn, inputs, pool) in self.stages.items():
+                if name not in results and name not in submitted and all(input_name in results for input_name in inputs):
+                    args = [results[input_name] for input_name in inputs]
+                    running[executors[pool].submit(self._run_stage, name, fn, args, pool, run_started)] = name
+
+        try:
+            submit_ready_stages()
+            while running:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    results[running.pop(future)] = future.result()
+                submit_ready_stages()
+        except BaseException:
+            # Stages not started yet are dropped; running ones finish before the error propagates
+            for future in running:
+                future.cancel()
+            raise
+        finally:
+            for executor in executors.values():
+                executor.shutdown(wait=True)
+
+        return results
+
+    def critical_path(self) -> list:
+        """
+        Stages on the critical path of the last run: from the stage that finished last, back
+        through the input of each stage that finished last.
+        """
+        entries = {entry['stage']: entry for entry in self.timeline}
+        if not entries:
+            return []
+
+        path = [max(entries.values(), key=lambda entry: entry['end_seconds'])['stage']]
+        while True:
+            inputs = [input_name for input_name in self.stages[path[-1]][1] if input_name in entries]
+            if not inputs:
+                break
+            path.append(max(inputs, key=lambda input_name: entries[input_name]['end_seconds']))
+        return path[::-1]
@@ -0,0 +1,234 @@
+import os
+import mmap
+import base64
+import shutil
+from collections import namedtuple
+from azure.core import MatchConditions
+from azure.storage.blob import BlobBlock, ContentSettings
+from src.utils.blob_client import get_blob_service_client
+
+STORAGE_BACKENDS = ['azure', 'local']
+
+# Bytes per staged block when streaming an upload to Azure
+UPLOAD_BLOCK_SIZE = int(os.getenv('UPLOAD_BLOCK_SIZE', str(8 * 1024 * 1024)))
+
+# Metadata every backend reports for a blob; the ETag changes whenever the content does
+BlobProperties = namedtuple('BlobProperties', ['etag', 'last_modified', 'size', 'content_encoding'])
+
+
+class StorageBackend:
+    """Blob store the pipeline downloads its inputs from and writes its score artifacts to."""
+
+    def list_blobs(self, prefix: str) -> list:
+        """Return the sorted names of all blobs starting with the prefix."""
+        raise NotImplementedError
+
+    def get_properties(self, blob_name: str) -> BlobProperties:
+        raise NotImplementedError
+
+    def download_to_file(self, blob_name: str, file_path: str, etag: str = None, max_concurrency: int = 1):
+        """Copy a blob to a local file, failing if its ETag no longer matches the one given."""
+        raise NotImplementedError
+
+    def read_bytes(self, blob_name: str, offset: int = 0, length: int = None):
+        """Return a bytes-like object holding the blob's raw (still encoded) content or a range of it."""
+        raise NotImplementedError
+
+    def open_writer(self, blob_name: str):
+        """Return a writable file whose content replaces the blob only when commit() is called."""
+        raise NotImplementedError
+
+
+class BlockBlobWriter:
+    """Write-only file that uploads to a block blob in fixed-size staged blocks, committed explicitly."""
+
+    def __init__(self, blob_client, block_size: int):
+        self.blob_client = blob_client
+        self.block_size = block_size
+        self.buffer = bytearray()
+        self.block_list = []
+        self.position = 0
+        self.closed = False
+
+    def writable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self.position
+
+    def flush(self):
+        pass
+
+    def write(self, data) -> int:
+        self.buffer += data
+        self.position += len(data)
+        while len(self.buffer) >= self.block_size:
+            self._stage_block(bytes(self.buffer[:self.block_size]))
+            del self.buffer[:self.block_size]
+        return len(data)
+
+    def _stage_block(self, data: bytes):
+        # Block ids must all have the same length within a blob
+        block_id = base64.b64encode(f"{len(self.block_list):08d}".encode('utf-8')).decode('utf-8')
+        self.blob_client.stage_block(block_id, data)
+        self.block_list.append(BlobBlock(block_id=block_id))
+
+    def commit(self, content_type: str = None, content_encoding: str = None):
+        """Stage the remaining bytes and commit all blocks; until then the existing blob is untouched."""
+        if self.buffer:
+            self._stage_block(bytes(self.buffer))
+            self.buffer.clear()
+        self.blob_client.commit_block_list(
+            self.block_list,
+            content_settings=ContentSettings(content_type=content_type, content_encoding=content_encoding)
+        )
+        self.closed = True
+
+
+class AzureBlobStorage(StorageBackend):
+    """Blobs of one Azure Storage container, reached through the shared connection-pooled client."""
+
+    def __init__(self, connection_string: str, container_name: str, block_size: int = UPLOAD_BLOCK_SIZE):
+        self.container_client = get_blob_service_client(connection_string).get_container_client(container_name)
+        self.block_size = block_size
+
+    def list_blobs(self, prefix: str) -> list:
+        return sorted(blob.name for blob in self.container_client.list_blobs(name_starts_with=prefix))
+
+    def get_properties(self, blob_name: str) -> BlobProperties:
+        properties = self.container_client.get_blob_client(blob_name).get_blob_properties()
+        return BlobProperties(
+            etag=properties.etag,
+            last_modified=str(properties.last_modified),
+            size=properties.size,
+            content_encoding=properties.content_settings.content_encoding
+        )
+
+    def download_to_file(self, blob_name: str, file_path: str, etag: str = None, max_concurrency: int = 1):
+        condition = {'etag': etag, 'match_condition': MatchConditions.IfNotModified} if etag else {}
+        downloader = self.container_client.get_blob_client(blob_name).download_blob(
+            max_concurrency=max_concurrency, **condition
+        )
+        with open(file_path, 'wb') as download_file:
+            downloader.readinto(download_file)
+
+    def read_bytes(self, blob_name: str, offset: int = 0, length: int = None):
+        # Ask for the body as stored so the caller decodes it, whatever the transport would do
+        downloader = self.container_client.get_blob_client(blob_name).download_blob(
+            offset=offset or None, length=length, decompress=False
+        )
+        return downloader.readall()
+
+    def open_writer(self, blob_name: str) -> BlockBlobWriter:
+        return BlockBlobWriter(self.container_client.get_blob_client(blob_name), self.block_size)
+
+
+class LocalFileWriter:
+    """Write-only file into a local directory store, moved into place atomically on commit."""
+
+    def __init__(self, file_path: str, encoding_path: str):
+        self.file_path = file_path
+        self.encoding_path = encoding_path
+        self.partial_file_path = f"{file_path}.part"
+        os.makedirs(os.path.dirname(file_path) or '.', exist_ok=True)
+        self.file = open(self.partial_file_path, 'wb')
+
+    @property
+    def closed(self) -> bool:
+        return self.file.closed
+
+    def writable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self.file.tell()
+
+    def flush(self):
+        self.file.flush()
+
+    def write(self, data) -> int:
+        return self.file.write(data)
+
+    def commit(self, content_type: str = None, content_encoding: str = None):
+        self.file.close()
+        os.replace(self.partial_file_path, self.file_path)
+        # The content encoding is kept next to the file, as blob storage keeps it in the blob's properties
+        if content_encoding:
+            with open(self.encoding_path, 'w') as encoding_file:
+                encoding_file.write(content_encoding)
+        elif os.path.exists(self.encoding_path):
+            os.remove(self.encoding_path)
+
+
+class LocalDirectoryStorage(StorageBackend):
+    """
+    Blob store backed by a local directory, for offline runs, on-prem deployments and benchmarks.
+    Blob names are paths relative to the root; reads are memory-mapped rather than copied.
+    """
+
+    ENCODING_SUFFIX = '.content-encoding'
+
+    def __init__(self, root_dir: str):
+        if not os.path.isdir(root_dir):
+            raise FileNotFoundError(f"Local storage directory {root_dir} does not exist")
+        self.root_dir = os.path.abspath(root_dir)
+
+    def _path(self, blob_name: str) -> str:
+        file_path = os.path.abspath(os.path.join(self.root_dir, blob_name))
+        if os.path.commonpath([self.root_dir, file_path]) != self.root_dir:
+            raise ValueError(f"Blob name {blob_name} points outside {self.root_dir}")
+        return file_path
+
+    def list_blobs(self, prefix: str) -> list:
+        blob_names = []
+        for dir_path, _, file_names in os.walk(self.root_dir):
+            for file_name in file_names:
+                if file_name.endswith((self.ENCODING_SUFFIX, '.part')):
+                    continue
+                blob_name = os.path.relpath(os.path.join(dir_path, file_name), self.root_dir).replace(os.sep, '/')
+                if blob_name.startswith(prefix):
+                    blob_names.append(blob_name)
+        return sorted(blob_names)
+
+    def get_properties(self, blob_name: str) -> BlobProperties:
+        file_path = self._path(blob_name)
+        stat = os.stat(file_path)
+        content_encoding = None
+        if os.path.exists(file_path + self.ENCODING_SUFFIX):
+            with open(file_path + self.ENCODING_SUFFIX) as encoding_file:
+                content_encoding = encoding_file.read().strip() or None
+        return BlobProperties(
+            etag=f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"',
+            last_modified=str(stat.st_mtime_ns),
+            size=stat.st_size,
+            content_encoding=content_encoding
+        )
+
+    def download_to_file(self, blob_name: str, file_path: str, etag: str = None, max_concurrency: int = 1):
+        if etag is not None and self.get_properties(blob_name).etag != etag:
+            raise RuntimeError(f"{blob_name} changed while it was being downloaded")
+        # copyfile uses the kernel's zero-copy path (sendfile) where available
+        shutil.copyfile(self._path(blob_name), file_path)
+
+    def read_bytes(self, blob_name: str, offset: int = 0, length: int = None):
+        with open(self._path(blob_name), 'rb') as blob_file:
+            if os.fstat(blob_file.fileno()).st_size == 0:
+                return b''
+            mapped = mmap.mmap(blob_file.fileno(), 0, access=mmap.ACCESS_READ)
+        # The view keeps the mapping alive and exposes the range without copying it
+        end = len(mapped) if length is None else offset + length
+        return memoryview(mapped)[offset:end]
+
+    def open_writer(self, blob_name: str) -> LocalFileWriter:
+        file_path = self._path(blob_name)
+        return LocalFileWriter(file_path, file_path + self.ENCODING_SUFFIX)
+
+
+def create_storage_backend(backend: str, connection_string: str = None, container_name: str = None,
+                           local_dir: str = None) -> StorageBackend:
+    """Create the configured storage backend: 'azure' (a blob container) or 'local' (a directory)."""
+    if backend == 'azure':
+        return AzureBlobStorage(connection_string, container_name)
+    if backend == 'local':
+        return LocalDirectoryStorage(local_dir)
+    raise ValueError(f"Unsupported storage backend '{backend}'. Use one of {STORAGE_BACKENDS}.")
@@ -0,0 +1,22 @@
+import numpy as np
+import pandas as pd
+
+from src.data_processor.aggregate_state import AssetAggregateState
+
+
+def test_round_trip_keeps_ids_that_look_missing():
+    aggregates = pd.DataFrame(
+        {'cpu_usage_sum': [1.5, np.nan, 0.1 + 0.2], 'cpu_usage_count': [1, 0, 2]},
+        index=pd.Index(['NA', 'null', ''], name='hardware_asset_id'),
+    )
+    pending_patch_releases = pd.DataFrame({
+        'asset_id': ['NA', '', 'null'],
+        'patch_released': pd.to_datetime(['2026-01-01', None, '2026-02-01']),
+    })
+    state = AssetAggregateState({'usage': aggregates}, {'usage': 'hw_servers_usage_2026-01.csv'}, pending_patch_releases)
+
+    restored = AssetAggregateState.from_bytes(state.to_bytes())
+
+    pd.testing.assert_frame_equal(restored.aggregates['usage'], aggregates)
+    pd.testing.assert_frame_equal(restored.pending_patch_releases, pending_patch_releases)
+    assert restored.watermarks == state.watermarks
@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+
+from src.data_analysis.score_statistics import QuantileSketch, ScoreMoments
+
+
+@pytest.fixture
+def scores():
+    rng = np.random.default_rng(0)
+    scores = rng.gamma(2.0, 1.5, 1000)
+    scores[rng.choice(len(scores), 50, replace=False)] = np.nan
+    return scores
+
+
+def test_moments_merged_per_shard_equal_whole_fleet_moments(scores):
+    whole = ScoreMoments.from_scores(scores)
+    merged = ScoreMoments.combine([ScoreMoments.from_scores(shard) for shard in np.array_split(scores, 7)])
+
+    assert merged.count == whole.count == np.count_nonzero(~np.isnan(scores))
+    assert merged.mean == pytest.approx(whole.mean, rel=1e-12)
+    assert merged.m2 == pytest.approx(whole.m2, rel=1e-12)
+    assert merged.mean == pytest.approx(np.nanmean(scores), rel=1e-12)
+    assert merged.std() == pytest.approx(np.nanstd(scores, ddof=1), rel=1e-12)
+
+
+def test_moments_merge_with_empty_shard(scores):
+    whole = ScoreMoments.from_scores(scores)
+    merged = ScoreMoments().merge(whole).merge(ScoreMoments.from_scores([]))
+
+    assert (merged.count, merged.mean, merged.m2) == (whole.count, whole.mean, whole.m2)
+
+
+def test_sketch_merged_per_shard_equals_whole_fleet_sketch(scores):
+    whole = QuantileSketch.from_scores(scores)
+    merged = QuantileSketch.combine([QuantileSketch.from_scores(shard) for shard in np.array_split(scores, 7)])
+
+    for q in (0.1, 0.5, 0.9):
+        assert merged.quantile(q) == whole.quantile(q)
+        assert merged.quantile(q) == pytest.approx(np.nanquantile(scores, q), rel=0.02)
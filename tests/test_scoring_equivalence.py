@@ -0,0 +1,112 @@
+import os
+
+import pandas as pd
+import pytest
+
+import HWDataPreprocessing as pipeline
+from src.data_processor.synthetic_data import SyntheticFleetGenerator
+
+SUMMARY_BLOB = 'AssetFiles_With_Scores/summarized_asset_scores_with_risk_category.csv'
+
+# The datasets folded into the aggregate state, their blob pattern setting and partition name prefix
+PARTITIONED_DATASETS = {
+    'usage': ('USAGE_BLOB_PATTERN', 'hw_servers_usage'),
+    'incidents': ('INCIDENTS_BLOB_PATTERN', 'hw_incidents'),
+    'patch_upgrades': ('PATCH_UPGRADES_BLOB_PATTERN', 'patchupgrades'),
+    'vulnerabilities': ('VULNERABILITIES_BLOB_PATTERN', 'hw_vulnerabilities'),
+}
+
+
+@pytest.fixture(scope='module')
+def fleet():
+    return SyntheticFleetGenerator(200, seed=7)
+
+
+@pytest.fixture(scope='module')
+def fleet_storage(fleet, tmp_path_factory):
+    storage_dir = tmp_path_factory.mktemp('storage')
+    fleet.write_csv(str(storage_dir))
+    return storage_dir
+
+
+def run_process_data(monkeypatch, storage_dir, work_dir, **settings):
+    """Run process_data against local storage with the given settings and return the summarized scores."""
+    monkeypatch.setattr(pipeline, 'STORAGE_BACKEND', 'local')
+    monkeypatch.setattr(pipeline, 'LOCAL_STORAGE_DIR', str(storage_dir))
+    monkeypatch.setattr(pipeline, 'DOWNLOAD_CACHE_MAX_BYTES', 0)
+    for setting, value in settings.items():
+        monkeypatch.setattr(pipeline, setting, value)
+
+    # Downloads land relative to the working directory
+    work_dir.mkdir()
+    monkeypatch.chdir(work_dir)
+    pipeline.process_data()
+
+    summary = pd.read_csv(os.path.join(storage_dir, SUMMARY_BLOB))
+    return summary.sort_values('hardware_asset_id', kind='stable').reset_index(drop=True)
+
+
+@pytest.fixture
+def run_pipeline(monkeypatch, tmp_path):
+    def run(storage_dir, **settings):
+        work_dir = tmp_path / f'work_{len(list(tmp_path.glob("work_*")))}'
+        return run_process_data(monkeypatch, storage_dir, work_dir, **settings)
+    return run
+
+
+@pytest.fixture(scope='module')
+def default_scores(fleet_storage, tmp_path_factory):
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        return run_process_data(monkeypatch, fleet_storage, tmp_path_factory.mktemp('default') / 'work')
+
+
+def assert_same_scores(result, expected):
+    assert list(result.columns) == list(expected.columns)
+    pd.testing.assert_frame_equal(result, expected, check_exact=False, rtol=1e-9, atol=1e-12)
+
+
+def write_partitions(fleet, storage_dir, partitions):
+    """
+    Write each partitioned dataset's records, split in two, as the given partitions: files named to
+    sort chronologically in a folder of their own, so the fleet's single-file exports never match.
+    """
+    dataset_dir = storage_dir / 'AssetFiles' / 'partitions'
+    dataset_dir.mkdir(exist_ok=True)
+    for dataset, (_, prefix) in PARTITIONED_DATASETS.items():
+        records = fleet.generate(dataset)
+        parts = [records.iloc[index::2] for index in range(2)]
+        encoding = 'utf-8-sig' if dataset == 'vulnerabilities' else 'utf-8'
+        for index in partitions:
+            parts[index].to_csv(dataset_dir / f'{prefix}_2026-0{index + 1}.csv', index=False, encoding=encoding)
+
+
+def partitioned_patterns(monkeypatch):
+    for setting, prefix in PARTITIONED_DATASETS.values():
+        monkeypatch.setenv(setting, f'partitions/{prefix}_*.csv')
+
+
+def test_chunked_usage_scores_match_default(run_pipeline, fleet_storage, default_scores):
+    assert_same_scores(run_pipeline(fleet_storage, USAGE_CHUNK_SIZE=500), default_scores)
+
+
+def test_sharded_scores_match_default(run_pipeline, fleet_storage, default_scores):
+    assert_same_scores(run_pipeline(fleet_storage, SCORING_WORKERS=2), default_scores)
+
+
+def test_sql_backend_scores_match_default(run_pipeline, fleet_storage, default_scores):
+    pytest.importorskip('duckdb')
+    assert_same_scores(run_pipeline(fleet_storage, SCORING_BACKEND='sql'), default_scores)
+
+
+def test_incremental_scores_match_default(run_pipeline, monkeypatch, fleet, tmp_path, default_scores):
+    partitioned_patterns(monkeypatch)
+    storage_dir = tmp_path / 'storage'
+    fleet.write_csv(str(storage_dir))
+
+    # The second partition arrives after the first run has saved its aggregate state
+    write_partitions(fleet, storage_dir, [0])
+    run_pipeline(storage_dir, AGGREGATE_STATE_BLOB='state/asset_aggregates.zip')
+    write_partitions(fleet, storage_dir, [1])
+    result = run_pipeline(storage_dir, AGGREGATE_STATE_BLOB='state/asset_aggregates.zip')
+
+    assert_same_scores(result, default_scores)